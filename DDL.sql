@@ -10,6 +10,7 @@
 /*       by Django migrations (see PostOffice_App/models.py).   */
 /*       Run 'python manage.py migrate' BEFORE this DDL.        */
 /*==============================================================*/
+DROP TABLE IF EXISTS DELIVERY_TRACKING_READ CASCADE;
 DROP TABLE IF EXISTS DELIVERY_TRACKING CASCADE;
 DROP TABLE IF EXISTS DELIVERY CASCADE;
 DROP TABLE IF EXISTS INVOICE_ITEM CASCADE;
@@ -21,6 +22,16 @@ DROP TABLE IF EXISTS EMPLOYEE_DRIVER CASCADE;
 DROP TABLE IF EXISTS EMPLOYEE_STAFF CASCADE;
 DROP TABLE IF EXISTS EMPLOYEE CASCADE;
 DROP TABLE IF EXISTS CLIENT CASCADE;
+DROP TABLE IF EXISTS STG_DELIVERY CASCADE;
+DROP TABLE IF EXISTS STG_ROUTE CASCADE;
+DROP TABLE IF EXISTS STG_VEHICLE CASCADE;
+DROP TABLE IF EXISTS STG_WAREHOUSE CASCADE;
+DROP TABLE IF EXISTS STG_INVOICE CASCADE;
+DROP TABLE IF EXISTS JOB CASCADE;
+
+
+-- Trigram indexes (DELIVERY_TRACKING_TRGM_IDX) need pg_trgm
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 
 -- "USER" table is created by Django migrations (manages auth columns:
@@ -143,6 +154,8 @@ create table INVOICE (
    CONTACT              TEXT                 null,
    CREATED_AT           TIMESTAMPTZ          not null,
    UPDATED_AT           TIMESTAMPTZ          not null,
+   ITEM_COUNT           INT4                 not null default 0,    -- maintained by trg_invoice_update_cost
+   SUBTOTAL             DECIMAL(10,2)        not null default 0.00, -- idem (SUM of total_item_cost, before tax)
    constraint PK_INVOICE primary key (ID),
    constraint CHK_INVOICE_STATUS CHECK (STATUS IN ('pending', 'completed', 'cancelled', 'refunded')),
    constraint CHK_INVOICE_TYPE CHECK (TYPE IN ('paid_on_send', 'paid_on_delivery')),
@@ -153,6 +166,10 @@ create index PROCESSES_FK on INVOICE (STAFF_ID);
 create index RECORDS_FK on INVOICE (WAR_ID);
 create index REQUESTS_FK on INVOICE (CLIENT_ID);
 
+-- Invoice list: ORDER BY CREATED_AT DESC, ID DESC (all / one client's)
+create index INVOICE_CREATED_IDX on INVOICE (CREATED_AT, ID);
+create index INVOICE_CLIENT_CREATED_IDX on INVOICE (CLIENT_ID, CREATED_AT, ID);
+
 /*==============================================================*/
 /* Table: INVOICE_ITEM                                          */
 /*==============================================================*/
@@ -200,6 +217,9 @@ create index IS_ASSIGNED_TO_FK on ROUTE (DRIVER_ID);
 create index DISPATCHES_FK on ROUTE (WAR_ID);
 create index USES_FK on ROUTE (VEHICLE_ID);
 
+-- Route list: ORDER BY DELIVERY_DATE DESC NULLS LAST, ID
+create index ROUTE_DELIVERY_DATE_IDX on ROUTE (DELIVERY_DATE DESC NULLS LAST, ID);
+
 /*==============================================================*/
 /* Table: DELIVERY                                              */
 /*==============================================================*/
@@ -227,8 +247,16 @@ create table DELIVERY (
    PRIORITY             VARCHAR(20)          null, -- 'normal' || 'urgent'
    IN_TRANSITION        BOOL                 null,
    DELIVERY_DATE        TIMESTAMPTZ          null,
-   CREATED_AT           TIMESTAMPTZ          null,
+   CREATED_AT           TIMESTAMPTZ          not null default now(), -- keyset pagination key: never NULL
    UPDATED_AT           TIMESTAMPTZ          null,
+   -- Delivery search (/deliveries/search/): tracking number (A), sender and
+   -- recipient names (B), recipient address (C). 'simple' config: no
+   -- stemming/stop words, names and Portuguese addresses match as typed.
+   SEARCH_VECTOR        TSVECTOR             generated always as (
+                           setweight(to_tsvector('simple', coalesce(TRACKING_NUMBER, '')), 'A') ||
+                           setweight(to_tsvector('simple', coalesce(SENDER_NAME, '') || ' ' || coalesce(RECIPIENT_NAME, '')), 'B') ||
+                           setweight(to_tsvector('simple', coalesce(RECIPIENT_ADDRESS, '')), 'C')
+                        ) stored,
    constraint PK_DELIVERY primary key (ID),
    constraint CHK_DELIVERY_WEIGHT CHECK (WEIGHT >= 1),
    constraint CHK_DELIVERY_STATUS CHECK (STATUS IN ('registered', 'ready', 'pending', 'in_transit', 'completed', 'cancelled')),
@@ -241,9 +269,36 @@ create index GENERATES_FK on DELIVERY (INV_ID);
 create index SENT_BY_FK on DELIVERY (CLIENT_ID);
 create index HANDLES_FK on DELIVERY (WAR_ID);
 
+-- Keyset pagination of the deliveries list: ORDER BY (CREATED_AT, ID) DESC.
+-- CREATED_AT is NOT NULL: a NULL would never match the (created_at, id) < (...)
+-- row comparison, so such rows would drop out of every page but the first.
+-- One composite index per list filter so "filter + next page" stays an index range scan.
+create index DELIVERY_CREATED_IDX on DELIVERY (CREATED_AT, ID);
+create index DELIVERY_STATUS_CREATED_IDX on DELIVERY (STATUS, CREATED_AT, ID);
+create index DELIVERY_PRIORITY_CREATED_IDX on DELIVERY (PRIORITY, CREATED_AT, ID);
+create index DELIVERY_WAR_CREATED_IDX on DELIVERY (WAR_ID, CREATED_AT, ID);
+create index DELIVERY_DRIVER_CREATED_IDX on DELIVERY (DRIVER_ID, CREATED_AT, ID);
+
+-- Tracking numbers are the public lookup key (/tracking/<tracking_number>/)
+-- and must be unique; NULLs are still allowed.
+create unique index DELIVERY_TRACKING_NUMBER_UK on DELIVERY (TRACKING_NUMBER);
+
+-- Delivery search: word/prefix matches via SEARCH_VECTOR, partial tracking
+-- numbers (ILIKE '%00042%') via trigrams. Both GIN, so no sequential scans.
+create index DELIVERY_SEARCH_IDX on DELIVERY using gin (SEARCH_VECTOR);
+create index DELIVERY_TRACKING_TRGM_IDX on DELIVERY using gin (TRACKING_NUMBER gin_trgm_ops);
+
 /*==============================================================*/
 /* Table: DELIVERY_TRACKING                                     */
 /*==============================================================*/
+-- Range-partitioned by month on CREATED_AT (append-only event log):
+-- timelines only touch the partitions since the delivery was created,
+-- vacuum/reindex work per month, and old months are detached and
+-- archived whole (sp_create_tracking_partitions / "manage.py
+-- maintain_tracking_partitions", see Logical_DB_Objects.sql).
+-- The partition key must be part of the primary key, so the PK does not
+-- keep ID unique across partitions on its own: the PK of
+-- DELIVERY_TRACKING_READ (trg_tracking_read_insert) rejects a repeated ID.
 create table DELIVERY_TRACKING (
    ID                   SERIAL               not null,
    STAFF_ID             INT4                 null,
@@ -251,16 +306,222 @@ create table DELIVERY_TRACKING (
    DEL_ID               INT4                 not null,
    STATUS               VARCHAR(20)          null, -- 'registered' || 'ready' || 'pending' || 'in_transit' || 'completed' || 'cancelled'
    NOTES                TEXT                 null,
-   CREATED_AT           TIMESTAMPTZ          null,
-   constraint PK_DELIVERY_TRACKING primary key (ID),
+   CREATED_AT           TIMESTAMPTZ          not null default now(),
+   constraint PK_DELIVERY_TRACKING primary key (ID, CREATED_AT),
    constraint CHK_TRACKING_STATUS CHECK (STATUS IN ('registered', 'ready', 'pending', 'in_transit', 'completed', 'cancelled'))
-);
+) partition by range (CREATED_AT);
+
+-- Catches rows for months without a partition yet; their rows are moved
+-- out when sp_create_tracking_partitions creates the month
+create table DELIVERY_TRACKING_DEFAULT partition of DELIVERY_TRACKING default;
 
-create index LOGS_FK on DELIVERY_TRACKING (DEL_ID);
+-- Timeline of one delivery (WHERE del_id = ? ORDER BY created_at)
+create index LOGS_FK on DELIVERY_TRACKING (DEL_ID, CREATED_AT);
 create index REGISTERS_LOGS_FK on DELIVERY_TRACKING (STAFF_ID);
 create index RECORDS_LOGS_FK on DELIVERY_TRACKING (WAR_ID);
 
 
+/*==============================================================*/
+/* Table: DELIVERY_TRACKING_READ                                */
+/*==============================================================*/
+-- Read model for the public tracking page: one row per DELIVERY_TRACKING
+-- event with the tracking number, staff username and warehouse name
+-- already joined in. Kept in sync by the trg_tracking_read_* triggers
+-- (Logical_DB_Objects.sql); no FKs, it only mirrors other tables.
+create table DELIVERY_TRACKING_READ (
+   TRACKING_ID          INT4                 not null,
+   DELIVERY_ID          INT4                 not null,
+   TRACKING_NUMBER      VARCHAR(50)          null,
+   STATUS               VARCHAR(20)          null,
+   NOTES                TEXT                 null,
+   EVENT_TIMESTAMP      TIMESTAMPTZ          null,
+   STAFF_ID             INT4                 null,
+   STAFF_USERNAME       VARCHAR(150)         null,
+   WAREHOUSE_ID         INT4                 null,
+   WAREHOUSE_NAME       VARCHAR(100)         null,
+   constraint PK_DELIVERY_TRACKING_READ primary key (TRACKING_ID)
+);
+
+-- Timeline lookup: WHERE tracking_number = ? ORDER BY event_timestamp, tracking_id
+create index IX_TRACKING_READ_LOOKUP on DELIVERY_TRACKING_READ (TRACKING_NUMBER, EVENT_TIMESTAMP, TRACKING_ID);
+
+-- Fan-out of renames / tracking number changes (trg_tracking_read_*)
+create index IX_TRACKING_READ_DELIVERY on DELIVERY_TRACKING_READ (DELIVERY_ID);
+create index IX_TRACKING_READ_STAFF on DELIVERY_TRACKING_READ (STAFF_ID);
+create index IX_TRACKING_READ_WAREHOUSE on DELIVERY_TRACKING_READ (WAREHOUSE_ID);
+
+
+/*==============================================================*/
+/* CSV bulk-load staging tables (STG_*)                         */
+/*==============================================================*/
+-- COPY FROM STDIN lands here (see PostOffice_App/bulk_load.py), then the
+-- sp_bulk_load_* procedures validate and insert the rows set-based.
+-- UNLOGGED: no WAL for data that only lives for one load.
+-- Every business column is TEXT so COPY never fails on a bad value;
+-- bad rows get REJECT_REASON instead and are written to the error file.
+-- LOAD_ID is taken from the transaction-local setting postoffice.load_id,
+-- so concurrent loads share the tables without seeing each other's rows.
+
+create unlogged table STG_DELIVERY (
+   STG_ID               BIGSERIAL            not null,
+   LOAD_ID              TEXT                 not null default current_setting('postoffice.load_id'),
+   REJECT_REASON        TEXT                 null,
+   ID                   TEXT                 null,
+   DRIVER_ID            TEXT                 null,
+   ROUTE_ID             TEXT                 null,
+   INV_ID               TEXT                 null,
+   CLIENT_ID            TEXT                 null,
+   WAR_ID               TEXT                 null,
+   TRACKING_NUMBER      TEXT                 null,
+   DESCRIPTION          TEXT                 null,
+   SENDER_NAME          TEXT                 null,
+   SENDER_ADDRESS       TEXT                 null,
+   SENDER_PHONE         TEXT                 null,
+   SENDER_EMAIL         TEXT                 null,
+   RECIPIENT_NAME       TEXT                 null,
+   RECIPIENT_ADDRESS    TEXT                 null,
+   RECIPIENT_PHONE      TEXT                 null,
+   RECIPIENT_EMAIL      TEXT                 null,
+   ITEM_TYPE            TEXT                 null,
+   WEIGHT               TEXT                 null,
+   DIMENSIONS           TEXT                 null,
+   STATUS               TEXT                 null,
+   PRIORITY             TEXT                 null,
+   IN_TRANSITION        TEXT                 null,
+   DELIVERY_DATE        TEXT                 null,
+   CREATED_AT           TEXT                 null,
+   UPDATED_AT           TEXT                 null,
+   constraint PK_STG_DELIVERY primary key (STG_ID)
+);
+
+create index STG_DELIVERY_LOAD_IDX on STG_DELIVERY (LOAD_ID);
+
+create unlogged table STG_ROUTE (
+   STG_ID               BIGSERIAL            not null,
+   LOAD_ID              TEXT                 not null default current_setting('postoffice.load_id'),
+   REJECT_REASON        TEXT                 null,
+   ID                   TEXT                 null,
+   DRIVER_ID            TEXT                 null,
+   VEHICLE_ID           TEXT                 null,
+   WAR_ID               TEXT                 null,
+   DESCRIPTION          TEXT                 null,
+   DELIVERY_STATUS      TEXT                 null,
+   DELIVERY_DATE        TEXT                 null,
+   DELIVERY_START_TIME  TEXT                 null,
+   DELIVERY_END_TIME    TEXT                 null,
+   EXPECTED_DURATION    TEXT                 null,
+   KMS_TRAVELLED        TEXT                 null,
+   DRIVER_NOTES         TEXT                 null,
+   IS_ACTIVE            TEXT                 null,
+   CREATED_AT           TEXT                 null,
+   UPDATED_AT           TEXT                 null,
+   constraint PK_STG_ROUTE primary key (STG_ID)
+);
+
+create index STG_ROUTE_LOAD_IDX on STG_ROUTE (LOAD_ID);
+
+create unlogged table STG_VEHICLE (
+   STG_ID               BIGSERIAL            not null,
+   LOAD_ID              TEXT                 not null default current_setting('postoffice.load_id'),
+   REJECT_REASON        TEXT                 null,
+   ID                   TEXT                 null,
+   VEHICLE_TYPE         TEXT                 null,
+   PLATE_NUMBER         TEXT                 null,
+   CAPACITY             TEXT                 null,
+   BRAND                TEXT                 null,
+   MODEL                TEXT                 null,
+   VEHICLE_STATUS       TEXT                 null,
+   YEAR                 TEXT                 null,
+   FUEL_TYPE            TEXT                 null,
+   LAST_MAINTENANCE_DATE TEXT                null,
+   IS_ACTIVE            TEXT                 null,
+   CREATED_AT           TEXT                 null,
+   UPDATED_AT           TEXT                 null,
+   constraint PK_STG_VEHICLE primary key (STG_ID)
+);
+
+create index STG_VEHICLE_LOAD_IDX on STG_VEHICLE (LOAD_ID);
+
+create unlogged table STG_WAREHOUSE (
+   STG_ID               BIGSERIAL            not null,
+   LOAD_ID              TEXT                 not null default current_setting('postoffice.load_id'),
+   REJECT_REASON        TEXT                 null,
+   ID                   TEXT                 null,
+   NAME                 TEXT                 null,
+   CONTACT              TEXT                 null,
+   ADDRESS              TEXT                 null,
+   SCHEDULE_OPEN        TEXT                 null,
+   SCHEDULE_CLOSE       TEXT                 null,
+   SCHEDULE             TEXT                 null,
+   MAXIMUM_STORAGE_CAPACITY TEXT             null,
+   IS_ACTIVE            TEXT                 null,
+   CREATED_AT           TEXT                 null,
+   UPDATED_AT           TEXT                 null,
+   constraint PK_STG_WAREHOUSE primary key (STG_ID)
+);
+
+create index STG_WAREHOUSE_LOAD_IDX on STG_WAREHOUSE (LOAD_ID);
+
+create unlogged table STG_INVOICE (
+   STG_ID               BIGSERIAL            not null,
+   LOAD_ID              TEXT                 not null default current_setting('postoffice.load_id'),
+   REJECT_REASON        TEXT                 null,
+   ID                   TEXT                 null,
+   WAR_ID               TEXT                 null,
+   STAFF_ID             TEXT                 null,
+   CLIENT_ID            TEXT                 null,
+   STATUS               TEXT                 null,
+   TYPE                 TEXT                 null,
+   QUANTITY             TEXT                 null,
+   COST                 TEXT                 null,
+   PAID                 TEXT                 null,
+   PAY_METHOD           TEXT                 null,
+   NAME                 TEXT                 null,
+   ADDRESS              TEXT                 null,
+   CONTACT              TEXT                 null,
+   CREATED_AT           TEXT                 null,
+   UPDATED_AT           TEXT                 null,
+   constraint PK_STG_INVOICE primary key (STG_ID)
+);
+
+create index STG_INVOICE_LOAD_IDX on STG_INVOICE (LOAD_ID);
+
+
+/*==============================================================*/
+/* Table: JOB  (background jobs, see PostOffice_App/jobs.py)    */
+/*==============================================================*/
+-- Long exports/imports are queued here by the views and run by
+-- "manage.py run_jobs"; workers claim rows with FOR UPDATE SKIP LOCKED.
+-- PROGRESS/TOTAL/MESSAGE are updated while the job runs; RESULT_FILE is
+-- the artefact (under JOB_FILES_DIR) served by the download endpoint.
+create table JOB (
+   ID                   SERIAL               not null,
+   KIND                 VARCHAR(50)          not null,
+   STATUS               VARCHAR(20)          not null default 'queued', -- 'queued' || 'running' || 'done' || 'failed'
+   PARAMS               JSONB                not null default '{}',
+   CREATED_BY           INT4                 null,
+   WORKER               TEXT                 null,
+   ATTEMPTS             INT4                 not null default 0,
+   PROGRESS             INT4                 not null default 0,
+   TOTAL                INT4                 null,
+   MESSAGE              TEXT                 null,
+   RESULT_FILE          TEXT                 null,
+   RESULT_NAME          TEXT                 null,
+   CONTENT_TYPE         VARCHAR(100)         null,
+   CREATED_AT           TIMESTAMPTZ          not null default now(),
+   STARTED_AT           TIMESTAMPTZ          null,
+   HEARTBEAT_AT         TIMESTAMPTZ          null,
+   FINISHED_AT          TIMESTAMPTZ          null,
+   constraint PK_JOB primary key (ID),
+   constraint CHK_JOB_STATUS CHECK (STATUS IN ('queued', 'running', 'done', 'failed'))
+);
+
+-- Queue head (claim), stale running jobs (requeue) and a user's jobs
+create index JOB_QUEUED_IDX on JOB (ID) where STATUS = 'queued';
+create index JOB_RUNNING_IDX on JOB (HEARTBEAT_AT) where STATUS = 'running';
+create index JOB_CREATED_BY_IDX on JOB (CREATED_BY, ID);
+
+
 /*==============================================================*/
 /* Foreign Key Constraints (R1-R20)                             */
 /*==============================================================*/
@@ -349,6 +610,10 @@ alter table DELIVERY_TRACKING add constraint FK_TRACKING_REGISTERS_LOGS
 alter table DELIVERY_TRACKING add constraint FK_TRACKING_RECORDS_LOGS
    foreign key (WAR_ID) references WAREHOUSE (ID);
 
+-- User -> Job (Requests); the job outlives a deleted user
+alter table JOB add constraint FK_JOB_CREATED_BY
+   foreign key (CREATED_BY) references "USER" (ID) on delete set null;
+
 
 -- FOR MongoDB:
 -- /*==============================================================*/
@@ -1,8 +1,8 @@
 /*==============================================================*/
 /* rodrigo_objects.sql                                          */
-/* Database Objects: Invoice (11) + InvoiceItem (4) +           */
+/* Database Objects: Invoice (11) + InvoiceItem (6) +           */
 /*                   Dashboard (3) + Vehicle (7) + Route (7)    */
-/*                                                = 32 objects  */
+/*                                                = 34 objects  */
 /*                                                              */
 /* Run order: Execute top-to-bottom in pgAdmin Query Tool.      */
 /* All table/column names are unquoted lowercase except "USER". */
@@ -99,9 +99,15 @@ $$;
 /*                          V I E W S                           */
 /* ============================================================ */
 
+-- Views carry no ORDER BY: every caller orders explicitly (backed by
+-- the matching indexes in DDL.sql), so "WHERE id = ?" lookups and
+-- aggregates over a view never pay for sorting the whole joined set.
+
 
 -- 6. v_invoices_with_items
--- Invoices joined with aggregated item counts and totals, plus warehouse/staff/client names.
+-- Invoices with their item count and subtotal, plus warehouse/staff/client names.
+-- item_count/subtotal are columns of invoice kept by trg_invoice_update_cost,
+-- so listing invoices never counts invoice_item.
 CREATE OR REPLACE VIEW v_invoices_with_items AS
 SELECT
     i.id,
@@ -122,19 +128,14 @@ SELECT
     i.contact,
     i.created_at,
     i.updated_at,
-    COALESCE(agg.item_count, 0)              AS item_count
+    i.item_count,
+    i.subtotal
 FROM invoice i
 LEFT JOIN warehouse w           ON w.id = i.war_id
 LEFT JOIN employee_staff es     ON es.id = i.staff_id
 LEFT JOIN "USER" u_staff        ON u_staff.id = es.id
 LEFT JOIN client c              ON c.id = i.client_id
-LEFT JOIN "USER" u_client       ON u_client.id = c.id
-LEFT JOIN LATERAL (
-    SELECT COUNT(*) AS item_count
-    FROM invoice_item ii
-    WHERE ii.inv_id = i.id
-) agg ON true
-ORDER BY i.created_at DESC;
+LEFT JOIN "USER" u_client       ON u_client.id = c.id;
 
 
 -- 7. v_invoices_export
@@ -156,8 +157,7 @@ SELECT
     i.contact,
     i.created_at,
     i.updated_at
-FROM invoice i
-ORDER BY i.id;
+FROM invoice i;
 
 
 -- 8. v_vehicles_full
@@ -177,8 +177,7 @@ SELECT
     v.is_active,
     v.created_at,
     v.updated_at
-FROM vehicle v
-ORDER BY v.id;
+FROM vehicle v;
 
 
 -- 9. v_vehicles_export
@@ -198,8 +197,7 @@ SELECT
     v.is_active,
     v.created_at,
     v.updated_at
-FROM vehicle v
-ORDER BY v.id;
+FROM vehicle v;
 
 
 -- 10. v_routes_full
@@ -231,8 +229,7 @@ FROM route r
 LEFT JOIN employee_driver ed    ON ed.id = r.driver_id
 LEFT JOIN "USER" u_driver       ON u_driver.id = ed.id
 LEFT JOIN vehicle v             ON v.id = r.vehicle_id
-LEFT JOIN warehouse w           ON w.id = r.war_id
-ORDER BY r.delivery_date DESC NULLS LAST, r.id;
+LEFT JOIN warehouse w           ON w.id = r.war_id;
 
 
 -- 11. v_routes_export
@@ -254,26 +251,21 @@ SELECT
     r.is_active,
     r.created_at,
     r.updated_at
-FROM route r
-ORDER BY r.id;
+FROM route r;
 
 
 
 -- 12. v_invoice_totals
--- Per-invoice cost (already includes tax via trigger), item count, and total quantity.
+-- Per-invoice cost (already includes tax via trigger), item count, total quantity
+-- and subtotal (all maintained on invoice by trg_invoice_update_cost).
 CREATE OR REPLACE VIEW v_invoice_totals AS
 SELECT
     i.id                                    AS invoice_id,
     i.cost,
     i.quantity,
-    COALESCE(agg.item_count, 0)             AS item_count
-FROM invoice i
-LEFT JOIN LATERAL (
-    SELECT COUNT(*) AS item_count
-    FROM invoice_item ii
-    WHERE ii.inv_id = i.id
-) agg ON true
-ORDER BY i.id;
+    i.item_count,
+    i.subtotal
+FROM invoice i;
 
 
 -- 13. v_dashboard_stats
@@ -367,37 +359,84 @@ CREATE TRIGGER trg_invoice_item_calc_total
 
 
 -- 16. trg_invoice_update_cost
--- AFTER INSERT/UPDATE/DELETE on invoice_item: recalculate the parent invoice cost and quantity.
+-- AFTER INSERT/UPDATE/DELETE on invoice_item: recalculate the parent invoice
+-- cost, quantity, item_count and subtotal.
+-- Statement-level with transition tables: each invoice touched by the
+-- statement is recalculated once, with one grouped SUM over its items,
+-- so inserting n items in one statement costs O(n) instead of O(n^2).
+-- PostgreSQL allows transition tables only on single-event triggers,
+-- hence three triggers sharing this function.
+-- Skipped when postoffice.invoice_cost = 'off' (sp_sync_invoice_items
+-- recalculates once after its batched statements instead).
 CREATE OR REPLACE FUNCTION fn_trg_invoice_update_cost()
 RETURNS TRIGGER
 LANGUAGE plpgsql
 AS $$
 DECLARE
-    v_inv_id INT;
+    v_inv_ids INT[];
 BEGIN
-    -- Determine which invoice was affected
-    IF TG_OP = 'DELETE' THEN
-        v_inv_id := OLD.inv_id;
+    IF current_setting('postoffice.invoice_cost', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    -- Determine which invoices were affected (both sides when an UPDATE moves an item)
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT inv_id) INTO v_inv_ids FROM new_items;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(DISTINCT inv_id) INTO v_inv_ids
+        FROM (SELECT inv_id FROM old_items UNION SELECT inv_id FROM new_items) x;
     ELSE
-        v_inv_id := NEW.inv_id;
+        SELECT array_agg(DISTINCT inv_id) INTO v_inv_ids FROM old_items;
     END IF;
 
-    -- Recalculate invoice cost (subtotal + tax) and quantity using fn_invoice_total
-    UPDATE invoice
-    SET cost       = fn_invoice_total(v_inv_id),
-        quantity   = (SELECT COALESCE(SUM(quantity), 0) FROM invoice_item WHERE inv_id = v_inv_id),
+    IF v_inv_ids IS NULL THEN
+        RETURN NULL;  -- the statement touched no rows
+    END IF;
+
+    -- Same result as fn_invoice_total (subtotal + tax) and SUM(quantity),
+    -- computed for all affected invoices in one pass
+    UPDATE invoice i
+    SET cost       = ROUND(t.subtotal + fn_calculate_tax(t.subtotal), 2),
+        quantity   = t.quantity,
+        item_count = t.item_count,
+        subtotal   = t.subtotal,
         updated_at = NOW()
-    WHERE id = v_inv_id;
+    FROM (
+        SELECT a.inv_id,
+               COALESCE(SUM(ii.total_item_cost), 0.00)::DECIMAL(10,2) AS subtotal,
+               COALESCE(SUM(ii.quantity), 0)                          AS quantity,
+               COUNT(ii.id)                                           AS item_count
+        FROM unnest(v_inv_ids) AS a(inv_id)
+        LEFT JOIN invoice_item ii ON ii.inv_id = a.inv_id
+        GROUP BY a.inv_id
+    ) t
+    WHERE i.id = t.inv_id;
 
     RETURN NULL;  -- AFTER trigger, return value is ignored
 END;
 $$;
 
 DROP TRIGGER IF EXISTS trg_invoice_update_cost ON invoice_item;
+DROP TRIGGER IF EXISTS trg_invoice_update_cost_insert ON invoice_item;
+DROP TRIGGER IF EXISTS trg_invoice_update_cost_update ON invoice_item;
+DROP TRIGGER IF EXISTS trg_invoice_update_cost_delete ON invoice_item;
+
+CREATE TRIGGER trg_invoice_update_cost_insert
+    AFTER INSERT ON invoice_item
+    REFERENCING NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trg_invoice_update_cost();
 
-CREATE TRIGGER trg_invoice_update_cost
-    AFTER INSERT OR UPDATE OR DELETE ON invoice_item
-    FOR EACH ROW
+CREATE TRIGGER trg_invoice_update_cost_update
+    AFTER UPDATE ON invoice_item
+    REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trg_invoice_update_cost();
+
+CREATE TRIGGER trg_invoice_update_cost_delete
+    AFTER DELETE ON invoice_item
+    REFERENCING OLD TABLE AS old_items
+    FOR EACH STATEMENT
     EXECUTE FUNCTION fn_trg_invoice_update_cost();
 
 
@@ -561,61 +600,84 @@ $$;
 
 -- 22. sp_import_invoices
 -- Bulk-import invoices (with optional nested items) from a JSONB array.
+-- Set-based: one INSERT for all the headers, one for all the items, so
+-- trg_invoice_update_cost recalculates each invoice once for the batch.
+-- The invoice ids are reserved from the sequence first, one per array
+-- position (ordinality), so the items find their invoice without relying
+-- on the order of RETURNING. Elements that are not objects are ignored.
 CREATE OR REPLACE PROCEDURE sp_import_invoices(p_data JSONB)
 LANGUAGE plpgsql
 AS $$
 DECLARE
-    v_rec       JSONB;
-    v_item      JSONB;
-    v_inv_id    INT;
+    v_ids INT[];
 BEGIN
-    FOR v_rec IN SELECT jsonb_array_elements(p_data)
-    LOOP
-        INSERT INTO invoice (
-            war_id, staff_id, client_id,
-            status, type, quantity, cost,
-            paid, pay_method,
-            name, address, contact,
-            created_at, updated_at
-        ) VALUES (
-            (v_rec->>'war_id')::INT,
-            (v_rec->>'staff_id')::INT,
-            (v_rec->>'client_id')::INT,
-            COALESCE(v_rec->>'status', 'pending'),
-            v_rec->>'type',
-            (v_rec->>'quantity')::INT,
-            COALESCE((v_rec->>'cost')::DECIMAL, 0.00),
-            COALESCE((v_rec->>'paid')::BOOL, false),
-            v_rec->>'pay_method',
-            v_rec->>'name',
-            v_rec->>'address',
-            v_rec->>'contact',
-            NOW(), NOW()
-        )
-        RETURNING id INTO v_inv_id;
-
-        -- If the JSON object has an "items" array, import each item too
-        IF v_rec ? 'items' AND jsonb_typeof(v_rec->'items') = 'array' THEN
-            FOR v_item IN SELECT jsonb_array_elements(v_rec->'items')
-            LOOP
-                INSERT INTO invoice_item (
-                    inv_id, shipment_type, weight, delivery_speed,
-                    quantity, unit_price, total_item_cost,
-                    notes, created_at, updated_at
-                ) VALUES (
-                    v_inv_id,
-                    v_item->>'shipment_type',
-                    (v_item->>'weight')::DECIMAL,
-                    v_item->>'delivery_speed',
-                    (v_item->>'quantity')::INT,
-                    (v_item->>'unit_price')::DECIMAL,
-                    COALESCE((v_item->>'quantity')::INT, 0) * COALESCE((v_item->>'unit_price')::DECIMAL, 0),
-                    v_item->>'notes',
-                    NOW(), NOW()
-                );
-            END LOOP;
-        END IF;
-    END LOOP;
+    -- v_ids[n] = id of the n-th element of p_data
+    SELECT array_agg(nextval(pg_get_serial_sequence('invoice', 'id'))::INT ORDER BY g)
+    INTO v_ids
+    FROM generate_series(1, jsonb_array_length(COALESCE(p_data, '[]'::JSONB))) AS g;
+
+    IF v_ids IS NULL THEN
+        RETURN;  -- empty array
+    END IF;
+
+    INSERT INTO invoice (
+        id, war_id, staff_id, client_id,
+        status, type, quantity, cost,
+        paid, pay_method,
+        name, address, contact,
+        created_at, updated_at
+    )
+    SELECT
+        v_ids[e.ord],
+        r.war_id, r.staff_id, r.client_id,
+        COALESCE(r.status, 'pending'),
+        r.type,
+        r.quantity,
+        COALESCE(r.cost, 0.00),
+        COALESCE(r.paid, false),
+        r.pay_method,
+        r.name, r.address, r.contact,
+        NOW(), NOW()
+    FROM jsonb_array_elements(p_data) WITH ORDINALITY AS e(rec, ord)
+    CROSS JOIN LATERAL jsonb_to_record(e.rec) AS r(
+        war_id      INT,
+        staff_id    INT,
+        client_id   INT,
+        status      VARCHAR(30),
+        type        VARCHAR(30),
+        quantity    INT,
+        cost        DECIMAL(10,2),
+        paid        BOOL,
+        pay_method  VARCHAR(30),
+        name        TEXT,
+        address     TEXT,
+        contact     TEXT
+    )
+    WHERE jsonb_typeof(e.rec) = 'object';
+
+    -- Nested "items" arrays, all invoices at once
+    -- (total_item_cost is set by trg_invoice_item_calc_total)
+    INSERT INTO invoice_item (
+        inv_id, shipment_type, weight, delivery_speed,
+        quantity, unit_price,
+        notes, created_at, updated_at
+    )
+    SELECT
+        v_ids[e.ord],
+        it.shipment_type, it.weight, it.delivery_speed,
+        it.quantity, it.unit_price,
+        it.notes, NOW(), NOW()
+    FROM jsonb_array_elements(p_data) WITH ORDINALITY AS e(rec, ord)
+    CROSS JOIN LATERAL jsonb_to_recordset(e.rec->'items') AS it(
+        shipment_type   VARCHAR(50),
+        weight          DECIMAL(10,2),
+        delivery_speed  VARCHAR(50),
+        quantity        INT,
+        unit_price      DECIMAL(10,2),
+        notes           TEXT
+    )
+    WHERE jsonb_typeof(e.rec) = 'object'
+      AND jsonb_typeof(e.rec->'items') = 'array';
 END;
 $$;
 
@@ -956,6 +1018,112 @@ END;
 $$;
 
 
+/* ---------- INVOICE ITEM ---------- */
+
+-- 32. sp_add_invoice_items
+-- Add all the items of an invoice with one INSERT (used by invoice_create
+-- and sp_sync_invoice_items). p_items is a JSONB array of objects with the
+-- sp_add_invoice_item fields:
+--   [{"shipment_type": "...", "weight": 1.5, "delivery_speed": "...",
+--     "quantity": 2, "unit_price": 3.00, "notes": "..."}, ...]
+-- trg_invoice_item_calc_total sets each total_item_cost and
+-- trg_invoice_update_cost recalculates the invoice once for the statement.
+CREATE OR REPLACE PROCEDURE sp_add_invoice_items(
+    p_inv_id  INT,
+    p_items   JSONB
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Validate that the parent invoice exists
+    IF NOT EXISTS (SELECT 1 FROM invoice WHERE id = p_inv_id) THEN
+        RAISE EXCEPTION 'Invoice with id % not found', p_inv_id;
+    END IF;
+
+    INSERT INTO invoice_item (
+        inv_id, shipment_type, weight, delivery_speed,
+        quantity, unit_price,
+        notes, created_at, updated_at
+    )
+    SELECT p_inv_id, x.shipment_type, x.weight, x.delivery_speed,
+           x.quantity, x.unit_price,
+           x.notes, NOW(), NOW()
+    FROM jsonb_to_recordset(COALESCE(p_items, '[]'::JSONB)) AS x(
+        shipment_type VARCHAR(50), weight DECIMAL(10,2),
+        delivery_speed VARCHAR(50), quantity INT, unit_price DECIMAL(10,2),
+        notes TEXT
+    );
+END;
+$$;
+
+
+-- 33. sp_sync_invoice_items
+-- Apply an edited item list to an invoice as a diff (used by invoice_edit):
+--   p_deleted_ids: ids of the items to remove
+--   p_updated:     JSONB array of changed items, each with its "id"
+--   p_inserted:    JSONB array of new items
+-- One DELETE, one UPDATE and one INSERT; unchanged items are not touched.
+-- trg_invoice_update_cost is switched off while they run, so the invoice
+-- cost and quantity are recalculated once at the end instead of per row.
+CREATE OR REPLACE PROCEDURE sp_sync_invoice_items(
+    p_inv_id       INT,
+    p_deleted_ids  INT[],
+    p_updated      JSONB,
+    p_inserted     JSONB
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Validate that the parent invoice exists
+    IF NOT EXISTS (SELECT 1 FROM invoice WHERE id = p_inv_id) THEN
+        RAISE EXCEPTION 'Invoice with id % not found', p_inv_id;
+    END IF;
+
+    PERFORM set_config('postoffice.invoice_cost', 'off', true);
+
+    DELETE FROM invoice_item
+    WHERE inv_id = p_inv_id
+      AND id = ANY(COALESCE(p_deleted_ids, '{}'));
+
+    -- total_item_cost is set by trg_invoice_item_calc_total
+    UPDATE invoice_item ii
+    SET shipment_type  = x.shipment_type,
+        weight         = x.weight,
+        delivery_speed = x.delivery_speed,
+        quantity       = x.quantity,
+        unit_price     = x.unit_price,
+        notes          = x.notes
+    FROM jsonb_to_recordset(COALESCE(p_updated, '[]'::JSONB)) AS x(
+        id INT, shipment_type VARCHAR(50), weight DECIMAL(10,2),
+        delivery_speed VARCHAR(50), quantity INT, unit_price DECIMAL(10,2),
+        notes TEXT
+    )
+    WHERE ii.id = x.id
+      AND ii.inv_id = p_inv_id;
+
+    CALL sp_add_invoice_items(p_inv_id, p_inserted);
+
+    PERFORM set_config('postoffice.invoice_cost', '', true);
+
+    -- Same recalculation as trg_invoice_update_cost, once for the whole edit
+    UPDATE invoice i
+    SET cost       = ROUND(t.subtotal + fn_calculate_tax(t.subtotal), 2),
+        quantity   = t.quantity,
+        item_count = t.item_count,
+        subtotal   = t.subtotal,
+        updated_at = NOW()
+    FROM (
+        SELECT COALESCE(SUM(total_item_cost), 0.00)::DECIMAL(10,2) AS subtotal,
+               COALESCE(SUM(quantity), 0)                          AS quantity,
+               COUNT(*)                                            AS item_count
+        FROM invoice_item
+        WHERE inv_id = p_inv_id
+    ) t
+    WHERE i.id = p_inv_id;
+END;
+$$;
+
+
 
 -- DIEGO
 
@@ -1024,6 +1192,10 @@ $$;
 /*                          V I E W S                           */
 /* ============================================================ */
 
+-- Views carry no ORDER BY: every caller orders explicitly (backed by
+-- the matching indexes in DDL.sql), so "WHERE id = ?" lookups and
+-- aggregates over a view never pay for sorting the whole joined set.
+
 
 -- 2. v_clients  [User]
 -- All users with role='client', joined with client table for tax_id.
@@ -1044,8 +1216,7 @@ SELECT
     c.tax_id
 FROM "USER" u
 JOIN client c ON c.id = u.id
-WHERE u.role = 'client'
-ORDER BY u.first_name, u.last_name;
+WHERE u.role = 'client';
 
 
 -- 3. v_potential_employees  [User]
@@ -1066,8 +1237,7 @@ SELECT
 FROM "USER" u
 WHERE u.role NOT IN ('admin', 'client')
   AND u.is_active = true
-  AND NOT EXISTS (SELECT 1 FROM employee e WHERE e.id = u.id)
-ORDER BY u.first_name, u.last_name;
+  AND NOT EXISTS (SELECT 1 FROM employee e WHERE e.id = u.id);
 
 
 -- 4. v_employees_full  [Employee]
@@ -1104,8 +1274,7 @@ JOIN "USER" u               ON u.id  = e.id        -- shared PK
 LEFT JOIN employee_driver ed ON ed.id = e.id        -- shared PK
 LEFT JOIN employee_staff es  ON es.id = e.id        -- shared PK
 LEFT JOIN warehouse w        ON w.id  = e.war_id
-WHERE e.is_active = true
-ORDER BY u.first_name, u.last_name;
+WHERE e.is_active = true;
 
 
 -- 5. v_warehouses_full  [Warehouse]
@@ -1129,8 +1298,7 @@ LEFT JOIN LATERAL (
     SELECT COUNT(*) AS cnt
     FROM employee e
     WHERE e.war_id = w.id AND e.is_active = true
-) emp_count ON true
-ORDER BY w.name;
+) emp_count ON true;
 
 
 -- 6. v_warehouses_export  [Warehouse]
@@ -1148,8 +1316,7 @@ SELECT
     w.is_active,
     w.created_at,
     w.updated_at
-FROM warehouse w
-ORDER BY w.id;
+FROM warehouse w;
 
 
 
@@ -1165,8 +1332,7 @@ SELECT
     role,
     is_active,
     created_at
-FROM "USER"
-ORDER BY username;
+FROM "USER";
 
 
 
@@ -1898,6 +2064,8 @@ $$;
 -- 4. fn_get_delivery_tracking  [DeliveryTracking]
 -- Return the full tracking timeline for a delivery by tracking number.
 -- Joins delivery_tracking with delivery, employee_staff, warehouse.
+-- dt.created_at >= d.created_at (an event is never older than its
+-- delivery) lets the executor skip the partitions before the delivery.
 CREATE OR REPLACE FUNCTION fn_get_delivery_tracking(p_tracking_number VARCHAR(50))
 RETURNS TABLE (
     tracking_id       INT,
@@ -1924,6 +2092,7 @@ BEGIN
         dt.created_at      AS event_timestamp
     FROM delivery_tracking dt
     JOIN delivery d             ON d.id  = dt.del_id
+                               AND dt.created_at >= d.created_at
     LEFT JOIN employee_staff es ON es.id = dt.staff_id
     LEFT JOIN "USER" u_staff    ON u_staff.id = es.id
     LEFT JOIN warehouse w       ON w.id  = dt.war_id
@@ -1941,6 +2110,7 @@ $$;
 
 -- 5. v_deliveries_full  [Delivery]
 -- Deliveries joined with driver, client, route, and warehouse info.
+-- Unordered; see the note after the view.
 CREATE OR REPLACE VIEW v_deliveries_full AS
 SELECT
     d.id,
@@ -1984,8 +2154,10 @@ LEFT JOIN "USER" u_driver      ON u_driver.id = ed.id
 LEFT JOIN client c             ON c.id = d.client_id
 LEFT JOIN "USER" u_client      ON u_client.id = c.id
 LEFT JOIN route r              ON r.id = d.route_id
-LEFT JOIN warehouse w          ON w.id = d.war_id
-ORDER BY d.created_at DESC;
+LEFT JOIN warehouse w          ON w.id = d.war_id;
+-- No ORDER BY here: callers order explicitly (list pages by created_at/id,
+-- exports by id), so streamed exports can start from the PK index
+-- instead of sorting the whole joined set first.
 
 
 -- 6. v_deliveries_export  [Delivery]
@@ -2017,12 +2189,13 @@ SELECT
     d.delivery_date,
     d.created_at,
     d.updated_at
-FROM delivery d
-ORDER BY d.id;
+FROM delivery d;
 
 
 -- 7. v_delivery_tracking  [DeliveryTracking]
 -- Full tracking timeline view joining delivery_tracking with delivery, employee_staff, warehouse.
+-- Same partition-pruning join predicate as fn_get_delivery_tracking:
+-- WHERE delivery_id = ? only scans the months since that delivery was created.
 CREATE OR REPLACE VIEW v_delivery_tracking AS
 SELECT
     dt.id              AS tracking_id,
@@ -2037,10 +2210,10 @@ SELECT
     dt.created_at      AS event_timestamp
 FROM delivery_tracking dt
 JOIN delivery d             ON d.id  = dt.del_id
+                           AND dt.created_at >= d.created_at
 LEFT JOIN employee_staff es ON es.id = dt.staff_id
 LEFT JOIN "USER" u_staff    ON u_staff.id = es.id
-LEFT JOIN warehouse w       ON w.id  = dt.war_id
-ORDER BY dt.del_id, dt.created_at ASC;
+LEFT JOIN warehouse w       ON w.id  = dt.war_id;
 
 
 
@@ -2139,53 +2312,118 @@ END;
 $$;
 
 DROP TRIGGER IF EXISTS trg_delivery_timestamp_check ON delivery;
+DROP TRIGGER IF EXISTS trg_delivery_timestamp_check_insert ON delivery;
 
 CREATE TRIGGER trg_delivery_timestamp_check
-    BEFORE INSERT OR UPDATE ON delivery
+    BEFORE UPDATE ON delivery
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trg_delivery_timestamp_check();
+
+-- On INSERT the function only has work to do when a timestamp is missing
+-- or inconsistent; the WHEN clause skips it for the usual NOW(), NOW()
+-- rows (sp_create_delivery, sp_import_deliveries, bulk loads) without
+-- a PL/pgSQL call per row.
+CREATE TRIGGER trg_delivery_timestamp_check_insert
+    BEFORE INSERT ON delivery
     FOR EACH ROW
+    WHEN (NEW.created_at IS NULL OR NEW.updated_at IS NULL OR NEW.updated_at < NEW.created_at)
     EXECUTE FUNCTION fn_trg_delivery_timestamp_check();
 
 
 -- 11. trg_delivery_tracking_log  [DeliveryTracking]
--- AFTER INSERT OR UPDATE OF status ON delivery:
--- Automatically insert a row into delivery_tracking to record the status change.
--- The staff_id and war_id are taken from the delivery row itself
--- (set by sp_update_delivery_status before the trigger fires).
+-- Automatically insert a row into delivery_tracking for every new
+-- delivery and every status change. Two triggers:
+--   trg_delivery_tracking_log         AFTER UPDATE OF status, FOR EACH ROW
+--   trg_delivery_tracking_log_insert  AFTER INSERT, FOR EACH STATEMENT,
+--       one INSERT ... SELECT over the statement's transition table, so a
+--       100k-row import logs its initial events in a single statement.
+-- Staff, warehouse and notes come from the transaction-local settings
+-- postoffice.tracking_staff_id / _war_id / _notes when the caller set them
+-- (sp_update_delivery_status), so the event is written once, complete;
+-- otherwise staff is NULL, the warehouse is the delivery's and the notes
+-- are generated.
 CREATE OR REPLACE FUNCTION fn_trg_delivery_tracking_log()
 RETURNS TRIGGER
 LANGUAGE plpgsql
 AS $$
 BEGIN
-    -- On INSERT: log the initial status
-    -- On UPDATE of status: log the new status
-    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND OLD.status IS DISTINCT FROM NEW.status) THEN
-        INSERT INTO delivery_tracking (
-            del_id, staff_id, war_id,
-            status, notes, created_at
-        ) VALUES (
-            NEW.id,
-            NULL,       -- staff_id set to NULL on auto-log; sp_update_delivery_status handles it
-            NEW.war_id,
-            NEW.status,
-            CASE
-                WHEN TG_OP = 'INSERT' THEN 'Delivery registered'
-                ELSE 'Status changed to ' || NEW.status
-            END,
-            NOW()
-        );
+    -- Bulk callers (sp_bulk_update_delivery_status) write their own tracking
+    -- rows, with staff/notes, in one set-based INSERT; they switch this off
+    -- for the duration of their UPDATE.
+    IF current_setting('postoffice.tracking_log', true) = 'off' THEN
+        RETURN NEW;
     END IF;
 
+    INSERT INTO delivery_tracking (
+        del_id, staff_id, war_id,
+        status, notes, created_at
+    ) VALUES (
+        NEW.id,
+        NULLIF(current_setting('postoffice.tracking_staff_id', true), '')::INT,
+        COALESCE(NULLIF(current_setting('postoffice.tracking_war_id', true), '')::INT, NEW.war_id),
+        NEW.status,
+        COALESCE(
+            NULLIF(current_setting('postoffice.tracking_notes', true), ''),
+            'Status changed to ' || NEW.status
+        ),
+        NOW()
+    );
+
+    -- Live tracking: delivered on commit to the LISTENing workers
+    -- (PostOffice_App/tracking_events.py -> SSE)
+    PERFORM pg_notify('delivery_tracking', json_build_object(
+        'delivery_id',     NEW.id,
+        'tracking_number', NEW.tracking_number,
+        'status',          NEW.status
+    )::TEXT);
+
     RETURN NEW;
 END;
 $$;
 
+CREATE OR REPLACE FUNCTION fn_trg_delivery_tracking_log_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF current_setting('postoffice.tracking_log', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    -- New deliveries have no one watching yet: no pg_notify here
+    INSERT INTO delivery_tracking (
+        del_id, staff_id, war_id,
+        status, notes, created_at
+    )
+    SELECT
+        n.id,
+        NULLIF(current_setting('postoffice.tracking_staff_id', true), '')::INT,
+        COALESCE(NULLIF(current_setting('postoffice.tracking_war_id', true), '')::INT, n.war_id),
+        n.status,
+        COALESCE(NULLIF(current_setting('postoffice.tracking_notes', true), ''), 'Delivery registered'),
+        NOW()
+    FROM new_deliveries n
+    ORDER BY n.id;
+
+    RETURN NULL;
+END;
+$$;
+
 DROP TRIGGER IF EXISTS trg_delivery_tracking_log ON delivery;
+DROP TRIGGER IF EXISTS trg_delivery_tracking_log_insert ON delivery;
 
 CREATE TRIGGER trg_delivery_tracking_log
-    AFTER INSERT OR UPDATE OF status ON delivery
+    AFTER UPDATE OF status ON delivery
     FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
     EXECUTE FUNCTION fn_trg_delivery_tracking_log();
 
+CREATE TRIGGER trg_delivery_tracking_log_insert
+    AFTER INSERT ON delivery
+    REFERENCING NEW TABLE AS new_deliveries
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trg_delivery_tracking_log_insert();
+
 
 
 /* ============================================================ */
@@ -2248,10 +2486,9 @@ BEGIN
         RAISE EXCEPTION 'Route with id % not found', p_route_id;
     END IF;
 
-    -- Auto-generate tracking number if not provided: PO-YYYYMMDD-XXXXX
+    -- Auto-generate tracking number if not provided: PO-YYYYMMDD-XXXXX-C
     IF p_tracking_number IS NULL OR p_tracking_number = '' THEN
-        v_tracking := 'PO-' || TO_CHAR(NOW(), 'YYYYMMDD') || '-' ||
-                      LPAD(nextval(pg_get_serial_sequence('delivery', 'id'))::TEXT, 5, '0');
+        v_tracking := fn_generate_tracking_number();
     ELSE
         v_tracking := p_tracking_number;
     END IF;
@@ -2353,7 +2590,9 @@ $$;
 -- Update ONLY the delivery status, with staff/warehouse context for tracking.
 -- This fires trg_delivery_status_workflow (validates transition)
 -- and trg_delivery_tracking_log (inserts tracking event).
--- After the auto-logged event, we update it with the staff_id and notes.
+-- The staff/warehouse/notes context is handed to the trigger through
+-- transaction-local settings, so each status change is one UPDATE plus
+-- one complete tracking INSERT (no follow-up lookup + UPDATE of the event).
 CREATE OR REPLACE PROCEDURE sp_update_delivery_status(
     p_delivery_id    INT,
     p_new_status     VARCHAR(20),
@@ -2363,36 +2602,29 @@ CREATE OR REPLACE PROCEDURE sp_update_delivery_status(
 )
 LANGUAGE plpgsql
 AS $$
-DECLARE
-    v_tracking_id INT;
 BEGIN
     -- Validate delivery exists
     IF NOT EXISTS (SELECT 1 FROM delivery WHERE id = p_delivery_id) THEN
         RAISE EXCEPTION 'Delivery with id % not found', p_delivery_id;
     END IF;
 
+    -- Context for the tracking row trg_delivery_tracking_log is about to write
+    PERFORM set_config('postoffice.tracking_staff_id', COALESCE(p_staff_id::TEXT, ''), true);
+    PERFORM set_config('postoffice.tracking_war_id',   COALESCE(p_warehouse_id::TEXT, ''), true);
+    PERFORM set_config('postoffice.tracking_notes',    COALESCE(p_notes, ''), true);
+
     -- Update the delivery status
     -- trg_delivery_status_workflow validates the transition
-    -- trg_delivery_tracking_log auto-inserts a tracking row
+    -- trg_delivery_tracking_log inserts the tracking row, context included
     UPDATE delivery
     SET status     = p_new_status,
         updated_at = NOW()
     WHERE id = p_delivery_id;
 
-    -- Now update the most recent tracking event with staff/warehouse/notes context
-    SELECT id INTO v_tracking_id
-    FROM delivery_tracking
-    WHERE del_id = p_delivery_id
-    ORDER BY created_at DESC
-    LIMIT 1;
-
-    IF v_tracking_id IS NOT NULL THEN
-        UPDATE delivery_tracking
-        SET staff_id = COALESCE(p_staff_id, staff_id),
-            war_id   = COALESCE(p_warehouse_id, war_id),
-            notes    = COALESCE(p_notes, notes)
-        WHERE id = v_tracking_id;
-    END IF;
+    -- Cleared so later changes in the same transaction don't inherit it
+    PERFORM set_config('postoffice.tracking_staff_id', '', true);
+    PERFORM set_config('postoffice.tracking_war_id',   '', true);
+    PERFORM set_config('postoffice.tracking_notes',    '', true);
 END;
 $$;
 
@@ -2415,104 +2647,1344 @@ $$;
 
 
 -- 16. sp_import_deliveries  [Delivery]
--- Bulk-import deliveries from a JSONB array.
+-- Bulk-import deliveries from a JSONB array (rows already validated by
+-- validate_delivery_batch in views/deliveries.py).
 -- Auto-generates tracking_number for each if not provided.
--- Triggers fire per row (timestamp check + tracking log).
+-- ONE INSERT ... SELECT FROM jsonb_to_recordset(): the initial tracking
+-- events are written by the statement-level trg_delivery_tracking_log_insert
+-- (and mirrored by trg_tracking_read_insert), so the whole batch is a
+-- handful of set operations instead of several trigger calls per row.
 CREATE OR REPLACE PROCEDURE sp_import_deliveries(p_data JSONB)
 LANGUAGE plpgsql
 AS $$
-DECLARE
-    v_rec       JSONB;
-    v_tracking  VARCHAR(50);
-    v_del_id    INT;
 BEGIN
-    FOR v_rec IN SELECT jsonb_array_elements(p_data)
-    LOOP
-        -- Auto-generate tracking number if not provided
-        IF (v_rec->>'tracking_number') IS NULL OR (v_rec->>'tracking_number') = '' THEN
-            v_tracking := 'PO-' || TO_CHAR(NOW(), 'YYYYMMDD') || '-' ||
-                          LPAD(nextval(pg_get_serial_sequence('delivery', 'id'))::TEXT, 5, '0');
-        ELSE
-            v_tracking := v_rec->>'tracking_number';
-        END IF;
-
-        INSERT INTO delivery (
-            driver_id, route_id, inv_id, client_id, war_id,
-            tracking_number, description,
-            sender_name, sender_address, sender_phone, sender_email,
-            recipient_name, recipient_address, recipient_phone, recipient_email,
-            item_type, weight, dimensions,
-            status, priority, in_transition,
-            delivery_date, created_at, updated_at
-        ) VALUES (
-            (v_rec->>'driver_id')::INT,
-            (v_rec->>'route_id')::INT,
-            (v_rec->>'inv_id')::INT,
-            (v_rec->>'client_id')::INT,
-            (v_rec->>'war_id')::INT,
-            v_tracking,
-            v_rec->>'description',
-            v_rec->>'sender_name',
-            v_rec->>'sender_address',
-            v_rec->>'sender_phone',
-            v_rec->>'sender_email',
-            v_rec->>'recipient_name',
-            v_rec->>'recipient_address',
-            v_rec->>'recipient_phone',
-            v_rec->>'recipient_email',
-            v_rec->>'item_type',
-            (v_rec->>'weight')::INT,
-            v_rec->>'dimensions',
-            COALESCE(v_rec->>'status', 'registered'),
-            COALESCE(v_rec->>'priority', 'normal'),
-            COALESCE((v_rec->>'in_transition')::BOOL, false),
-            (v_rec->>'delivery_date')::TIMESTAMPTZ,
-            NOW(), NOW()
-        )
-        RETURNING id INTO v_del_id;
-
-        -- trg_delivery_timestamp_check and trg_delivery_tracking_log fire per row
-    END LOOP;
+    INSERT INTO delivery (
+        driver_id, route_id, inv_id, client_id, war_id,
+        tracking_number, description,
+        sender_name, sender_address, sender_phone, sender_email,
+        recipient_name, recipient_address, recipient_phone, recipient_email,
+        item_type, weight, dimensions,
+        status, priority, in_transition,
+        delivery_date, created_at, updated_at
+    )
+    SELECT
+        r.driver_id, r.route_id, r.inv_id, r.client_id, r.war_id,
+        COALESCE(NULLIF(r.tracking_number, ''), fn_generate_tracking_number()),
+        r.description,
+        r.sender_name, r.sender_address, r.sender_phone, r.sender_email,
+        r.recipient_name, r.recipient_address, r.recipient_phone, r.recipient_email,
+        r.item_type, r.weight, r.dimensions,
+        COALESCE(r.status, 'registered'),
+        COALESCE(r.priority, 'normal'),
+        COALESCE(r.in_transition, false),
+        r.delivery_date,
+        NOW(), NOW()
+    FROM jsonb_to_recordset(p_data) AS r(
+        driver_id          INT,
+        route_id           INT,
+        inv_id             INT,
+        client_id          INT,
+        war_id             INT,
+        tracking_number    VARCHAR(50),
+        description        TEXT,
+        sender_name        VARCHAR(100),
+        sender_address     TEXT,
+        sender_phone       VARCHAR(20),
+        sender_email       VARCHAR(100),
+        recipient_name     VARCHAR(100),
+        recipient_address  TEXT,
+        recipient_phone    VARCHAR(20),
+        recipient_email    VARCHAR(100),
+        item_type          VARCHAR(20),
+        weight             INT,
+        dimensions         VARCHAR(50),
+        status             VARCHAR(20),
+        priority           VARCHAR(20),
+        in_transition      BOOL,
+        delivery_date      TIMESTAMPTZ
+    );
 END;
 $$;
 
 
 
+-- 17. delivery_tracking_read  [DeliveryTracking]
+-- Read model for the public tracking page (/tracking/<tracking_number>/):
+-- one row per delivery_tracking event, with the tracking number, staff
+-- username and warehouse name already joined in.
+-- Replaces mv_delivery_tracking: instead of a full REFRESH (whole history,
+-- exclusive lock) after every status change, triggers 18-21 keep it in
+-- sync row by row, so a status change only touches the rows it affects.
+-- The table and its indexes are created by DDL.sql.
 DROP MATERIALIZED VIEW IF EXISTS mv_delivery_tracking;
 
-CREATE MATERIALIZED VIEW mv_delivery_tracking AS
+-- Rebuilt from delivery_tracking every time this script runs, so no row
+-- of an older install (reused ids / tracking numbers) survives
+TRUNCATE delivery_tracking_read;
+
+INSERT INTO delivery_tracking_read (
+    tracking_id, delivery_id, tracking_number,
+    status, notes, event_timestamp,
+    staff_id, staff_username, warehouse_id, warehouse_name
+)
 SELECT
-  d.id              AS delivery_id,
-  d.tracking_number AS tracking_number,
-  dt.id             AS tracking_id,
-  dt.status         AS status,
-  dt.notes          AS notes,
-  dt.created_at     AS event_timestamp,
-  dt.staff_id       AS staff_id,
-  u.username        AS staff_username,
-  dt.war_id         AS warehouse_id,
-  w.name            AS warehouse_name
+    dt.id, d.id, d.tracking_number,
+    dt.status, dt.notes, dt.created_at,
+    dt.staff_id, u.username, dt.war_id, w.name
 FROM delivery_tracking dt
 JOIN delivery d ON d.id = dt.del_id
 LEFT JOIN "USER" u ON u.id = dt.staff_id
 LEFT JOIN warehouse w ON w.id = dt.war_id;
 
 
-CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_delivery_tracking_tracking_id
-ON mv_delivery_tracking (tracking_id);
+-- 18. trg_tracking_read_sync  [DeliveryTracking]
+-- AFTER INSERT/UPDATE/DELETE on delivery_tracking: upsert/delete the
+-- matching delivery_tracking_read rows. Inserts are handled per statement
+-- (trg_tracking_read_insert, transition table) so bulk imports and bulk
+-- status updates mirror their events in one INSERT ... SELECT; updates
+-- and deletes, which are rare and single-row, stay FOR EACH ROW.
+-- Also the guard for delivery_tracking.id: the partitioned table's PK is
+-- (id, created_at), so only the PK of delivery_tracking_read (tracking_id)
+-- keeps ids unique across partitions. New events are therefore inserted
+-- there WITHOUT ON CONFLICT (a repeated id, e.g. an explicit id from a
+-- load, fails the statement instead of merging two events) and ids
+-- cannot be changed by an UPDATE.
+CREATE OR REPLACE FUNCTION fn_trg_tracking_read_sync()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- sp_create_tracking_partitions moves rows between partitions
+    -- (DELETE + INSERT) without changing them; it switches this off
+    IF current_setting('postoffice.tracking_read', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM delivery_tracking_read WHERE tracking_id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    IF NEW.id <> OLD.id THEN
+        RAISE EXCEPTION 'delivery_tracking.id cannot be changed (% -> %)', OLD.id, NEW.id;
+    END IF;
+
+    INSERT INTO delivery_tracking_read (
+        tracking_id, delivery_id, tracking_number,
+        status, notes, event_timestamp,
+        staff_id, staff_username, warehouse_id, warehouse_name
+    )
+    SELECT
+        NEW.id, d.id, d.tracking_number,
+        NEW.status, NEW.notes, NEW.created_at,
+        NEW.staff_id,
+        (SELECT u.username FROM "USER" u WHERE u.id = NEW.staff_id),
+        NEW.war_id,
+        (SELECT w.name FROM warehouse w WHERE w.id = NEW.war_id)
+    FROM delivery d
+    WHERE d.id = NEW.del_id
+    ON CONFLICT (tracking_id) DO UPDATE
+    SET delivery_id     = EXCLUDED.delivery_id,
+        tracking_number = EXCLUDED.tracking_number,
+        status          = EXCLUDED.status,
+        notes           = EXCLUDED.notes,
+        event_timestamp = EXCLUDED.event_timestamp,
+        staff_id        = EXCLUDED.staff_id,
+        staff_username  = EXCLUDED.staff_username,
+        warehouse_id    = EXCLUDED.warehouse_id,
+        warehouse_name  = EXCLUDED.warehouse_name;
+
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_trg_tracking_read_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF current_setting('postoffice.tracking_read', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO delivery_tracking_read (
+        tracking_id, delivery_id, tracking_number,
+        status, notes, event_timestamp,
+        staff_id, staff_username, warehouse_id, warehouse_name
+    )
+    SELECT
+        n.id, d.id, d.tracking_number,
+        n.status, n.notes, n.created_at,
+        n.staff_id, u.username, n.war_id, w.name
+    FROM new_events n
+    JOIN delivery d ON d.id = n.del_id
+    LEFT JOIN "USER" u ON u.id = n.staff_id
+    LEFT JOIN warehouse w ON w.id = n.war_id;
+
+    RETURN NULL;
+EXCEPTION
+    WHEN unique_violation THEN
+        RAISE EXCEPTION 'delivery_tracking id already used by another event'
+            USING ERRCODE = 'unique_violation',
+                  HINT = 'Let the id default to its sequence.';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tracking_read_sync ON delivery_tracking;
+DROP TRIGGER IF EXISTS trg_tracking_read_insert ON delivery_tracking;
 
-CREATE INDEX IF NOT EXISTS ix_mv_delivery_tracking_lookup
-ON mv_delivery_tracking (tracking_number, event_timestamp);
+CREATE TRIGGER trg_tracking_read_sync
+    AFTER UPDATE OR DELETE ON delivery_tracking
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trg_tracking_read_sync();
 
+CREATE TRIGGER trg_tracking_read_insert
+    AFTER INSERT ON delivery_tracking
+    REFERENCING NEW TABLE AS new_events
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION fn_trg_tracking_read_insert();
 
 
-REFRESH MATERIALIZED VIEW mv_delivery_tracking;
--- o si quieres concurrente:
--- REFRESH MATERIALIZED VIEW CONCURRENTLY mv_delivery_tracking;
+-- 19. trg_tracking_read_delivery  [Delivery]
+-- AFTER UPDATE OF tracking_number on delivery: re-key that delivery's events.
+CREATE OR REPLACE FUNCTION fn_trg_tracking_read_delivery()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF OLD.tracking_number IS DISTINCT FROM NEW.tracking_number THEN
+        UPDATE delivery_tracking_read
+        SET tracking_number = NEW.tracking_number
+        WHERE delivery_id = NEW.id;
+    END IF;
 
-/*==============================================================*/
-/* END OF david_objects.sql                                      */
-/* Total: 16 objects                                            */
-/*   Delivery: 2 views + 3 triggers + 3 functions + 5 procs    */
-/*   DeliveryTracking: 1 view + 1 trigger + 1 function         */
-/*==============================================================*/
\ No newline at end of file
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tracking_read_delivery ON delivery;
+
+CREATE TRIGGER trg_tracking_read_delivery
+    AFTER UPDATE OF tracking_number ON delivery
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trg_tracking_read_delivery();
+
+
+-- 20. trg_tracking_read_user  [User]
+-- AFTER UPDATE OF username on "USER": refresh staff_username on that staff member's events.
+CREATE OR REPLACE FUNCTION fn_trg_tracking_read_user()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF OLD.username IS DISTINCT FROM NEW.username THEN
+        UPDATE delivery_tracking_read
+        SET staff_username = NEW.username
+        WHERE staff_id = NEW.id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tracking_read_user ON "USER";
+
+CREATE TRIGGER trg_tracking_read_user
+    AFTER UPDATE OF username ON "USER"
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trg_tracking_read_user();
+
+
+-- 21. trg_tracking_read_warehouse  [Warehouse]
+-- AFTER UPDATE OF name on warehouse: refresh warehouse_name on its events.
+CREATE OR REPLACE FUNCTION fn_trg_tracking_read_warehouse()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF OLD.name IS DISTINCT FROM NEW.name THEN
+        UPDATE delivery_tracking_read
+        SET warehouse_name = NEW.name
+        WHERE warehouse_id = NEW.id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tracking_read_warehouse ON warehouse;
+
+CREATE TRIGGER trg_tracking_read_warehouse
+    AFTER UPDATE OF name ON warehouse
+    FOR EACH ROW
+    EXECUTE FUNCTION fn_trg_tracking_read_warehouse();
+
+
+-- 22. fn_tracking_check_digit  [Delivery]
+-- Luhn (mod 10) check digit over a string of digits.
+-- Same algorithm as tracking_numbers.luhn_check_digit() in the Django app.
+CREATE OR REPLACE FUNCTION fn_tracking_check_digit(p_digits TEXT)
+RETURNS INT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+    v_sum   INT := 0;
+    v_digit INT;
+    i       INT;
+BEGIN
+    -- From the right: double every second digit, starting with the rightmost
+    FOR i IN 1..length(p_digits) LOOP
+        v_digit := substr(p_digits, length(p_digits) - i + 1, 1)::INT;
+        IF i % 2 = 1 THEN
+            v_digit := v_digit * 2;
+            IF v_digit > 9 THEN
+                v_digit := v_digit - 9;
+            END IF;
+        END IF;
+        v_sum := v_sum + v_digit;
+    END LOOP;
+
+    RETURN (10 - v_sum % 10) % 10;
+END;
+$$;
+
+
+-- 23. fn_generate_tracking_number  [Delivery]
+-- Next generated tracking number: PO-YYYYMMDD-XXXXX-C, where C is the
+-- fn_tracking_check_digit of the YYYYMMDD + XXXXX digits.
+-- Used by sp_create_delivery, sp_import_deliveries and sp_bulk_load_deliveries.
+CREATE OR REPLACE FUNCTION fn_generate_tracking_number()
+RETURNS VARCHAR(50)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_date TEXT := TO_CHAR(NOW(), 'YYYYMMDD');
+    v_seq  TEXT := nextval(pg_get_serial_sequence('delivery', 'id'))::TEXT;
+BEGIN
+    -- At least 5 digits; LPAD alone would truncate ids >= 100000 (and collide)
+    v_seq := LPAD(v_seq, GREATEST(5, length(v_seq)), '0');
+
+    RETURN 'PO-' || v_date || '-' || v_seq || '-' || fn_tracking_check_digit(v_date || v_seq);
+END;
+$$;
+
+
+-- 24. fn_is_valid_tracking_number  [Delivery]
+-- FALSE only for a generated-format number (PO-YYYYMMDD-XXXXX-C) whose
+-- check digit does not match; legacy (PO-YYYYMMDD-XXXXX) and custom
+-- numbers are accepted as-is.
+CREATE OR REPLACE FUNCTION fn_is_valid_tracking_number(p_tracking_number VARCHAR(50))
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+    v_parts TEXT[];
+BEGIN
+    v_parts := regexp_match(p_tracking_number, '^PO-([0-9]{8})-([0-9]{5,})-([0-9])$');
+
+    IF v_parts IS NULL THEN
+        RETURN TRUE;
+    END IF;
+
+    RETURN fn_tracking_check_digit(v_parts[1] || v_parts[2]) = v_parts[3]::INT;
+END;
+$$;
+
+-- 25. sp_bulk_update_delivery_status  [Delivery + DeliveryTracking]
+-- Apply a batch of scanner status changes in one transaction, set-based.
+-- p_items: JSONB array of {"delivery_id" | "tracking_number", "status", "notes"}.
+-- Each item is resolved, validated against fn_is_valid_status_transition and
+-- applied with ONE UPDATE on delivery + ONE INSERT into delivery_tracking
+-- (trg_delivery_tracking_log is switched off meanwhile so each change logs
+-- exactly one row, already carrying staff/warehouse/notes).
+-- p_results (INOUT): JSONB array, one object per item, in input order:
+--   {item, delivery_id, tracking_number, old_status, new_status, result, error}
+--   result = 'updated' | 'unchanged' | 'rejected'
+-- A delivery that appears more than once in the batch is only applied for
+-- its first item; later ones are rejected.
+CREATE OR REPLACE PROCEDURE sp_bulk_update_delivery_status(
+    p_items          JSONB,
+    p_staff_id       INT          DEFAULT NULL,
+    p_warehouse_id   INT          DEFAULT NULL,
+    INOUT p_results  JSONB        DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_staff_id INT;
+    v_war_id   INT;
+BEGIN
+    -- Only an employee_staff id can go into delivery_tracking.staff_id (R19)
+    SELECT id INTO v_staff_id FROM employee_staff WHERE id = p_staff_id;
+
+    -- Unknown scanning warehouse: fall back to each delivery's own
+    -- warehouse instead of failing FK_TRACKING_RECORDS_LOGS for the batch
+    SELECT id INTO v_war_id FROM warehouse WHERE id = p_warehouse_id;
+
+    DROP TABLE IF EXISTS tmp_status_scan;
+
+    -- 1) Items + resolved delivery id (by id, or by tracking_number via DELIVERY_TRACKING_NUMBER_UK)
+    CREATE TEMP TABLE tmp_status_scan ON COMMIT DROP AS
+    SELECT
+        e.item_no::INT                                    AS item_no,
+        COALESCE((e.item->>'delivery_id')::INT, dn.id)    AS delivery_id,
+        e.item->>'tracking_number'                        AS tracking_number,
+        (e.item->>'status')::VARCHAR(20)                  AS new_status,
+        e.item->>'notes'                                  AS notes,
+        NULL::VARCHAR(20)                                 AS old_status,
+        NULL::TEXT                                        AS result,
+        NULL::TEXT                                        AS error
+    FROM jsonb_array_elements(p_items) WITH ORDINALITY AS e(item, item_no)
+    LEFT JOIN delivery dn
+           ON (e.item->>'delivery_id') IS NULL
+          AND dn.tracking_number = e.item->>'tracking_number';
+
+    UPDATE tmp_status_scan t
+    SET error = 'Delivery not found'
+    WHERE NOT EXISTS (SELECT 1 FROM delivery d WHERE d.id = t.delivery_id);
+
+    UPDATE tmp_status_scan t
+    SET error = 'Delivery appears more than once in this batch'
+    WHERE t.error IS NULL
+      AND t.item_no > (SELECT MIN(x.item_no) FROM tmp_status_scan x
+                       WHERE x.delivery_id = t.delivery_id AND x.error IS NULL);
+
+    -- 2) Lock the targets in id order (no deadlocks between concurrent batches),
+    --    then read their current status and validate every transition at once
+    PERFORM 1
+    FROM delivery d
+    WHERE d.id IN (SELECT delivery_id FROM tmp_status_scan WHERE error IS NULL)
+    ORDER BY d.id
+    FOR UPDATE;
+
+    UPDATE tmp_status_scan t
+    SET old_status      = d.status,
+        tracking_number = d.tracking_number,
+        error = CASE
+                    WHEN t.new_status IS NULL
+                      OR t.new_status NOT IN ('registered', 'ready', 'pending', 'in_transit', 'completed', 'cancelled')
+                    THEN 'Invalid status: ' || COALESCE(t.new_status, '(none)')
+                    -- NULL current status: no transition is valid (the
+                    -- message must not become NULL, or the row passes)
+                    WHEN NOT COALESCE(fn_is_valid_status_transition(d.status, t.new_status), false)
+                    THEN 'Invalid status transition: ' || COALESCE(d.status, '(none)') || ' -> ' || t.new_status
+                END
+    FROM delivery d
+    WHERE d.id = t.delivery_id
+      AND t.error IS NULL;
+
+    UPDATE tmp_status_scan
+    SET result = CASE
+                     WHEN error IS NOT NULL THEN 'rejected'
+                     WHEN old_status = new_status THEN 'unchanged'
+                     ELSE 'updated'
+                 END;
+
+    -- 3) Apply: one UPDATE, then one tracking row per actual change
+    PERFORM set_config('postoffice.tracking_log', 'off', true);
+
+    UPDATE delivery d
+    SET status     = t.new_status,
+        updated_at = NOW()
+    FROM tmp_status_scan t
+    WHERE d.id = t.delivery_id
+      AND t.result = 'updated';
+
+    PERFORM set_config('postoffice.tracking_log', 'on', true);
+
+    INSERT INTO delivery_tracking (
+        del_id, staff_id, war_id,
+        status, notes, created_at
+    )
+    SELECT
+        t.delivery_id,
+        v_staff_id,
+        COALESCE(v_war_id, d.war_id),
+        t.new_status,
+        COALESCE(t.notes, 'Status changed to ' || t.new_status),
+        NOW()
+    FROM tmp_status_scan t
+    JOIN delivery d ON d.id = t.delivery_id
+    WHERE t.result = 'updated'
+    ORDER BY t.item_no;
+
+    -- Live tracking: same notification trg_delivery_tracking_log sends
+    PERFORM pg_notify('delivery_tracking', json_build_object(
+        'delivery_id',     d.id,
+        'tracking_number', d.tracking_number,
+        'status',          t.new_status
+    )::TEXT)
+    FROM tmp_status_scan t
+    JOIN delivery d ON d.id = t.delivery_id
+    WHERE t.result = 'updated';
+
+    -- 4) Per-item results, in input order
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+               'item',            t.item_no,
+               'delivery_id',     t.delivery_id,
+               'tracking_number', t.tracking_number,
+               'old_status',      t.old_status,
+               'new_status',      t.new_status,
+               'result',          t.result,
+               'error',           t.error
+           ) ORDER BY t.item_no), '[]'::JSONB)
+    INTO p_results
+    FROM tmp_status_scan t;
+
+    DROP TABLE tmp_status_scan;
+END;
+$$;
+
+/*==============================================================*/
+/* END OF david_objects.sql                                      */
+/* Total: 25 objects                                            */
+/*   Delivery: 2 views + 4 triggers + 6 functions + 6 procs    */
+/*   DeliveryTracking: 1 view + 1 read table + 2 triggers +    */
+/*                     1 function                               */
+/*   User/Warehouse: 1 trigger each (tracking read table sync)  */
+/*==============================================================*/
+
+
+-- BULK LOAD (CSV)
+
+/*==============================================================*/
+/* bulk_load_objects.sql                                        */
+/* CSV bulk load for Delivery, Route, Vehicle, Warehouse and    */
+/* Invoice (5 procedures).                                      */
+/*                                                              */
+/* Flow (driven by PostOffice_App/bulk_load.py):                */
+/*   1) COPY ... FROM STDIN into the UNLOGGED stg_* table       */
+/*      (all TEXT columns, tagged with postoffice.load_id);     */
+/*   2) CALL sp_bulk_load_<entity>(load_id): one UPDATE flags   */
+/*      every bad row in reject_reason, one INSERT ... SELECT   */
+/*      moves the rest into the real table;                     */
+/*   3) the app COPYs the rejected rows out to the error file   */
+/*      and deletes the load from the staging table.            */
+/*                                                              */
+/* The checks mirror the DDL CHECKs, FKs and BEFORE triggers,   */
+/* so one bad row is reported instead of aborting the load.     */
+/* Type checks use pg_input_is_valid() (PostgreSQL 16+).        */
+/* As with the JSON imports, id/created_at/updated_at from the  */
+/* file are ignored: rows are always inserted as new.           */
+/*==============================================================*/
+
+
+-- 1. sp_bulk_load_deliveries  [Delivery]
+-- Validate + insert the rows of stg_delivery tagged with p_load_id.
+-- Auto-generates tracking_number when not provided (same as sp_import_deliveries);
+-- given ones must be well-formed and unique (DELIVERY_TRACKING_NUMBER_UK).
+CREATE OR REPLACE PROCEDURE sp_bulk_load_deliveries(
+    p_load_id        TEXT,
+    INOUT p_loaded   INT DEFAULT NULL,
+    INOUT p_rejected INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE stg_delivery s
+    SET reject_reason = v.reason
+    FROM (
+        SELECT
+            x.stg_id,
+            NULLIF(concat_ws('; ',
+                CASE WHEN x.driver_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.driver_id, 'int4') THEN 'driver_id: not a whole number'
+                     WHEN ed.id IS NULL THEN 'driver_id: driver not found' END,
+                CASE WHEN x.route_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.route_id, 'int4') THEN 'route_id: not a whole number'
+                     WHEN r.id IS NULL THEN 'route_id: route not found' END,
+                CASE WHEN x.inv_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.inv_id, 'int4') THEN 'inv_id: not a whole number'
+                     WHEN i.id IS NULL THEN 'inv_id: invoice not found' END,
+                CASE WHEN x.client_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.client_id, 'int4') THEN 'client_id: not a whole number'
+                     WHEN c.id IS NULL THEN 'client_id: client not found' END,
+                CASE WHEN x.war_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.war_id, 'int4') THEN 'war_id: not a whole number'
+                     WHEN w.id IS NULL THEN 'war_id: warehouse not found' END,
+                CASE WHEN x.tracking_number IS NULL THEN NULL
+                     WHEN x.tracking_number !~ '^[A-Za-z0-9][A-Za-z0-9-]{2,49}$' THEN 'tracking_number: invalid format'
+                     WHEN NOT fn_is_valid_tracking_number(x.tracking_number) THEN 'tracking_number: wrong check digit'
+                     WHEN dup.id IS NOT NULL THEN 'tracking_number: already exists'
+                     WHEN COUNT(*) OVER (PARTITION BY x.tracking_number) > 1 THEN 'tracking_number: repeated in file' END,
+                CASE WHEN length(x.sender_name) > 100 THEN 'sender_name: longer than 100 characters' END,
+                CASE WHEN length(x.sender_phone) > 20 THEN 'sender_phone: longer than 20 characters' END,
+                CASE WHEN length(x.sender_email) > 100 THEN 'sender_email: longer than 100 characters' END,
+                CASE WHEN length(x.recipient_name) > 100 THEN 'recipient_name: longer than 100 characters' END,
+                CASE WHEN length(x.recipient_phone) > 20 THEN 'recipient_phone: longer than 20 characters' END,
+                CASE WHEN length(x.recipient_email) > 100 THEN 'recipient_email: longer than 100 characters' END,
+                CASE WHEN length(x.item_type) > 20 THEN 'item_type: longer than 20 characters' END,
+                CASE WHEN length(x.dimensions) > 50 THEN 'dimensions: longer than 50 characters' END,
+                CASE WHEN x.weight IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.weight, 'int4') THEN 'weight: not a whole number'
+                     WHEN x.weight::INT < 1 THEN 'weight: must be >= 1' END,
+                CASE WHEN x.status NOT IN ('registered', 'ready', 'pending', 'in_transit', 'completed', 'cancelled')
+                     THEN 'status: invalid value' END,
+                CASE WHEN x.priority NOT IN ('normal', 'urgent') THEN 'priority: invalid value' END,
+                CASE WHEN NOT pg_input_is_valid(x.in_transition, 'bool') THEN 'in_transition: not a boolean' END,
+                CASE WHEN NOT pg_input_is_valid(x.delivery_date, 'timestamptz') THEN 'delivery_date: not a date/time' END
+            ), '') AS reason
+        FROM stg_delivery x
+        LEFT JOIN employee_driver ed ON ed.id = CASE WHEN pg_input_is_valid(x.driver_id, 'int4') THEN x.driver_id::INT END
+        LEFT JOIN route r            ON r.id  = CASE WHEN pg_input_is_valid(x.route_id, 'int4') THEN x.route_id::INT END
+        LEFT JOIN invoice i          ON i.id  = CASE WHEN pg_input_is_valid(x.inv_id, 'int4') THEN x.inv_id::INT END
+        LEFT JOIN client c           ON c.id  = CASE WHEN pg_input_is_valid(x.client_id, 'int4') THEN x.client_id::INT END
+        LEFT JOIN warehouse w        ON w.id  = CASE WHEN pg_input_is_valid(x.war_id, 'int4') THEN x.war_id::INT END
+        LEFT JOIN delivery dup       ON dup.tracking_number = x.tracking_number
+        WHERE x.load_id = p_load_id
+    ) v
+    WHERE s.stg_id = v.stg_id
+      AND v.reason IS NOT NULL;
+
+    INSERT INTO delivery (
+        driver_id, route_id, inv_id, client_id, war_id,
+        tracking_number, description,
+        sender_name, sender_address, sender_phone, sender_email,
+        recipient_name, recipient_address, recipient_phone, recipient_email,
+        item_type, weight, dimensions,
+        status, priority, in_transition,
+        delivery_date, created_at, updated_at
+    )
+    SELECT
+        x.driver_id::INT,
+        x.route_id::INT,
+        x.inv_id::INT,
+        x.client_id::INT,
+        x.war_id::INT,
+        COALESCE(x.tracking_number, fn_generate_tracking_number()),
+        x.description,
+        x.sender_name,
+        x.sender_address,
+        x.sender_phone,
+        x.sender_email,
+        x.recipient_name,
+        x.recipient_address,
+        x.recipient_phone,
+        x.recipient_email,
+        x.item_type,
+        x.weight::INT,
+        x.dimensions,
+        COALESCE(x.status, 'registered'),
+        COALESCE(x.priority, 'normal'),
+        COALESCE(x.in_transition::BOOL, false),
+        x.delivery_date::TIMESTAMPTZ,
+        NOW(), NOW()
+    FROM stg_delivery x
+    WHERE x.load_id = p_load_id
+      AND x.reject_reason IS NULL
+    ORDER BY x.stg_id;
+
+    GET DIAGNOSTICS p_loaded = ROW_COUNT;
+
+    SELECT COUNT(*) INTO p_rejected
+    FROM stg_delivery
+    WHERE load_id = p_load_id
+      AND reject_reason IS NOT NULL;
+END;
+$$;
+
+
+-- 2. sp_bulk_load_routes  [Route]
+-- Validate + insert the rows of stg_route tagged with p_load_id.
+-- Also applies the trg_route_time_check rule (end > start) up front.
+CREATE OR REPLACE PROCEDURE sp_bulk_load_routes(
+    p_load_id        TEXT,
+    INOUT p_loaded   INT DEFAULT NULL,
+    INOUT p_rejected INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE stg_route s
+    SET reject_reason = v.reason
+    FROM (
+        SELECT
+            x.stg_id,
+            NULLIF(concat_ws('; ',
+                CASE WHEN x.driver_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.driver_id, 'int4') THEN 'driver_id: not a whole number'
+                     WHEN ed.id IS NULL THEN 'driver_id: driver not found' END,
+                CASE WHEN x.vehicle_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.vehicle_id, 'int4') THEN 'vehicle_id: not a whole number'
+                     WHEN vh.id IS NULL THEN 'vehicle_id: vehicle not found' END,
+                CASE WHEN x.war_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.war_id, 'int4') THEN 'war_id: not a whole number'
+                     WHEN w.id IS NULL THEN 'war_id: warehouse not found' END,
+                CASE WHEN x.delivery_status NOT IN ('not_started', 'on_going', 'finished', 'cancelled')
+                     THEN 'delivery_status: invalid value' END,
+                CASE WHEN NOT pg_input_is_valid(x.delivery_date, 'date') THEN 'delivery_date: not a date' END,
+                CASE WHEN NOT pg_input_is_valid(x.delivery_start_time, 'timestamptz') THEN 'delivery_start_time: not a date/time' END,
+                CASE WHEN NOT pg_input_is_valid(x.delivery_end_time, 'timestamptz') THEN 'delivery_end_time: not a date/time' END,
+                CASE WHEN pg_input_is_valid(x.delivery_start_time, 'timestamptz')
+                      AND pg_input_is_valid(x.delivery_end_time, 'timestamptz')
+                     THEN CASE WHEN x.delivery_end_time::TIMESTAMPTZ <= x.delivery_start_time::TIMESTAMPTZ
+                               THEN 'delivery_end_time: must be after delivery_start_time' END END,
+                CASE WHEN NOT pg_input_is_valid(x.expected_duration, 'time') THEN 'expected_duration: not a time' END,
+                CASE WHEN NOT pg_input_is_valid(x.kms_travelled, 'numeric(8,2)') THEN 'kms_travelled: not a number (max 999999.99)' END,
+                CASE WHEN NOT pg_input_is_valid(x.is_active, 'bool') THEN 'is_active: not a boolean' END
+            ), '') AS reason
+        FROM stg_route x
+        LEFT JOIN employee_driver ed ON ed.id = CASE WHEN pg_input_is_valid(x.driver_id, 'int4') THEN x.driver_id::INT END
+        LEFT JOIN vehicle vh         ON vh.id = CASE WHEN pg_input_is_valid(x.vehicle_id, 'int4') THEN x.vehicle_id::INT END
+        LEFT JOIN warehouse w        ON w.id  = CASE WHEN pg_input_is_valid(x.war_id, 'int4') THEN x.war_id::INT END
+        WHERE x.load_id = p_load_id
+    ) v
+    WHERE s.stg_id = v.stg_id
+      AND v.reason IS NOT NULL;
+
+    INSERT INTO route (
+        driver_id, vehicle_id, war_id,
+        description, delivery_status,
+        delivery_date, delivery_start_time, delivery_end_time,
+        expected_duration, kms_travelled, driver_notes,
+        is_active, created_at, updated_at
+    )
+    SELECT
+        x.driver_id::INT,
+        x.vehicle_id::INT,
+        x.war_id::INT,
+        x.description,
+        COALESCE(x.delivery_status, 'not_started'),
+        x.delivery_date::DATE,
+        x.delivery_start_time::TIMESTAMPTZ,
+        x.delivery_end_time::TIMESTAMPTZ,
+        x.expected_duration::TIME,
+        x.kms_travelled::DECIMAL,
+        x.driver_notes,
+        COALESCE(x.is_active::BOOL, true),
+        NOW(), NOW()
+    FROM stg_route x
+    WHERE x.load_id = p_load_id
+      AND x.reject_reason IS NULL
+    ORDER BY x.stg_id;
+
+    GET DIAGNOSTICS p_loaded = ROW_COUNT;
+
+    SELECT COUNT(*) INTO p_rejected
+    FROM stg_route
+    WHERE load_id = p_load_id
+      AND reject_reason IS NOT NULL;
+END;
+$$;
+
+
+-- 3. sp_bulk_load_vehicles  [Vehicle]
+-- Validate + insert the rows of stg_vehicle tagged with p_load_id.
+-- Depends on: fn_is_valid_year (year is required, same as sp_import_vehicles)
+CREATE OR REPLACE PROCEDURE sp_bulk_load_vehicles(
+    p_load_id        TEXT,
+    INOUT p_loaded   INT DEFAULT NULL,
+    INOUT p_rejected INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE stg_vehicle s
+    SET reject_reason = v.reason
+    FROM (
+        SELECT
+            x.stg_id,
+            NULLIF(concat_ws('; ',
+                CASE WHEN x.vehicle_type NOT IN ('van', 'truck', 'motorcycle', 'bicycle', 'car')
+                     THEN 'vehicle_type: invalid value' END,
+                CASE WHEN length(x.plate_number) > 20 THEN 'plate_number: longer than 20 characters' END,
+                CASE WHEN NOT pg_input_is_valid(x.capacity, 'numeric(10,2)') THEN 'capacity: not a number' END,
+                CASE WHEN length(x.brand) > 50 THEN 'brand: longer than 50 characters' END,
+                CASE WHEN length(x.model) > 50 THEN 'model: longer than 50 characters' END,
+                CASE WHEN x.vehicle_status NOT IN ('available', 'in_use', 'maintenance', 'out_of_service')
+                     THEN 'vehicle_status: invalid value' END,
+                CASE WHEN x.year IS NULL THEN 'year: required'
+                     WHEN NOT pg_input_is_valid(x.year, 'int4') THEN 'year: not a whole number'
+                     WHEN NOT fn_is_valid_year(x.year::INT)
+                     THEN 'year: must be between 1900 and ' || (EXTRACT(YEAR FROM CURRENT_DATE)::INT + 1) END,
+                CASE WHEN x.fuel_type NOT IN ('diesel', 'petrol', 'electric', 'hybrid') THEN 'fuel_type: invalid value' END,
+                CASE WHEN NOT pg_input_is_valid(x.last_maintenance_date, 'date') THEN 'last_maintenance_date: not a date' END,
+                CASE WHEN NOT pg_input_is_valid(x.is_active, 'bool') THEN 'is_active: not a boolean' END
+            ), '') AS reason
+        FROM stg_vehicle x
+        WHERE x.load_id = p_load_id
+    ) v
+    WHERE s.stg_id = v.stg_id
+      AND v.reason IS NOT NULL;
+
+    INSERT INTO vehicle (
+        vehicle_type, plate_number, capacity,
+        brand, model, vehicle_status,
+        year, fuel_type, last_maintenance_date,
+        is_active, created_at, updated_at
+    )
+    SELECT
+        x.vehicle_type,
+        x.plate_number,
+        x.capacity::DECIMAL,
+        x.brand,
+        x.model,
+        COALESCE(x.vehicle_status, 'available'),
+        x.year::INT,
+        x.fuel_type,
+        x.last_maintenance_date::DATE,
+        COALESCE(x.is_active::BOOL, true),
+        NOW(), NOW()
+    FROM stg_vehicle x
+    WHERE x.load_id = p_load_id
+      AND x.reject_reason IS NULL
+    ORDER BY x.stg_id;
+
+    GET DIAGNOSTICS p_loaded = ROW_COUNT;
+
+    SELECT COUNT(*) INTO p_rejected
+    FROM stg_vehicle
+    WHERE load_id = p_load_id
+      AND reject_reason IS NOT NULL;
+END;
+$$;
+
+
+-- 4. sp_bulk_load_warehouses  [Warehouse]
+-- Validate + insert the rows of stg_warehouse tagged with p_load_id.
+-- Also applies the trg_warehouse_schedule_check rule (close > open) up front.
+CREATE OR REPLACE PROCEDURE sp_bulk_load_warehouses(
+    p_load_id        TEXT,
+    INOUT p_loaded   INT DEFAULT NULL,
+    INOUT p_rejected INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE stg_warehouse s
+    SET reject_reason = v.reason
+    FROM (
+        SELECT
+            x.stg_id,
+            NULLIF(concat_ws('; ',
+                CASE WHEN x.name IS NULL THEN 'name: required'
+                     WHEN length(x.name) > 100 THEN 'name: longer than 100 characters' END,
+                CASE WHEN x.contact IS NULL THEN 'contact: required'
+                     WHEN length(x.contact) > 20 THEN 'contact: longer than 20 characters' END,
+                CASE WHEN x.address IS NULL THEN 'address: required'
+                     WHEN length(x.address) > 255 THEN 'address: longer than 255 characters' END,
+                CASE WHEN NOT pg_input_is_valid(x.schedule_open, 'time') THEN 'schedule_open: not a time' END,
+                CASE WHEN NOT pg_input_is_valid(x.schedule_close, 'time') THEN 'schedule_close: not a time' END,
+                CASE WHEN pg_input_is_valid(x.schedule_open, 'time')
+                      AND pg_input_is_valid(x.schedule_close, 'time')
+                     THEN CASE WHEN x.schedule_close::TIME <= x.schedule_open::TIME
+                               THEN 'schedule_close: must be after schedule_open' END END,
+                CASE WHEN x.maximum_storage_capacity IS NULL THEN 'maximum_storage_capacity: required'
+                     WHEN NOT pg_input_is_valid(x.maximum_storage_capacity, 'int4') THEN 'maximum_storage_capacity: not a whole number'
+                     WHEN x.maximum_storage_capacity::INT < 1 THEN 'maximum_storage_capacity: must be >= 1' END,
+                CASE WHEN NOT pg_input_is_valid(x.is_active, 'bool') THEN 'is_active: not a boolean' END
+            ), '') AS reason
+        FROM stg_warehouse x
+        WHERE x.load_id = p_load_id
+    ) v
+    WHERE s.stg_id = v.stg_id
+      AND v.reason IS NOT NULL;
+
+    INSERT INTO warehouse (
+        name, contact, address,
+        schedule_open, schedule_close, schedule,
+        maximum_storage_capacity,
+        is_active, created_at, updated_at
+    )
+    SELECT
+        x.name,
+        x.contact,
+        x.address,
+        x.schedule_open::TIME,
+        x.schedule_close::TIME,
+        x.schedule,
+        x.maximum_storage_capacity::INT,
+        COALESCE(x.is_active::BOOL, true),
+        NOW(), NOW()
+    FROM stg_warehouse x
+    WHERE x.load_id = p_load_id
+      AND x.reject_reason IS NULL
+    ORDER BY x.stg_id;
+
+    GET DIAGNOSTICS p_loaded = ROW_COUNT;
+
+    SELECT COUNT(*) INTO p_rejected
+    FROM stg_warehouse
+    WHERE load_id = p_load_id
+      AND reject_reason IS NOT NULL;
+END;
+$$;
+
+
+-- 5. sp_bulk_load_invoices  [Invoice]
+-- Validate + insert the rows of stg_invoice tagged with p_load_id.
+-- Header rows only; items are added afterwards (or via the JSON import).
+CREATE OR REPLACE PROCEDURE sp_bulk_load_invoices(
+    p_load_id        TEXT,
+    INOUT p_loaded   INT DEFAULT NULL,
+    INOUT p_rejected INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE stg_invoice s
+    SET reject_reason = v.reason
+    FROM (
+        SELECT
+            x.stg_id,
+            NULLIF(concat_ws('; ',
+                CASE WHEN x.war_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.war_id, 'int4') THEN 'war_id: not a whole number'
+                     WHEN w.id IS NULL THEN 'war_id: warehouse not found' END,
+                CASE WHEN x.staff_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.staff_id, 'int4') THEN 'staff_id: not a whole number'
+                     WHEN es.id IS NULL THEN 'staff_id: staff member not found' END,
+                CASE WHEN x.client_id IS NULL THEN NULL
+                     WHEN NOT pg_input_is_valid(x.client_id, 'int4') THEN 'client_id: not a whole number'
+                     WHEN c.id IS NULL THEN 'client_id: client not found' END,
+                CASE WHEN x.status NOT IN ('pending', 'completed', 'cancelled', 'refunded') THEN 'status: invalid value' END,
+                CASE WHEN x.type NOT IN ('paid_on_send', 'paid_on_delivery') THEN 'type: invalid value' END,
+                CASE WHEN NOT pg_input_is_valid(x.quantity, 'int4') THEN 'quantity: not a whole number' END,
+                CASE WHEN NOT pg_input_is_valid(x.cost, 'numeric(10,2)') THEN 'cost: not a number' END,
+                CASE WHEN NOT pg_input_is_valid(x.paid, 'bool') THEN 'paid: not a boolean' END,
+                CASE WHEN x.pay_method NOT IN ('cash', 'card', 'mobile_payment', 'account') THEN 'pay_method: invalid value' END
+            ), '') AS reason
+        FROM stg_invoice x
+        LEFT JOIN warehouse w       ON w.id  = CASE WHEN pg_input_is_valid(x.war_id, 'int4') THEN x.war_id::INT END
+        LEFT JOIN employee_staff es ON es.id = CASE WHEN pg_input_is_valid(x.staff_id, 'int4') THEN x.staff_id::INT END
+        LEFT JOIN client c          ON c.id  = CASE WHEN pg_input_is_valid(x.client_id, 'int4') THEN x.client_id::INT END
+        WHERE x.load_id = p_load_id
+    ) v
+    WHERE s.stg_id = v.stg_id
+      AND v.reason IS NOT NULL;
+
+    INSERT INTO invoice (
+        war_id, staff_id, client_id,
+        status, type, quantity, cost,
+        paid, pay_method,
+        name, address, contact,
+        created_at, updated_at
+    )
+    SELECT
+        x.war_id::INT,
+        x.staff_id::INT,
+        x.client_id::INT,
+        COALESCE(x.status, 'pending'),
+        x.type,
+        x.quantity::INT,
+        COALESCE(x.cost::DECIMAL, 0.00),
+        COALESCE(x.paid::BOOL, false),
+        x.pay_method,
+        x.name,
+        x.address,
+        x.contact,
+        NOW(), NOW()
+    FROM stg_invoice x
+    WHERE x.load_id = p_load_id
+      AND x.reject_reason IS NULL
+    ORDER BY x.stg_id;
+
+    GET DIAGNOSTICS p_loaded = ROW_COUNT;
+
+    SELECT COUNT(*) INTO p_rejected
+    FROM stg_invoice
+    WHERE load_id = p_load_id
+      AND reject_reason IS NOT NULL;
+END;
+$$;
+
+/*==============================================================*/
+/* END OF bulk_load_objects.sql                                 */
+/* Total: 5 procedures (+ 5 UNLOGGED stg_* tables in DDL.sql)   */
+/*==============================================================*/
+
+
+-- TRACKING PARTITIONS
+
+/*==============================================================*/
+/* tracking_partition_objects.sql                               */
+/* Monthly partitions of delivery_tracking (4 objects).         */
+/*                                                              */
+/* delivery_tracking is range-partitioned on created_at, one    */
+/* partition per calendar month (UTC), named                    */
+/* delivery_tracking_YYYY_MM, plus delivery_tracking_default    */
+/* for rows no month partition covers yet (see DDL.sql).        */
+/*                                                              */
+/* "manage.py maintain_tracking_partitions" (run daily, e.g.    */
+/* from cron) calls these to:                                   */
+/*   1) create the next months ahead of time;                   */
+/*   2) detach months older than the retention window, dump     */
+/*      them to a gzip'ed CSV and drop them.                    */
+/*==============================================================*/
+
+
+-- 1. sp_create_tracking_partitions  [DeliveryTracking]
+-- Create the partitions for the current month and the next
+-- p_months_ahead months, plus any month that has rows stranded in
+-- delivery_tracking_default (e.g. the job did not run for a while):
+-- those rows are moved into a new table that is then attached.
+-- p_created (INOUT): number of partitions created.
+CREATE OR REPLACE PROCEDURE sp_create_tracking_partitions(
+    p_months_ahead  INT,
+    INOUT p_created INT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month  DATE;
+    v_start  TIMESTAMPTZ;
+    v_end    TIMESTAMPTZ;
+    v_name   TEXT;
+BEGIN
+    p_created := 0;
+
+    FOR v_month IN
+        SELECT m::DATE
+        FROM generate_series(
+            date_trunc('month', NOW() AT TIME ZONE 'UTC'),
+            date_trunc('month', NOW() AT TIME ZONE 'UTC')
+                + make_interval(months => GREATEST(COALESCE(p_months_ahead, 0), 0)),
+            INTERVAL '1 month'
+        ) AS m
+        UNION
+        SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::DATE
+        FROM delivery_tracking_default
+        ORDER BY 1
+    LOOP
+        v_name  := 'delivery_tracking_' || to_char(v_month, 'YYYY_MM');
+        v_start := v_month::TIMESTAMP AT TIME ZONE 'UTC';
+        v_end   := (v_month + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC';
+
+        CONTINUE WHEN to_regclass(v_name) IS NOT NULL;
+
+        -- No new rows for this month may land in the default partition
+        -- between the move and the ATTACH (which re-checks it)
+        LOCK TABLE delivery_tracking_default IN EXCLUSIVE MODE;
+
+        IF EXISTS (
+            SELECT 1 FROM delivery_tracking_default
+            WHERE created_at >= v_start AND created_at < v_end
+        ) THEN
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE delivery_tracking INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                v_name
+            );
+
+            -- Same rows, new home: delivery_tracking_read stays as it is
+            PERFORM set_config('postoffice.tracking_read', 'off', true);
+
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM delivery_tracking_default'
+                '    WHERE created_at >= $1 AND created_at < $2'
+                '    RETURNING *'
+                ') INSERT INTO %I SELECT * FROM moved',
+                v_name
+            ) USING v_start, v_end;
+
+            PERFORM set_config('postoffice.tracking_read', '', true);
+
+            EXECUTE format(
+                'ALTER TABLE delivery_tracking ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_start, v_end
+            );
+        ELSE
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF delivery_tracking FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_start, v_end
+            );
+        END IF;
+
+        p_created := p_created + 1;
+    END LOOP;
+END;
+$$;
+
+
+-- 2. fn_tracking_partitions_to_archive  [DeliveryTracking]
+-- Month partitions that ended before the retention window
+-- (the current month plus the p_retention_months before it).
+-- Also lists tables already detached but not dropped yet (is_attached =
+-- false), so an archive run that failed half-way is picked up again.
+CREATE OR REPLACE FUNCTION fn_tracking_partitions_to_archive(p_retention_months INT)
+RETURNS TABLE (
+    partition_name  TEXT,
+    month_start     DATE,
+    is_attached     BOOLEAN
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_retention_months IS NULL OR p_retention_months < 1 THEN
+        RAISE EXCEPTION 'Retention must be at least 1 month (got %)', p_retention_months;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        c.relname::TEXT,
+        to_date(substr(c.relname, 19), 'YYYY_MM'),
+        EXISTS (
+            SELECT 1 FROM pg_inherits i
+            WHERE i.inhrelid = c.oid
+              AND i.inhparent = 'delivery_tracking'::REGCLASS
+        )
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+      AND c.relkind = 'r'
+      AND c.relname ~ '^delivery_tracking_[0-9]{4}_[0-9]{2}$'
+      AND to_date(substr(c.relname, 19), 'YYYY_MM')
+          < (date_trunc('month', NOW() AT TIME ZONE 'UTC')
+             - make_interval(months => p_retention_months))::DATE
+    ORDER BY 2;
+END;
+$$;
+
+
+-- 3. sp_detach_tracking_partition  [DeliveryTracking]
+-- Detach one month partition (plain DETACH: a short exclusive lock on
+-- delivery_tracking, no data is copied) and drop its events from
+-- delivery_tracking_read. The table itself is kept for the archive dump.
+CREATE OR REPLACE PROCEDURE sp_detach_tracking_partition(p_partition TEXT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_partition !~ '^delivery_tracking_[0-9]{4}_[0-9]{2}$'
+       OR NOT EXISTS (
+            SELECT 1 FROM pg_inherits i
+            WHERE i.inhrelid = to_regclass(p_partition)
+              AND i.inhparent = 'delivery_tracking'::REGCLASS
+       ) THEN
+        RAISE EXCEPTION '% is not a month partition of delivery_tracking', p_partition;
+    END IF;
+
+    EXECUTE format('ALTER TABLE delivery_tracking DETACH PARTITION %I', p_partition);
+
+    EXECUTE format(
+        'DELETE FROM delivery_tracking_read r USING %I p WHERE r.tracking_id = p.id',
+        p_partition
+    );
+END;
+$$;
+
+
+-- 4. sp_drop_tracking_partition  [DeliveryTracking]
+-- Drop a month table once it has been archived. Refuses anything that
+-- is still attached, so live history cannot be dropped by mistake.
+CREATE OR REPLACE PROCEDURE sp_drop_tracking_partition(p_partition TEXT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_partition !~ '^delivery_tracking_[0-9]{4}_[0-9]{2}$'
+       OR to_regclass(p_partition) IS NULL THEN
+        RAISE EXCEPTION 'Unknown tracking partition %', p_partition;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM pg_inherits i
+        WHERE i.inhrelid = to_regclass(p_partition)
+    ) THEN
+        RAISE EXCEPTION '% is still attached; detach it first', p_partition;
+    END IF;
+
+    EXECUTE format('DROP TABLE %I', p_partition);
+END;
+$$;
+
+
+-- Partitions for the current month and the next 3 (the maintenance
+-- command keeps extending this)
+CALL sp_create_tracking_partitions(3, NULL);
+
+/*==============================================================*/
+/* END OF tracking_partition_objects.sql                        */
+/* Total: 3 procedures + 1 function                             */
+/*==============================================================*/
+
+
+-- BACKGROUND JOBS
+
+/*==============================================================*/
+/* job_objects.sql                                              */
+/* Queue of background jobs on the JOB table (7 objects).       */
+/*                                                              */
+/* Views enqueue long exports/imports with sp_enqueue_job and   */
+/* return at once; "manage.py run_jobs" workers take them with  */
+/* fn_claim_job (FOR UPDATE SKIP LOCKED: concurrent workers     */
+/* never wait on or take the same job), report progress, and    */
+/* close them with sp_finish_job / sp_fail_job.                 */
+/* A worker that dies leaves its job "running" with an old      */
+/* heartbeat_at; sp_requeue_stale_jobs puts it back in the      */
+/* queue (or fails it after too many attempts).                 */
+/*==============================================================*/
+
+
+-- 1. sp_enqueue_job  [Job]
+-- Queue a job of kind p_kind (see PostOffice_App/jobs.py).
+-- p_id (INOUT): the new job id.
+CREATE OR REPLACE PROCEDURE sp_enqueue_job(
+    p_kind        VARCHAR(50),
+    p_params      JSONB,
+    p_created_by  INT,
+    INOUT p_id    INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO job (kind, params, created_by)
+    VALUES (p_kind, COALESCE(p_params, '{}'::JSONB), p_created_by)
+    RETURNING id INTO p_id;
+END;
+$$;
+
+
+-- 2. fn_claim_job  [Job]
+-- Take the oldest queued job for worker p_worker and mark it running.
+-- Returns no row when the queue is empty (or every queued job is being
+-- claimed by another worker right now).
+CREATE OR REPLACE FUNCTION fn_claim_job(p_worker TEXT)
+RETURNS SETOF job
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE job
+    SET status       = 'running',
+        worker       = p_worker,
+        attempts     = attempts + 1,
+        progress     = 0,
+        total        = NULL,
+        message      = NULL,
+        started_at   = NOW(),
+        heartbeat_at = NOW()
+    WHERE id = (
+        SELECT q.id
+        FROM job q
+        WHERE q.status = 'queued'
+        ORDER BY q.id
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING *;
+END;
+$$;
+
+
+-- 3. sp_update_job_progress  [Job]
+-- Progress of a running job (NULL keeps the current value); also its heartbeat.
+CREATE OR REPLACE PROCEDURE sp_update_job_progress(
+    p_id        INT,
+    p_progress  INT,
+    p_total     INT  DEFAULT NULL,
+    p_message   TEXT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE job
+    SET progress     = COALESCE(p_progress, progress),
+        total        = COALESCE(p_total, total),
+        message      = COALESCE(p_message, message),
+        heartbeat_at = NOW()
+    WHERE id = p_id
+      AND status = 'running';
+END;
+$$;
+
+
+-- 4. sp_finish_job  [Job]
+-- Mark a running job done; p_result_file is its artefact (NULL if none).
+CREATE OR REPLACE PROCEDURE sp_finish_job(
+    p_id            INT,
+    p_result_file   TEXT,
+    p_result_name   TEXT,
+    p_content_type  VARCHAR(100),
+    p_message       TEXT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE job
+    SET status       = 'done',
+        progress     = COALESCE(total, progress),
+        result_file  = p_result_file,
+        result_name  = p_result_name,
+        content_type = p_content_type,
+        message      = COALESCE(p_message, message),
+        heartbeat_at = NOW(),
+        finished_at  = NOW()
+    WHERE id = p_id
+      AND status = 'running';
+END;
+$$;
+
+
+-- 5. sp_fail_job  [Job]
+-- Mark a running job failed with the error message.
+CREATE OR REPLACE PROCEDURE sp_fail_job(
+    p_id     INT,
+    p_error  TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE job
+    SET status       = 'failed',
+        message      = p_error,
+        heartbeat_at = NOW(),
+        finished_at  = NOW()
+    WHERE id = p_id
+      AND status = 'running';
+END;
+$$;
+
+
+-- 6. sp_requeue_stale_jobs  [Job]
+-- Running jobs without a heartbeat for p_stale_seconds lost their worker:
+-- back to the queue, or failed once they used p_max_attempts attempts.
+-- p_requeued (INOUT): number of jobs put back in the queue.
+CREATE OR REPLACE PROCEDURE sp_requeue_stale_jobs(
+    p_stale_seconds  INT,
+    p_max_attempts   INT,
+    INOUT p_requeued INT DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE job
+    SET status      = 'failed',
+        message     = 'Worker lost ' || attempts || ' time(s); giving up',
+        finished_at = NOW()
+    WHERE status = 'running'
+      AND heartbeat_at < NOW() - make_interval(secs => p_stale_seconds)
+      AND attempts >= p_max_attempts;
+
+    UPDATE job
+    SET status  = 'queued',
+        worker  = NULL,
+        message = 'Worker lost; queued again'
+    WHERE status = 'running'
+      AND heartbeat_at < NOW() - make_interval(secs => p_stale_seconds);
+
+    GET DIAGNOSTICS p_requeued = ROW_COUNT;
+END;
+$$;
+
+
+-- 7. fn_purge_jobs  [Job]
+-- Delete jobs finished more than p_days days ago and return their
+-- result files, so the caller can delete them from disk too.
+CREATE OR REPLACE FUNCTION fn_purge_jobs(p_days INT)
+RETURNS TABLE (result_file TEXT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    DELETE FROM job j
+    WHERE j.status IN ('done', 'failed')
+      AND j.finished_at < NOW() - make_interval(days => p_days)
+    RETURNING j.result_file;
+END;
+$$;
+
+/*==============================================================*/
+/* END OF job_objects.sql                                       */
+/* Total: 5 procedures + 2 functions                            */
+/*==============================================================*/
@@ -0,0 +1,342 @@
+# PostOffice_App/benchmarks.py
+# ==========================================================
+#  DATABASE BENCHMARKS (manage.py benchmark <name>)
+# ==========================================================
+#
+#  Each benchmark times the current database objects against the way
+#  they used to work ("before" vs "after"), on the real schema. The
+#  "before" version is recreated as a pg_temp object, and the whole run
+#  happens in a transaction that is always rolled back: the benchmark
+#  data and the temp objects never outlive it.
+#
+#  Timings are server-side (a DO block loops over the calls), so they
+#  measure the database work, not the Python round trips.
+
+import time
+
+from django.db import connection, transaction
+
+
+# name -> (function, one-line description); filled by @benchmark
+BENCHMARKS = {}
+
+
+class _Rollback(Exception):
+    """Raised at the end of a run to throw away everything it wrote."""
+
+
+def benchmark(name, description):
+    def register(fn):
+        BENCHMARKS[name] = (fn, description)
+        return fn
+    return register
+
+
+def timed(cursor, sql, params=None):
+    """Run one statement and return the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    cursor.execute(sql, params)
+    return time.perf_counter() - start
+
+
+def run_benchmark(name, rows):
+    """
+    Run benchmark `name` on `rows` generated rows.
+    Returns a list of (variant, seconds, operations) tuples.
+    """
+    fn, _ = BENCHMARKS[name]
+    results = []
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            results = fn(cursor, rows)
+            raise _Rollback
+    except _Rollback:
+        pass
+
+    return results
+
+
+# ----------------------------------------------------------
+#  status_updates: sp_update_delivery_status
+# ----------------------------------------------------------
+#  before: UPDATE delivery (trigger logs a bare event), then SELECT the
+#          latest event and UPDATE it with staff/warehouse/notes;
+#  after:  context handed to trg_delivery_tracking_log via set_config,
+#          one UPDATE + one complete INSERT.
+#  Both variants move the same deliveries one step along the workflow
+#  (before: registered -> ready, after: ready -> pending).
+
+LEGACY_UPDATE_DELIVERY_STATUS = """
+CREATE PROCEDURE pg_temp.sp_update_delivery_status_legacy(
+    p_delivery_id    INT,
+    p_new_status     VARCHAR(20),
+    p_staff_id       INT          DEFAULT NULL,
+    p_warehouse_id   INT          DEFAULT NULL,
+    p_notes          TEXT         DEFAULT NULL
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_tracking_id INT;
+    v_tracking_at TIMESTAMPTZ;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM delivery WHERE id = p_delivery_id) THEN
+        RAISE EXCEPTION 'Delivery with id % not found', p_delivery_id;
+    END IF;
+
+    UPDATE delivery
+    SET status     = p_new_status,
+        updated_at = NOW()
+    WHERE id = p_delivery_id;
+
+    SELECT id, created_at INTO v_tracking_id, v_tracking_at
+    FROM delivery_tracking
+    WHERE del_id = p_delivery_id
+      AND created_at >= (SELECT d.created_at FROM delivery d WHERE d.id = p_delivery_id)
+    ORDER BY created_at DESC
+    LIMIT 1;
+
+    IF v_tracking_id IS NOT NULL THEN
+        UPDATE delivery_tracking
+        SET staff_id = COALESCE(p_staff_id, staff_id),
+            war_id   = COALESCE(p_warehouse_id, war_id),
+            notes    = COALESCE(p_notes, notes)
+        WHERE id = v_tracking_id
+          AND created_at = v_tracking_at;
+    END IF;
+END;
+$$;
+"""
+
+STATUS_UPDATE_LOOP = """
+DO $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT id FROM pg_temp.bench_delivery ORDER BY id LOOP
+        CALL {procedure}(r.id, '{status}', NULL, NULL, 'Benchmark scan');
+    END LOOP;
+END;
+$$;
+"""
+
+
+@benchmark("status_updates", "sp_update_delivery_status: follow-up UPDATE of the event vs trigger context")
+def bench_status_updates(cursor, rows):
+    cursor.execute(LEGACY_UPDATE_DELIVERY_STATUS)
+
+    # Fresh deliveries (their 'registered' events are logged here, untimed)
+    cursor.execute("CREATE TEMP TABLE bench_delivery (id INT PRIMARY KEY) ON COMMIT DROP;")
+    cursor.execute(
+        "WITH ins AS ("
+        "  INSERT INTO delivery (description, status, priority, in_transition)"
+        "  SELECT 'Benchmark delivery ' || g, 'registered', 'normal', false"
+        "  FROM generate_series(1, %s) g"
+        "  RETURNING id"
+        ") INSERT INTO pg_temp.bench_delivery SELECT id FROM ins;",
+        [rows],
+    )
+    cursor.execute("ANALYZE pg_temp.bench_delivery;")
+
+    before = timed(cursor, STATUS_UPDATE_LOOP.format(
+        procedure="pg_temp.sp_update_delivery_status_legacy", status="ready",
+    ))
+    after = timed(cursor, STATUS_UPDATE_LOOP.format(
+        procedure="sp_update_delivery_status", status="pending",
+    ))
+
+    return [("before", before, rows), ("after", after, rows)]
+
+
+# ----------------------------------------------------------
+#  invoice_items: trg_invoice_update_cost
+# ----------------------------------------------------------
+#  before: FOR EACH ROW trigger, every item re-sums all the items of its
+#          invoice (fn_invoice_total + SUM(quantity)): O(n^2) per invoice;
+#  after:  statement-level triggers with transition tables, each invoice
+#          recalculated once per statement.
+#  For each size in INVOICE_ITEM_COUNTS, invoices of that many items are
+#  inserted with one INSERT ... SELECT per invoice (as sp_add_invoice_items
+#  does) until `rows` items are written; sizes above `rows` get one invoice.
+#  The "before" trigger is installed on the real table for the run only.
+
+INVOICE_ITEM_COUNTS = (1, 100, 10000)
+
+LEGACY_INVOICE_UPDATE_COST = """
+CREATE FUNCTION pg_temp.fn_trg_invoice_update_cost_legacy()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inv_id INT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        v_inv_id := OLD.inv_id;
+    ELSE
+        v_inv_id := NEW.inv_id;
+    END IF;
+
+    UPDATE invoice
+    SET cost       = fn_invoice_total(v_inv_id),
+        quantity   = (SELECT COALESCE(SUM(quantity), 0) FROM invoice_item WHERE inv_id = v_inv_id),
+        updated_at = NOW()
+    WHERE id = v_inv_id;
+
+    RETURN NULL;
+END;
+$$;
+"""
+
+INVOICE_ITEMS_LOOP = """
+DO $$
+DECLARE
+    v_inv_id INT;
+BEGIN
+    FOR i IN 1..{invoices} LOOP
+        INSERT INTO invoice (status, type, quantity, cost, paid, name, created_at, updated_at)
+        VALUES ('pending', 'paid_on_send', 0, 0.00, false, 'Benchmark invoice', NOW(), NOW())
+        RETURNING id INTO v_inv_id;
+
+        INSERT INTO invoice_item (inv_id, shipment_type, quantity, unit_price, created_at, updated_at)
+        SELECT v_inv_id, 'parcel', 1 + g % 3, 2.50, NOW(), NOW()
+        FROM generate_series(1, {items}) g;
+    END LOOP;
+END;
+$$;
+"""
+
+INVOICE_COST_TRIGGERS = (
+    "trg_invoice_update_cost_insert",
+    "trg_invoice_update_cost_update",
+    "trg_invoice_update_cost_delete",
+)
+
+
+def _insert_invoice_items(cursor, rows):
+    """Time INVOICE_ITEMS_LOOP for every size; returns [(items, seconds, total items)]."""
+    timings = []
+    for items in INVOICE_ITEM_COUNTS:
+        invoices = max(1, rows // items)
+        seconds = timed(cursor, INVOICE_ITEMS_LOOP.format(invoices=invoices, items=items))
+        timings.append((items, seconds, invoices * items))
+    return timings
+
+
+@benchmark("invoice_items", "trg_invoice_update_cost: per-row recalculation vs statement-level with transition tables")
+def bench_invoice_items(cursor, rows):
+    cursor.execute(LEGACY_INVOICE_UPDATE_COST)
+
+    for name in INVOICE_COST_TRIGGERS:
+        cursor.execute(f"ALTER TABLE invoice_item DISABLE TRIGGER {name};")
+    cursor.execute(
+        "CREATE TRIGGER bench_invoice_update_cost_legacy"
+        "  AFTER INSERT OR UPDATE OR DELETE ON invoice_item"
+        "  FOR EACH ROW EXECUTE FUNCTION pg_temp.fn_trg_invoice_update_cost_legacy();"
+    )
+    before = _insert_invoice_items(cursor, rows)
+
+    cursor.execute("DROP TRIGGER bench_invoice_update_cost_legacy ON invoice_item;")
+    for name in INVOICE_COST_TRIGGERS:
+        cursor.execute(f"ALTER TABLE invoice_item ENABLE TRIGGER {name};")
+    after = _insert_invoice_items(cursor, rows)
+
+    results = []
+    for (items, b_seconds, b_ops), (_, a_seconds, a_ops) in zip(before, after):
+        results.append((f"before/{items}", b_seconds, b_ops))
+        results.append((f"after/{items}", a_seconds, a_ops))
+    return results
+
+
+# ----------------------------------------------------------
+#  invoice_views: v_invoices_with_items / v_invoice_totals
+# ----------------------------------------------------------
+#  before: item count from a LATERAL COUNT(*) over invoice_item per
+#          invoice row, on every read;
+#  after:  invoice.item_count / invoice.subtotal, kept by
+#          trg_invoice_update_cost.
+#  `rows` invoices with 1-5 items each are generated first (untimed);
+#  run it with --rows 1000000 for the 1M-invoice comparison. Two reads:
+#    scan: every invoice through the view (export, dashboards);
+#    page: the first page of invoice_list (newest 26 invoices).
+
+LEGACY_INVOICES_WITH_ITEMS = """
+CREATE VIEW pg_temp.v_invoices_with_items_legacy AS
+SELECT
+    i.id,
+    i.war_id,
+    w.name                                              AS warehouse_name,
+    i.staff_id,
+    u_staff.first_name || ' ' || u_staff.last_name      AS staff_name,
+    i.client_id,
+    u_client.first_name || ' ' || u_client.last_name    AS client_name,
+    i.status,
+    i.type,
+    i.quantity,
+    i.cost,
+    i.paid,
+    i.pay_method,
+    i.name,
+    i.address,
+    i.contact,
+    i.created_at,
+    i.updated_at,
+    COALESCE(agg.item_count, 0)              AS item_count
+FROM invoice i
+LEFT JOIN warehouse w           ON w.id = i.war_id
+LEFT JOIN employee_staff es     ON es.id = i.staff_id
+LEFT JOIN "USER" u_staff        ON u_staff.id = es.id
+LEFT JOIN client c              ON c.id = i.client_id
+LEFT JOIN "USER" u_client       ON u_client.id = c.id
+LEFT JOIN LATERAL (
+    SELECT COUNT(*) AS item_count
+    FROM invoice_item ii
+    WHERE ii.inv_id = i.id
+) agg ON true;
+"""
+
+# COUNT(*) over the rows the view produces, so nothing is sent to Python
+INVOICE_VIEW_SCAN = "SELECT COUNT(*), SUM(item_count) FROM {view};"
+INVOICE_VIEW_PAGE = (
+    "SELECT COUNT(*) FROM ("
+    "  SELECT id, item_count FROM {view} ORDER BY created_at DESC, id DESC LIMIT 26"
+    ") page;"
+)
+
+
+@benchmark("invoice_views", "v_invoices_with_items: LATERAL COUNT(*) per invoice vs maintained item_count")
+def bench_invoice_views(cursor, rows):
+    cursor.execute(LEGACY_INVOICES_WITH_ITEMS)
+
+    # Items go in with one statement: trg_invoice_update_cost fills
+    # item_count/subtotal once per invoice
+    cursor.execute(
+        "CREATE TEMP TABLE bench_invoice (id INT PRIMARY KEY) ON COMMIT DROP;"
+    )
+    cursor.execute(
+        "WITH ins AS ("
+        "  INSERT INTO invoice (status, type, quantity, cost, paid, name, created_at, updated_at)"
+        "  SELECT 'pending', 'paid_on_send', 0, 0.00, false, 'Benchmark invoice ' || g,"
+        "         NOW() - g * INTERVAL '1 second', NOW()"
+        "  FROM generate_series(1, %s) g"
+        "  RETURNING id"
+        ") INSERT INTO pg_temp.bench_invoice SELECT id FROM ins;",
+        [rows],
+    )
+    cursor.execute(
+        "INSERT INTO invoice_item (inv_id, shipment_type, quantity, unit_price, created_at, updated_at)"
+        " SELECT b.id, 'parcel', 1, 2.50, NOW(), NOW()"
+        " FROM pg_temp.bench_invoice b"
+        " CROSS JOIN LATERAL generate_series(1, 1 + b.id % 5) g;"
+    )
+    cursor.execute("ANALYZE invoice;")
+    cursor.execute("ANALYZE invoice_item;")
+
+    results = []
+    for read, sql in (("scan", INVOICE_VIEW_SCAN), ("page", INVOICE_VIEW_PAGE)):
+        operations = rows if read == "scan" else 1
+        before = timed(cursor, sql.format(view="pg_temp.v_invoices_with_items_legacy"))
+        after = timed(cursor, sql.format(view="v_invoices_with_items"))
+        results.append((f"before/{read}", before, operations))
+        results.append((f"after/{read}", after, operations))
+    return results
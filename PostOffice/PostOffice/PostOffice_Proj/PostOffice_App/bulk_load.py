@@ -0,0 +1,192 @@
+# PostOffice_App/bulk_load.py
+# ==========================================================
+#  CSV BULK LOAD — COPY FROM STDIN + set-based merge
+# ==========================================================
+#
+#  For files too big for the JSON imports (hundreds of thousands of rows):
+#    1) the CSV body is streamed into an UNLOGGED stg_* table with
+#       COPY ... FROM STDIN (no per-row INSERT, no Python parsing);
+#    2) CALL sp_bulk_load_<entity>(load_id) flags bad rows and inserts
+#       the rest with a single INSERT ... SELECT;
+#    3) rejected rows are COPYed back out to a CSV error file (original
+#       columns + row_no + reject_reason) so they can be fixed and reloaded.
+#
+#  Used by views/bulk_load.py (upload) and the "bulk_load" manage.py command.
+
+import csv
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+# Where the error files go (one "<load_id>.csv" per load with rejects)
+REJECTS_DIR = Path(settings.BULK_LOAD_REJECTS_DIR)
+
+# entity -> staging table, merge procedure and the CSV columns it accepts.
+# The columns are the table's own (same names as the v_*_export views),
+# so a CSV export can be edited and loaded back.
+BULK_LOAD_ENTITIES = {
+    "deliveries": {
+        "staging": "stg_delivery",
+        "procedure": "sp_bulk_load_deliveries",
+        "columns": (
+            "id", "driver_id", "route_id", "inv_id", "client_id", "war_id",
+            "tracking_number", "description",
+            "sender_name", "sender_address", "sender_phone", "sender_email",
+            "recipient_name", "recipient_address", "recipient_phone", "recipient_email",
+            "item_type", "weight", "dimensions",
+            "status", "priority", "in_transition",
+            "delivery_date", "created_at", "updated_at",
+        ),
+    },
+    "routes": {
+        "staging": "stg_route",
+        "procedure": "sp_bulk_load_routes",
+        "columns": (
+            "id", "driver_id", "vehicle_id", "war_id",
+            "description", "delivery_status",
+            "delivery_date", "delivery_start_time", "delivery_end_time",
+            "expected_duration", "kms_travelled", "driver_notes",
+            "is_active", "created_at", "updated_at",
+        ),
+    },
+    "vehicles": {
+        "staging": "stg_vehicle",
+        "procedure": "sp_bulk_load_vehicles",
+        "columns": (
+            "id", "vehicle_type", "plate_number", "capacity",
+            "brand", "model", "vehicle_status",
+            "year", "fuel_type", "last_maintenance_date",
+            "is_active", "created_at", "updated_at",
+        ),
+    },
+    "warehouses": {
+        "staging": "stg_warehouse",
+        "procedure": "sp_bulk_load_warehouses",
+        "columns": (
+            "id", "name", "contact", "address",
+            "schedule_open", "schedule_close", "schedule",
+            "maximum_storage_capacity",
+            "is_active", "created_at", "updated_at",
+        ),
+    },
+    "invoices": {
+        "staging": "stg_invoice",
+        "procedure": "sp_bulk_load_invoices",
+        "columns": (
+            "id", "war_id", "staff_id", "client_id",
+            "status", "type", "quantity", "cost",
+            "paid", "pay_method",
+            "name", "address", "contact",
+            "created_at", "updated_at",
+        ),
+    },
+}
+
+
+class BulkLoadError(Exception):
+    """The file cannot be loaded at all (bad header, unknown entity...)."""
+
+
+class BulkLoadResult:
+    def __init__(self, load_id, entity, loaded, rejected, rejects_path):
+        self.load_id = load_id
+        self.entity = entity
+        self.loaded = loaded
+        self.rejected = rejected
+        self.rejects_path = rejects_path  # None when every row was loaded
+
+    @property
+    def total(self):
+        return self.loaded + self.rejected
+
+
+def read_header(fileobj, allowed):
+    """
+    Consume the header line of fileobj and return the column list.
+    Accepts text or binary files; a UTF-8 BOM is ignored.
+    """
+    line = fileobj.readline()
+    if isinstance(line, bytes):
+        line = line.decode("utf-8-sig")
+    else:
+        line = line.lstrip("\ufeff")
+
+    header = next(csv.reader([line]), [])
+    columns = [name.strip().lower() for name in header]
+
+    if not columns or columns == [""]:
+        raise BulkLoadError("The CSV file is empty or has no header row.")
+
+    unknown = [name for name in columns if name not in allowed]
+    if unknown:
+        raise BulkLoadError(f"Unknown column(s): {', '.join(unknown)}.")
+
+    duplicated = sorted({name for name in columns if columns.count(name) > 1})
+    if duplicated:
+        raise BulkLoadError(f"Duplicated column(s): {', '.join(duplicated)}.")
+
+    return columns
+
+
+def rejects_path_for(load_id):
+    return REJECTS_DIR / f"{load_id}.csv"
+
+
+def load_csv(entity, fileobj):
+    """
+    Load one CSV file (header + rows) into the table behind `entity`.
+
+    Runs in a single transaction: the whole load is committed or nothing is.
+    Returns a BulkLoadResult; raises BulkLoadError for a file that cannot be
+    read at all (rows that are merely invalid end up in the error file).
+    """
+    spec = BULK_LOAD_ENTITIES.get(entity)
+    if spec is None:
+        raise BulkLoadError(f"Unknown entity: {entity}.")
+
+    columns = read_header(fileobj, spec["columns"])
+    column_list = ", ".join(columns)
+    staging = spec["staging"]
+    load_id = uuid.uuid4().hex
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # stg_*.load_id defaults to this transaction-local setting
+        cursor.execute("SELECT set_config('postoffice.load_id', %s, true);", [load_id])
+
+        # FORCE_NULL: a quoted "" is NULL too, like an unquoted empty field
+        cursor.copy_expert(
+            f"COPY {staging} ({column_list}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NULL ({column_list}))",
+            fileobj,
+        )
+
+        cursor.execute(f"CALL {spec['procedure']}(%s, NULL, NULL);", [load_id])
+        loaded, rejected = cursor.fetchone()
+
+        rejects_path = None
+        if rejected:
+            REJECTS_DIR.mkdir(parents=True, exist_ok=True)
+            rejects_path = rejects_path_for(load_id)
+
+            # row_no = position of the row in the uploaded file (header excluded)
+            with open(rejects_path, "w", encoding="utf-8", newline="") as out:
+                cursor.copy_expert(
+                    f"COPY ("
+                    f"  SELECT row_no, reject_reason, {column_list}"
+                    f"  FROM ("
+                    f"    SELECT s.*, row_number() OVER (ORDER BY s.stg_id) AS row_no"
+                    f"    FROM {staging} s"
+                    f"    WHERE s.load_id = current_setting('postoffice.load_id')"
+                    f"  ) x"
+                    f"  WHERE reject_reason IS NOT NULL"
+                    f"  ORDER BY row_no"
+                    f") TO STDOUT WITH (FORMAT csv, HEADER)",
+                    out,
+                )
+
+        cursor.execute(f"DELETE FROM {staging} WHERE load_id = %s;", [load_id])
+
+    return BulkLoadResult(load_id, entity, loaded, rejected, rejects_path)
@@ -0,0 +1,57 @@
+# PostOffice_App/exports.py
+# ==========================================================
+#  EXPORTS — per-entity value formatting for the CSV / JSON files
+# ==========================================================
+#
+#  The export views (views/<entity>.py) and the background export job
+#  (jobs.export_job, ?background=1) both format every cell through
+#  export_csv_cell() / export_json_value(), so a file comes out the same
+#  whichever way it was produced and reads back through the imports.
+#
+#  Deliveries and warehouses are written as the driver returns them
+#  (str(), or json default=str); invoices, vehicles and routes use ISO
+#  dates, true/false, float amounts and HH:MM:SS durations.
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+
+# Entities exported as the driver returns them
+RAW_EXPORTS = {"deliveries", "warehouses"}
+
+
+def format_duration(val):
+    """timedelta -> "HH:MM:SS" (hours may exceed 24)."""
+    total_seconds = int(val.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def export_csv_cell(entity, val):
+    """One CSV cell (a string; quoting is left to the writer)."""
+    if val is None:
+        return ""
+    if entity in RAW_EXPORTS:
+        return str(val)
+    if isinstance(val, bool):
+        return "true" if val else "false"
+    if isinstance(val, (datetime, date, time)):
+        return val.isoformat()
+    if isinstance(val, timedelta):
+        return format_duration(val)
+    return str(val)
+
+
+def export_json_value(entity, val):
+    """One JSON value; anything left non-native goes through default=str."""
+    if entity in RAW_EXPORTS:
+        return val
+    if isinstance(val, Decimal):
+        return float(val)
+    if isinstance(val, (datetime, date, time)):
+        return val.isoformat()
+    if isinstance(val, timedelta):
+        return format_duration(val)
+    return val
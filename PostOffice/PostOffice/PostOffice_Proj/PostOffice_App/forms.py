@@ -1,8 +1,9 @@
 from django import forms
-from django.db import connection
 from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import User
+from .reference_data import reference_choices
+from .tracking_numbers import validate_tracking_number
 # NOTE: Only User is imported — all other models (Invoice, Vehicle, Route, etc.)
 # were removed from models.py. Those tables are now DDL-managed.
 
@@ -96,15 +97,35 @@ PAY_METHOD_CHOICES = [
 ]
 
 
+class ReferenceChoiceField(forms.ChoiceField):
+    """
+    ChoiceField over one reference_data list, validated against the
+    cached list. Only a value missing from it costs a fresh read (one
+    query), so a row created by another worker is not rejected.
+    """
+
+    def __init__(self, *, reference, **kwargs):
+        self.reference = reference
+        super().__init__(**kwargs)
+
+    def valid_value(self, value):
+        # Only called for a non-empty value
+        if super().valid_value(value):
+            return True
+        # Not in the cached list: re-read it (refreshes the cache too)
+        self.choices = reference_choices(self.reference, refresh=True)[self.reference]
+        return super().valid_value(value)
+
+
 class InvoiceForm(forms.Form):
     # --- FK dropdowns ---
     # These are ChoiceField, NOT ModelChoiceField (no model to query).
-    # Choices are loaded dynamically from the DB in __init__ below.
+    # Choices come from the reference data cache in __init__ below.
     # ChoiceField returns strings, so the view converts to int before
     # passing to sp_create_invoice (which expects INT parameters).
-    war_id    = forms.ChoiceField(label="Warehouse",     required=False)
-    staff_id  = forms.ChoiceField(label="Staff Member",  required=False)
-    client_id = forms.ChoiceField(label="Client",        required=False)
+    war_id    = ReferenceChoiceField(reference="warehouses", label="Warehouse",    required=False)
+    staff_id  = ReferenceChoiceField(reference="staff",      label="Staff Member", required=False)
+    client_id = ReferenceChoiceField(reference="clients",    label="Client",       required=False)
 
     # --- Invoice header fields ---
     # These map 1:1 to DDL INVOICE columns and sp_create_invoice parameters
@@ -126,38 +147,13 @@ class InvoiceForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Populate FK dropdown choices from the database.
-        # Each query fetches (id, display_name) pairs.
-        # The empty tuple ("", "---------") is the default "nothing selected" option.
-        with connection.cursor() as cur:
-
-            # Warehouses — only active ones
-            cur.execute("SELECT id, name FROM warehouse WHERE is_active = true ORDER BY name")
-            self.fields["war_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
-
-            # Staff members — join employee_staff → USER to get full name
-            cur.execute("""
-                SELECT es.id, u.first_name || ' ' || u.last_name
-                FROM employee_staff es
-                JOIN "USER" u ON u.id = es.id
-                ORDER BY u.first_name
-            """)
-            self.fields["staff_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
-
-            # Clients — join client → USER to get full name
-            cur.execute("""
-                SELECT c.id, u.first_name || ' ' || u.last_name
-                FROM client c
-                JOIN "USER" u ON u.id = c.id
-                ORDER BY u.first_name
-            """)
-            self.fields["client_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
+        # FK dropdown choices: (id, display_name) pairs from the reference
+        # data cache (reference_data.py), with ("", "---------") first as
+        # the "nothing selected" option. No query once the lists are cached.
+        choices = reference_choices("warehouses", "staff", "clients")
+        self.fields["war_id"].choices = choices["warehouses"]
+        self.fields["staff_id"].choices = choices["staff"]
+        self.fields["client_id"].choices = choices["clients"]
 
 
 # ==========================================================
@@ -167,6 +163,7 @@ class InvoiceForm(forms.Form):
 #  Each field maps to a parameter of sp_add_invoice_item:
 #    sp_add_invoice_item(p_inv_id, p_shipment_type, p_weight,
 #                        p_delivery_speed, p_quantity, p_unit_price, p_notes)
+#  (the views send all rows at once as the JSONB items of sp_add_invoice_items)
 #
 #  Fields NOT included here (handled automatically by DB triggers):
 #    - total_item_cost → set by trg_invoice_item_calc_total (qty × unit_price)
@@ -174,6 +171,8 @@ class InvoiceForm(forms.Form):
 #    - inv_id          → passed in the view, not a form field
 
 class InvoiceItemForm(forms.Form):
+    # invoice_item.id of an existing row (edit only); empty for new rows
+    id             = forms.IntegerField(widget=forms.HiddenInput, required=False)
     shipment_type  = forms.CharField(max_length=50, required=False, label="Shipment Type")
     weight         = forms.DecimalField(max_digits=10, decimal_places=2, required=False, label="Weight (kg)")
     delivery_speed = forms.CharField(max_length=50, required=False, label="Delivery Speed")
@@ -260,9 +259,9 @@ ROUTE_STATUS_CHOICES = [
 
 class RouteForm(forms.Form):
     # --- FK dropdowns ---
-    driver_id  = forms.ChoiceField(label="Driver",    required=False)
-    vehicle_id = forms.ChoiceField(label="Vehicle",   required=False)
-    war_id     = forms.ChoiceField(label="Warehouse", required=False)
+    driver_id  = ReferenceChoiceField(reference="drivers",    label="Driver",    required=False)
+    vehicle_id = ReferenceChoiceField(reference="vehicles",   label="Vehicle",   required=False)
+    war_id     = ReferenceChoiceField(reference="warehouses", label="Warehouse", required=False)
 
     # --- Route fields ---
     description      = forms.CharField(widget=forms.Textarea(attrs={"rows": 2}), required=False, label="Description")
@@ -287,35 +286,11 @@ class RouteForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        with connection.cursor() as cur:
-
-            # Drivers — employee_driver JOIN USER to get full name
-            cur.execute("""
-                SELECT ed.id, u.first_name || ' ' || u.last_name
-                FROM employee_driver ed
-                JOIN "USER" u ON u.id = ed.id
-                ORDER BY u.first_name
-            """)
-            self.fields["driver_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
-
-            # Vehicles — active vehicles with plate + brand/model
-            cur.execute("""
-                SELECT id, plate_number || ' (' || brand || ' ' || model || ')'
-                FROM vehicle
-                WHERE is_active = true
-                ORDER BY plate_number
-            """)
-            self.fields["vehicle_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
-
-            # Warehouses — only active ones
-            cur.execute("SELECT id, name FROM warehouse WHERE is_active = true ORDER BY name")
-            self.fields["war_id"].choices = [("", "---------")] + [
-                (r[0], r[1]) for r in cur.fetchall()
-            ]
+        # Drivers, active vehicles and active warehouses (reference_data.py)
+        choices = reference_choices("drivers", "vehicles", "warehouses")
+        self.fields["driver_id"].choices = choices["drivers"]
+        self.fields["vehicle_id"].choices = choices["vehicles"]
+        self.fields["war_id"].choices = choices["warehouses"]
 
 
 # ===============
@@ -445,7 +420,8 @@ class DeliveryCreateForm(forms.Form):
     war_id = forms.IntegerField(required=False, min_value=1, label="Warehouse ID")
 
     # --- delivery basic fields ---
-    tracking_number = forms.CharField(required=False, max_length=50, label="Tracking number")
+    tracking_number = forms.CharField(required=False, max_length=50, label="Tracking number",
+                                      validators=[validate_tracking_number])
     description = forms.CharField(required=False, widget=forms.Textarea(attrs={"rows": 2}), label="Description")
 
     # --- sender ---
@@ -494,7 +470,8 @@ class DeliveryEditForm(forms.Form):
     client_id = forms.IntegerField(required=False, min_value=1, label="Client ID")
     war_id = forms.IntegerField(required=False, min_value=1, label="Warehouse ID")
 
-    tracking_number = forms.CharField(required=False, max_length=50, label="Tracking number")
+    tracking_number = forms.CharField(required=False, max_length=50, label="Tracking number",
+                                      validators=[validate_tracking_number])
     description = forms.CharField(required=False, widget=forms.Textarea(attrs={"rows": 2}), label="Description")
 
     sender_name = forms.CharField(required=False, max_length=100, label="Sender name")
@@ -534,3 +511,38 @@ class DeliveryStatusUpdateForm(forms.Form):
 
 class DeliveryImportJSONForm(forms.Form):
     file = forms.FileField(label="JSON file")
+
+
+class DeliveryListFilterForm(forms.Form):
+    # bound to request.GET on the deliveries list; every field is optional
+    # and each one becomes a WHERE clause on v_deliveries_full
+    status = forms.ChoiceField(required=False, choices=[("", "Any status")] + DELIVERY_STATUS_CHOICES, label="Status")
+    priority = forms.ChoiceField(required=False, choices=[("", "Any priority")] + DELIVERY_PRIORITY_CHOICES, label="Priority")
+    war_id = forms.IntegerField(required=False, min_value=1, label="Warehouse ID")
+    driver_id = forms.IntegerField(required=False, min_value=1, label="Driver ID")
+
+    date_from = forms.DateField(required=False, label="Created from",
+                                widget=forms.DateInput(attrs={"type": "date"}))
+    date_to = forms.DateField(required=False, label="Created until",
+                              widget=forms.DateInput(attrs={"type": "date"}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        date_from = cleaned_data.get("date_from")
+        date_to = cleaned_data.get("date_to")
+
+        if date_from and date_to and date_to < date_from:
+            self.add_error("date_to", "End date must be on or after the start date.")
+
+        return cleaned_data
+
+
+class DeliverySearchForm(forms.Form):
+    # free text: tracking number (or part of it), sender/recipient name, address
+    q = forms.CharField(required=False, max_length=100, label="Search",
+                        widget=forms.TextInput(attrs={"placeholder": "Tracking number, name or address"}))
+
+
+class BulkLoadCSVForm(forms.Form):
+    file = forms.FileField(label="CSV file")
@@ -0,0 +1,201 @@
+# PostOffice_App/invoice_pdf.py
+# ==========================================================
+#  INVOICE PDFs — one cached file per invoice, rendered in parallel
+# ==========================================================
+#
+#  xhtml2pdf is single-threaded and slow, so every invoice is rendered on
+#  its own and kept in INVOICE_PDF_CACHE_DIR as "<id>_<updated_at>.pdf".
+#  invoice.updated_at changes with every header or item change (the item
+#  triggers touch it too), so a cached file is valid exactly as long as
+#  its name matches the invoice; older files of the same invoice are
+#  removed when it is re-rendered.
+#
+#  Only the missing files are rendered, in a pool of INVOICE_PDF_WORKERS
+#  processes (the HTML is built here, the workers only run pisa). A
+#  multi-invoice export is then the cached files concatenated with pypdf
+#  (installed with xhtml2pdf).
+#
+#  After editing invoices/pdf_template.html, empty INVOICE_PDF_CACHE_DIR.
+#
+#  Used by views/invoices.py (invoices_export_pdf, invoice_pdf) and the
+#  invoices_pdf background job (jobs.py).
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.template.loader import get_template
+from pypdf import PdfWriter
+from xhtml2pdf import pisa
+
+
+class InvoicePDFError(Exception):
+    """xhtml2pdf could not render an invoice."""
+
+
+def cache_dir():
+    return Path(settings.INVOICE_PDF_CACHE_DIR)
+
+
+def cache_path_for(invoice):
+    """Cache file of an invoice row (needs "id" and "updated_at")."""
+    stamp = invoice["updated_at"].astimezone(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    return cache_dir() / f"{invoice['id']}_{stamp}.pdf"
+
+
+def build_pdf_contexts(invoices):
+    """
+    Template data of each invoice row (a full v_invoices_with_items row):
+    items + subtotal/tax/total.
+
+    invoice.cost already contains subtotal + 23% tax (computed by triggers);
+    the breakdown is computed from the items here. Items of all the
+    invoices are fetched with a single query.
+    """
+    items_by_inv = {}
+
+    if invoices:
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, inv_id, shipment_type, weight, delivery_speed,
+                       quantity, unit_price, total_item_cost, notes
+                FROM invoice_item
+                WHERE inv_id = ANY(%s)
+                ORDER BY id
+                """,
+                [[inv["id"] for inv in invoices]],
+            )
+            item_columns = [col.name for col in cur.description]
+            for r in cur.fetchall():
+                item = dict(zip(item_columns, r))
+                items_by_inv.setdefault(item["inv_id"], []).append(item)
+
+    contexts = []
+    for inv in invoices:
+        items = items_by_inv.get(inv["id"], [])
+        subtotal = sum(item["total_item_cost"] or Decimal("0.00") for item in items)
+        tax = (subtotal * Decimal("0.23")).quantize(Decimal("0.01"))
+
+        contexts.append({
+            "invoice": inv,
+            "items": items,
+            "subtotal": subtotal,
+            "tax": tax,
+            "total": subtotal + tax,
+        })
+
+    return contexts
+
+
+def _render_to_file(html, path):
+    # Runs in a pool worker: pisa only, no Django or database access.
+    # Written to a temp name first, so a half-written file is never cached.
+    buffer = BytesIO()
+    status = pisa.CreatePDF(html, dest=buffer)
+    if status.err:
+        raise InvoicePDFError(f"Could not render {os.path.basename(path)}")
+
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _remove_stale(invoice_id, keep):
+    for old in cache_dir().glob(f"{invoice_id}_*.pdf"):
+        if old != keep:
+            old.unlink(missing_ok=True)
+
+
+def _load_invoice_rows(ids):
+    # Full header rows (name/address/contact...) of the invoices to render
+    with connection.cursor() as cur:
+        cur.execute("SELECT * FROM v_invoices_with_items WHERE id = ANY(%s)", [list(ids)])
+        columns = [col.name for col in cur.description]
+        return {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+
+
+def cached_pdf_paths(invoices):
+    """
+    Cache files of the given invoices (in the same order), rendering the
+    missing ones first.
+
+    Only "id" and "updated_at" of each row are used: the invoices to
+    render are read again from v_invoices_with_items here, so a cached
+    file always has the full header, whatever the caller selected.
+    """
+    paths = [cache_path_for(inv) for inv in invoices]
+    missing = [i for i, path in enumerate(paths) if not path.exists()]
+
+    if missing:
+        rows = _load_invoice_rows(invoices[i]["id"] for i in missing)
+
+        to_render = []
+        for i in missing:
+            row = rows.get(invoices[i]["id"])
+            if row is None:
+                raise InvoicePDFError(f"Invoice {invoices[i]['id']} no longer exists")
+            # Changed since the caller read it: the file of the new version
+            paths[i] = cache_path_for(row)
+            if not paths[i].exists():
+                to_render.append((row, paths[i]))
+
+        if to_render:
+            _render_missing(to_render)
+
+    return paths
+
+
+def _render_missing(to_render):
+    # to_render: [(full invoice row, cache path)]
+    cache_dir().mkdir(parents=True, exist_ok=True)
+    template = get_template("invoices/pdf_template.html")
+    jobs = [
+        (template.render({"invoices": [context]}), str(path))
+        for context, (_, path) in zip(
+            build_pdf_contexts([inv for inv, _ in to_render]), to_render,
+        )
+    ]
+
+    workers = min(settings.INVOICE_PDF_WORKERS, len(jobs))
+    if workers <= 1:
+        for html, path in jobs:
+            _render_to_file(html, path)
+    else:
+        # spawn: the workers must not inherit this process's database
+        # connections or threads (e.g. the tracking listener)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # list() re-raises the first failure
+            list(pool.map(_render_to_file, *zip(*jobs)))
+
+    for inv, path in to_render:
+        _remove_stale(inv["id"], path)
+
+
+def write_invoices_pdf(invoices, dest):
+    """Write one PDF with all the given invoice rows, in order, to dest."""
+    if not invoices:
+        # Same blank page as rendering the template with no invoices
+        html = get_template("invoices/pdf_template.html").render({"invoices": []})
+        if pisa.CreatePDF(html, dest=dest).err:
+            raise InvoicePDFError("Could not render an empty export")
+        return
+
+    concat_pdfs(cached_pdf_paths(invoices), dest)
+
+
+def concat_pdfs(paths, dest):
+    """Write the PDF files at paths, one after the other, to dest."""
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(str(path))
+    writer.write(dest)
@@ -0,0 +1,395 @@
+# PostOffice_App/jobs.py
+# ==========================================================
+#  BACKGROUND JOBS — PostgreSQL-backed queue (JOB table)
+# ==========================================================
+#
+#  Exports, JSON imports and the invoice PDF export can take minutes on
+#  big tables; run inside the request they hold a WSGI worker and hit
+#  proxy timeouts. The views can instead enqueue() a job and redirect to
+#  its page (views/jobs.py), which polls the progress and offers the
+#  artefact for download once the job is done.
+#
+#  Jobs are run by "manage.py run_jobs" (any number of processes, each
+#  with --concurrency threads). The queue itself is in the database
+#  (Logical_DB_Objects.sql, "BACKGROUND JOBS"): fn_claim_job hands each
+#  queued job to exactly one worker with FOR UPDATE SKIP LOCKED.
+#
+#  A job kind is a function registered with @job_kind("<kind>"); it gets
+#  a JobContext to report progress and to write its artefact.
+
+import csv
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+
+from .exports import export_csv_cell, export_json_value
+from .invoice_pdf import cached_pdf_paths, concat_pdfs, write_invoices_pdf
+from .notifications import create_notification
+from .reference_data import REFERENCE_QUERIES, invalidate_reference_data
+
+
+# kind -> function(ctx); filled by @job_kind
+JOB_KINDS = {}
+
+# Rows fetched per round trip by the export jobs
+EXPORT_BATCH_SIZE = 2000
+
+# Rows per CALL sp_import_<entity> in the import jobs
+IMPORT_CHUNK_SIZE = 1000
+
+# Invoices rendered between two progress updates of the PDF export
+PDF_CHUNK_SIZE = 100
+
+# entity -> view read by the export jobs (same as the synchronous exports)
+EXPORT_VIEWS = {
+    "invoices":   "v_invoices_export",
+    "vehicles":   "v_vehicles_export",
+    "routes":     "v_routes_export",
+    "warehouses": "v_warehouses_export",
+    "deliveries": "v_deliveries_full",
+}
+
+# entity -> JSON import procedure (sp_import_<entity>(p_data JSONB))
+IMPORT_PROCEDURES = {
+    "invoices": "sp_import_invoices",
+    "vehicles": "sp_import_vehicles",
+    "routes":   "sp_import_routes",
+}
+
+EXPORT_CONTENT_TYPES = {
+    "csv":  "text/csv",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """The job cannot be done (bad input...); the message is shown to the user."""
+
+
+def job_kind(kind):
+    def register(fn):
+        JOB_KINDS[kind] = fn
+        return fn
+    return register
+
+
+def files_dir():
+    return Path(settings.JOB_FILES_DIR)
+
+
+def uploads_dir():
+    return files_dir() / "uploads"
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+# ----------------------------------------------------------
+#  Enqueue (called by the views)
+# ----------------------------------------------------------
+
+def save_upload(uploaded_file):
+    """Store an uploaded file for a job; returns the name to put in its params."""
+    uploads_dir().mkdir(parents=True, exist_ok=True)
+    name = f"{uuid.uuid4().hex}{Path(uploaded_file.name).suffix.lower()}"
+    with open(uploads_dir() / name, "wb") as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    return name
+
+
+def enqueue(kind, params, created_by=None):
+    """Queue a job; returns its id. The job starts when a worker is free."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    with connection.cursor() as cur:
+        cur.execute(
+            "CALL sp_enqueue_job(%s, %s::jsonb, %s, NULL)",
+            [kind, json.dumps(params), created_by],
+        )
+        return cur.fetchone()[0]
+
+
+# ----------------------------------------------------------
+#  Running jobs (called by manage.py run_jobs)
+# ----------------------------------------------------------
+
+class JobContext:
+    """
+    What a job function sees: its id, params and creator, plus
+    progress() and result_path().
+
+    Progress goes through a connection of its own (autocommit), so it is
+    visible to the job page even while the job works inside a transaction.
+    """
+
+    def __init__(self, job):
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.params = job["params"]
+        self.created_by = job["created_by"]
+        self.result_file = None
+        self.result_name = None
+        self.content_type = None
+        self.message = None
+        self._progress_conn = None
+
+    def progress(self, done, total=None, message=None):
+        if self._progress_conn is None:
+            wrapper = connections["default"]
+            self._progress_conn = wrapper.get_new_connection(wrapper.get_connection_params())
+            self._progress_conn.autocommit = True
+
+        with self._progress_conn.cursor() as cur:
+            cur.execute(
+                "CALL sp_update_job_progress(%s, %s, %s, %s)",
+                [self.id, done, total, message],
+            )
+
+    def result_path(self, name, content_type):
+        """Path to write the artefact to; it is offered for download as `name`."""
+        files_dir().mkdir(parents=True, exist_ok=True)
+        self.result_file = f"{self.id}_{name}"
+        self.result_name = name
+        self.content_type = content_type
+        return files_dir() / self.result_file
+
+    def upload_path(self):
+        """The file saved by save_upload() for this job."""
+        name = self.params.get("upload") or ""
+        # save_upload() names are "<hex>.<ext>"; never leave uploads_dir()
+        if not name or Path(name).name != name:
+            raise JobError("The uploaded file is missing.")
+        return uploads_dir() / name
+
+    def close(self):
+        if self._progress_conn is not None:
+            self._progress_conn.close()
+            self._progress_conn = None
+
+
+def run_next_job(worker=None):
+    """Claim and run one queued job. Returns False when the queue was empty."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT * FROM fn_claim_job(%s)", [worker or worker_name()])
+        columns = [col.name for col in cur.description]
+        row = cur.fetchone()
+
+    if row is None:
+        return False
+
+    job = dict(zip(columns, row))
+    ctx = JobContext(job)
+    fn = JOB_KINDS.get(job["kind"])
+
+    try:
+        if fn is None:
+            raise JobError(f"Unknown job kind: {job['kind']}")
+        fn(ctx)
+    except Exception as e:
+        if not isinstance(e, (JobError, DatabaseError)):
+            logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+        with connection.cursor() as cur:
+            cur.execute("CALL sp_fail_job(%s, %s)", [job["id"], str(e) or type(e).__name__])
+        _notify(job, "job_failed", "Job failed", f"{job['kind']} job #{job['id']} failed: {e}")
+    else:
+        with connection.cursor() as cur:
+            cur.execute(
+                "CALL sp_finish_job(%s, %s, %s, %s, %s)",
+                [job["id"], ctx.result_file, ctx.result_name, ctx.content_type, ctx.message],
+            )
+        _notify(job, "job_done", "Job finished", f"{job['kind']} job #{job['id']} is done")
+    finally:
+        ctx.close()
+
+    return True
+
+
+def requeue_stale_jobs():
+    """Give the jobs of dead workers back to the queue; returns how many."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "CALL sp_requeue_stale_jobs(%s, %s, NULL)",
+            [settings.JOB_STALE_SECONDS, settings.JOB_MAX_ATTEMPTS],
+        )
+        return cur.fetchone()[0]
+
+
+def purge_old_jobs():
+    """Delete jobs (and their files) finished more than JOB_RETENTION_DAYS ago."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT result_file FROM fn_purge_jobs(%s)", [settings.JOB_RETENTION_DAYS])
+        files = [r[0] for r in cur.fetchall() if r[0]]
+
+    for name in files:
+        (files_dir() / name).unlink(missing_ok=True)
+    return len(files)
+
+
+def _notify(job, notification_type, subject, message):
+    if job["created_by"] is None:
+        return
+    with connection.cursor() as cur:
+        cur.execute('SELECT email FROM "USER" WHERE id = %s', [job["created_by"]])
+        row = cur.fetchone()
+    if row and row[0]:
+        create_notification(
+            notification_type=notification_type,
+            recipient_contact=row[0],
+            subject=subject,
+            message=message,
+            status="sent",
+        )
+
+
+# ----------------------------------------------------------
+#  Job kinds
+# ----------------------------------------------------------
+
+@job_kind("export")
+def export_job(ctx):
+    """params: {"entity": <EXPORT_VIEWS key>, "format": "csv" | "json" | "ndjson"}"""
+    entity = ctx.params.get("entity")
+    fmt = ctx.params.get("format")
+    view = EXPORT_VIEWS.get(entity)
+    if view is None or fmt not in EXPORT_CONTENT_TYPES:
+        raise JobError("Unknown export.")
+
+    path = ctx.result_path(f"{entity}_export.{fmt}", EXPORT_CONTENT_TYPES[fmt])
+
+    # One snapshot for the count and the rows; the named (server-side)
+    # cursor keeps one batch in memory at a time
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute(f"SELECT COUNT(*) FROM {view}")
+            total = cur.fetchone()[0]
+        ctx.progress(0, total)
+
+        with connection.chunked_cursor() as cur, open(path, "w", encoding="utf-8", newline="") as out:
+            cur.execute(f"SELECT * FROM {view} ORDER BY id")
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            columns = [col[0] for col in cur.description]
+
+            if fmt == "csv":
+                writer = csv.writer(out)
+                writer.writerow(columns)
+            elif fmt == "json":
+                out.write("[")
+
+            done = 0
+            while rows:
+                for row in rows:
+                    if fmt == "csv":
+                        # Same cells as the synchronous exports (exports.py)
+                        writer.writerow([export_csv_cell(entity, v) for v in row])
+                    else:
+                        # json: one array; ndjson: one object per line
+                        if fmt == "json":
+                            out.write(",\n" if done else "\n")
+                        out.write(json.dumps(
+                            {c: export_json_value(entity, v) for c, v in zip(columns, row)}, default=str,
+                        ))
+                        if fmt == "ndjson":
+                            out.write("\n")
+                    done += 1
+                ctx.progress(done)
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+
+            if fmt == "json":
+                out.write("\n]\n" if done else "]\n")
+
+    ctx.message = f"Exported {done} {entity}."
+
+
+@job_kind("import_json")
+def import_json_job(ctx):
+    """params: {"entity": <IMPORT_PROCEDURES key>, "upload": <save_upload() name>}"""
+    procedure = IMPORT_PROCEDURES.get(ctx.params.get("entity"))
+    if procedure is None:
+        raise JobError("Unknown import.")
+
+    path = ctx.upload_path()
+    try:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            raise JobError("The file is not valid JSON.")
+
+        if not isinstance(data, list):
+            raise JobError("The JSON file must contain a list.")
+
+        # Strip id fields to avoid PK conflicts (nested invoice items too)
+        for item in data:
+            if isinstance(item, dict):
+                item.pop("id", None)
+                items = item.get("items")
+                if isinstance(items, list):
+                    for sub in items:
+                        if isinstance(sub, dict):
+                            sub.pop("id", None)
+
+        ctx.progress(0, len(data))
+
+        # All or nothing, like the synchronous import
+        with transaction.atomic(), connection.cursor() as cur:
+            for start in range(0, len(data), IMPORT_CHUNK_SIZE):
+                chunk = data[start:start + IMPORT_CHUNK_SIZE]
+                cur.execute(f"CALL {procedure}(%s::jsonb)", [json.dumps(chunk)])
+                ctx.progress(start + len(chunk))
+
+        if ctx.params["entity"] in REFERENCE_QUERIES:
+            invalidate_reference_data(ctx.params["entity"])
+        ctx.message = f"Imported {len(data)} {ctx.params['entity']}."
+    finally:
+        path.unlink(missing_ok=True)
+
+
+@job_kind("invoices_pdf")
+def invoices_pdf_job(ctx):
+    """params: {"client_id": <id> | null}  (null = every invoice)"""
+    client_id = ctx.params.get("client_id")
+    with connection.cursor() as cur:
+        # Same rows as the synchronous export (invoices_export_pdf)
+        if client_id is not None:
+            cur.execute(
+                "SELECT * FROM v_invoices_with_items WHERE client_id = %s "
+                "ORDER BY created_at DESC, id DESC",
+                [client_id],
+            )
+        else:
+            cur.execute("SELECT * FROM v_invoices_with_items ORDER BY created_at DESC, id DESC")
+        columns = [col.name for col in cur.description]
+        invoices = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    path = ctx.result_path("invoices.pdf", "application/pdf")
+    ctx.progress(0, len(invoices))
+
+    if not invoices:
+        with open(path, "wb") as out:
+            write_invoices_pdf([], out)
+        return
+
+    # Render (or find in the cache) chunk by chunk, for the progress bar
+    paths = []
+    for start in range(0, len(invoices), PDF_CHUNK_SIZE):
+        paths.extend(cached_pdf_paths(invoices[start:start + PDF_CHUNK_SIZE]))
+        ctx.progress(len(paths))
+
+    with open(path, "wb") as out:
+        concat_pdfs(paths, out)
+
+    ctx.message = f"Exported {len(invoices)} invoices."
@@ -0,0 +1,45 @@
+# ==========================================================
+#  manage.py benchmark <name> [--rows N]
+# ==========================================================
+#  Runs one of the "before vs after" benchmarks in PostOffice_App/benchmarks.py.
+#  Nothing is kept: every run is rolled back. Point it at a copy of the
+#  production database to get representative numbers.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from PostOffice_App.benchmarks import BENCHMARKS, run_benchmark
+
+
+class Command(BaseCommand):
+    help = "Time database objects before/after an optimisation (the run is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "name", choices=sorted(BENCHMARKS),
+            help="; ".join(f"{name}: {desc}" for name, (_, desc) in sorted(BENCHMARKS.items())),
+        )
+        parser.add_argument("--rows", type=int, default=5000, help="Rows to generate (default 5000)")
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1:
+            raise CommandError("--rows must be at least 1.")
+
+        try:
+            results = run_benchmark(options["name"], options["rows"])
+        except DatabaseError as e:
+            raise CommandError(f"Benchmark failed: {e}")
+
+        # Speedups are relative to the first variant of the same size
+        # ("before/100" vs "after/100"; plain "before"/"after" share one)
+        baselines = {}
+
+        for variant, seconds, operations in results:
+            rate = operations / seconds if seconds else float("inf")
+            line = f"{variant:<14} {seconds * 1000:10.1f} ms  {rate:12.0f} ops/s"
+            size = variant.partition("/")[2]
+            if size not in baselines:
+                baselines[size] = seconds
+            elif seconds:
+                line += f"  ({baselines[size] / seconds:.2f}x)"
+            self.stdout.write(line)
@@ -0,0 +1,34 @@
+# ==========================================================
+#  manage.py bulk_load <entity> <file.csv>
+# ==========================================================
+#  Command-line entry point for PostOffice_App/bulk_load.py, for files
+#  too large to upload through the browser.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from PostOffice_App.bulk_load import BULK_LOAD_ENTITIES, BulkLoadError, load_csv
+
+
+class Command(BaseCommand):
+    help = "Bulk-load a CSV file (with header) via COPY into deliveries, routes, vehicles, warehouses or invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("entity", choices=sorted(BULK_LOAD_ENTITIES))
+        parser.add_argument("path", help="CSV file; the header row names the columns")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as fileobj:
+                result = load_csv(options["entity"], fileobj)
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        except BulkLoadError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {result.loaded} of {result.total} {result.entity}."
+        ))
+        if result.rejects_path:
+            self.stdout.write(self.style.WARNING(
+                f"Rejected {result.rejected} rows; see {result.rejects_path}"
+            ))
@@ -0,0 +1,110 @@
+# ==========================================================
+#  manage.py maintain_tracking_partitions
+# ==========================================================
+#  Housekeeping for the monthly delivery_tracking partitions
+#  (Logical_DB_Objects.sql, "TRACKING PARTITIONS"). Run it daily, e.g.
+#      0 3 * * *  python manage.py maintain_tracking_partitions
+#    1) creates the partitions for the next TRACKING_PARTITIONS_AHEAD months;
+#    2) every month older than TRACKING_RETENTION_MONTHS is detached,
+#       dumped to TRACKING_ARCHIVE_DIR/<partition>.csv.gz and dropped.
+#  Each step commits on its own: the detach only holds its lock for an
+#  instant, and a month whose dump fails stays detached (not dropped)
+#  until the next run archives it.
+
+import gzip
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+
+PARTITION_RE = re.compile(r"^delivery_tracking_[0-9]{4}_[0-9]{2}$")
+
+
+class Command(BaseCommand):
+    help = "Create upcoming delivery_tracking partitions and archive the ones past retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=settings.TRACKING_PARTITIONS_AHEAD,
+            help="Months to create ahead of the current one",
+        )
+        parser.add_argument(
+            "--retention", type=int, default=settings.TRACKING_RETENTION_MONTHS,
+            help="Months of history to keep online, besides the current one",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only list the partitions that would be archived",
+        )
+
+    def handle(self, *args, **options):
+        if options["retention"] < 1:
+            raise CommandError("--retention must be at least 1.")
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "CALL sp_create_tracking_partitions(%s, NULL);",
+                    [options["ahead"]],
+                )
+                created = cursor.fetchone()[0]
+
+                cursor.execute(
+                    "SELECT partition_name, is_attached "
+                    "FROM fn_tracking_partitions_to_archive(%s);",
+                    [options["retention"]],
+                )
+                expired = cursor.fetchall()
+        except DatabaseError as e:
+            raise CommandError(f"Partition maintenance failed: {e}")
+
+        self.stdout.write(f"Created {created} partition(s).")
+
+        archive_dir = Path(settings.TRACKING_ARCHIVE_DIR)
+
+        for name, is_attached in expired:
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {name}.")
+                continue
+
+            try:
+                if is_attached:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        cursor.execute("CALL sp_detach_tracking_partition(%s);", [name])
+
+                path = self.dump_partition(name, archive_dir)
+
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute("CALL sp_drop_tracking_partition(%s);", [name])
+            except (DatabaseError, OSError) as e:
+                raise CommandError(f"Archiving {name} failed: {e}")
+
+            self.stdout.write(self.style.SUCCESS(f"Archived {name} to {path}"))
+
+    def dump_partition(self, name, archive_dir):
+        """COPY a detached month table into <archive_dir>/<name>.csv.gz."""
+        # name comes from fn_tracking_partitions_to_archive; checked again
+        # because it is interpolated into the COPY statement
+        if not PARTITION_RE.match(name):
+            raise CommandError(f"Unexpected partition name: {name}")
+
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        path = archive_dir / f"{name}.csv.gz"
+        partial = archive_dir / f"{name}.csv.gz.part"
+
+        # Write aside, then rename: a crash never leaves a truncated archive
+        # under the final name (and the table is only dropped afterwards)
+        with transaction.atomic(), connection.cursor() as cursor:
+            with gzip.open(partial, "wt", encoding="utf-8", newline="") as out:
+                cursor.copy_expert(
+                    f"COPY (SELECT * FROM {name} ORDER BY created_at, id) "
+                    f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                    out,
+                )
+        os.replace(partial, path)
+
+        return path
@@ -0,0 +1,100 @@
+# ==========================================================
+#  manage.py run_jobs [--concurrency N] [--once]
+# ==========================================================
+#  Runs the background jobs queued by the views (PostOffice_App/jobs.py).
+#  Start it next to the web server, e.g. under systemd/supervisor:
+#      python manage.py run_jobs --concurrency 4
+#  Each of the N threads claims one job at a time (FOR UPDATE SKIP LOCKED,
+#  so several run_jobs processes can share the queue) and sleeps
+#  JOB_POLL_SECONDS when the queue is empty. Jobs of workers that died
+#  are queued again after JOB_STALE_SECONDS without progress; finished
+#  jobs and their files are purged after JOB_RETENTION_DAYS.
+#  Ctrl+C / SIGTERM: running jobs finish, no new ones are started.
+
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from PostOffice_App.jobs import purge_old_jobs, requeue_stale_jobs, run_next_job
+
+
+# Seconds between two stale-job / purge sweeps
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (exports, imports, PDF exports)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.JOB_WORKERS,
+            help=f"Jobs run in parallel by this process (default {settings.JOB_WORKERS})",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exit when the queue is empty instead of waiting for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+
+        self.stop = threading.Event()
+        self.once = options["once"]
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+
+        self.housekeeping()
+
+        threads = [
+            threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True)
+            for i in range(options["concurrency"])
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            last_sweep = time.monotonic()
+            while any(t.is_alive() for t in threads):
+                time.sleep(1)
+                if not self.once and time.monotonic() - last_sweep >= HOUSEKEEPING_INTERVAL:
+                    self.housekeeping()
+                    last_sweep = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping: waiting for the running jobs...")
+            self.stop.set()
+            for t in threads:
+                t.join()
+        finally:
+            connection.close()
+
+    def housekeeping(self):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Queued {requeued} job(s) of lost workers again.")
+        purged = purge_old_jobs()
+        if purged:
+            self.stdout.write(f"Purged {purged} old job file(s).")
+
+    def work(self):
+        # One Django connection per thread; closed when the thread ends
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                try:
+                    ran = run_next_job()
+                except Exception as e:
+                    # e.g. the database restarted; try again after a pause
+                    self.stderr.write(f"Worker error: {e}")
+                    connection.close()
+                    ran = False
+
+                if not ran:
+                    if self.once:
+                        return
+                    self.stop.wait(settings.JOB_POLL_SECONDS)
+        finally:
+            connection.close()
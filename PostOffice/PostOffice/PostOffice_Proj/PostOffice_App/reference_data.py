@@ -0,0 +1,112 @@
+# PostOffice_App/reference_data.py
+# ==========================================================
+#  REFERENCE DATA — cached (id, label) lists for the form dropdowns
+# ==========================================================
+#
+#  InvoiceForm and RouteForm fill their FK dropdowns with warehouses,
+#  staff, clients, drivers and vehicles. Those lists change rarely, so
+#  each one is read once and kept in the Django cache (settings.CACHES)
+#  for REFERENCE_DATA_CACHE_TTL seconds: building a form costs no query.
+#
+#  Views that change a list through its sp_* procedures (and the CSV bulk
+#  loads and JSON import jobs) call invalidate_reference_data() right after
+#  the CALL. With the default per-process cache that only reaches the
+#  process that made the change: other workers, run_jobs and changes made
+#  straight in SQL show up after at most the TTL.
+#
+#  A submitted value is checked against the cached list; only a value
+#  missing from it triggers a fresh read (ReferenceChoiceField in
+#  forms.py), so a row created by another worker is accepted. A warehouse
+#  or vehicle deactivated through the app is rejected at once in that
+#  process (invalidate_reference_data), elsewhere after at most the TTL.
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+
+EMPTY_CHOICE = ("", "---------")
+
+# name -> query returning (id, label) rows, in display order
+REFERENCE_QUERIES = {
+    # Warehouses — only active ones
+    "warehouses": "SELECT id, name FROM warehouse WHERE is_active = true ORDER BY name",
+
+    # Staff members — join employee_staff → USER to get full name
+    "staff": """
+        SELECT es.id, u.first_name || ' ' || u.last_name
+        FROM employee_staff es
+        JOIN "USER" u ON u.id = es.id
+        ORDER BY u.first_name
+    """,
+
+    # Clients — join client → USER to get full name
+    "clients": """
+        SELECT c.id, u.first_name || ' ' || u.last_name
+        FROM client c
+        JOIN "USER" u ON u.id = c.id
+        ORDER BY u.first_name
+    """,
+
+    # Drivers — employee_driver JOIN USER to get full name
+    "drivers": """
+        SELECT ed.id, u.first_name || ' ' || u.last_name
+        FROM employee_driver ed
+        JOIN "USER" u ON u.id = ed.id
+        ORDER BY u.first_name
+    """,
+
+    # Vehicles — active vehicles with plate + brand/model
+    "vehicles": """
+        SELECT id, plate_number || ' (' || brand || ' ' || model || ')'
+        FROM vehicle
+        WHERE is_active = true
+        ORDER BY plate_number
+    """,
+}
+
+# Lists that show user names: any USER / employee / client change
+PEOPLE = ("staff", "clients", "drivers")
+
+
+def _cache_key(name):
+    return f"refdata:{name}"
+
+
+def reference_choices(*names, refresh=False):
+    """
+    {name: [("", "---------"), (id, label), ...]} for the given lists.
+    Cached lists come from a single cache lookup; only the missing ones
+    are queried (and cached). refresh=True queries (and re-caches) all
+    of them.
+    """
+    keys = {name: _cache_key(name) for name in names}
+    cached = {} if refresh else cache.get_many(keys.values())
+
+    result = {}
+    missing = []
+    for name, key in keys.items():
+        if key in cached:
+            result[name] = cached[key]
+        else:
+            missing.append(name)
+
+    if missing:
+        loaded = {}
+        with connection.cursor() as cur:
+            for name in missing:
+                cur.execute(REFERENCE_QUERIES[name])
+                loaded[name] = [EMPTY_CHOICE] + [(r[0], r[1]) for r in cur.fetchall()]
+
+        cache.set_many(
+            {keys[name]: choices for name, choices in loaded.items()},
+            settings.REFERENCE_DATA_CACHE_TTL,
+        )
+        result.update(loaded)
+
+    return result
+
+
+def invalidate_reference_data(*names):
+    """Drop the given cached lists (all of them when called without names)."""
+    cache.delete_many([_cache_key(name) for name in (names or REFERENCE_QUERIES)])
@@ -1,3 +1,248 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from .exports import export_csv_cell, export_json_value
+from .forms import InvoiceItemFormSet
+from .tracking_numbers import is_valid_tracking_number, luhn_check_digit
+from .views.deliveries import (
+    INT4_MAX,
+    clean_delivery_import_row,
+    clean_status_scan,
+    decode_page_cursor,
+    encode_page_cursor,
+    parse_positive_int,
+)
+from .views.invoices import diff_invoice_items
+
+
+# Pure helpers: SimpleTestCase, no database needed. Stored procedures:
+# TestCase on the test database, with DDL.sql + Logical_DB_Objects.sql
+# loaded on top of the migrations (as in the README setup).
+
+REPO_ROOT = Path(__file__).resolve().parents[4]
+
+
+def load_sql_schema(cursor):
+    for name in ("DDL.sql", "Logical_DB_Objects.sql"):
+        cursor.execute((REPO_ROOT / name).read_text(encoding="utf-8"))
+
+
+class TrackingNumberTests(SimpleTestCase):
+    def test_luhn_check_digit(self):
+        # Textbook example: 7992739871 -> 3
+        self.assertEqual(luhn_check_digit("7992739871"), 3)
+        self.assertEqual(luhn_check_digit("2026010100042"), 6)
+
+    def test_generated_numbers_need_the_right_check_digit(self):
+        self.assertTrue(is_valid_tracking_number("PO-20260101-00042-6"))
+        self.assertFalse(is_valid_tracking_number("PO-20260101-00042-7"))
+
+    def test_legacy_and_custom_numbers(self):
+        self.assertTrue(is_valid_tracking_number("PO-20260101-00042"))
+        self.assertTrue(is_valid_tracking_number("TRK-2026-000001"))
+
+    def test_malformed_numbers(self):
+        for value in ("", None, "ab", "-PO-1", "PO 123", "x" * 51,
+                      "TRK-2026-000001\n", "PO-20260101-00042-6\n"):
+            self.assertFalse(is_valid_tracking_number(value), value)
+
+
+class ExportFormattingTests(SimpleTestCase):
+    def test_raw_entities(self):
+        self.assertEqual(export_csv_cell("deliveries", True), "True")
+        self.assertEqual(export_csv_cell("deliveries", None), "")
+        self.assertEqual(export_json_value("deliveries", Decimal("1.50")), Decimal("1.50"))
+
+    def test_typed_entities(self):
+        created_at = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+        self.assertEqual(export_csv_cell("vehicles", False), "false")
+        self.assertEqual(export_csv_cell("invoices", created_at), "2026-03-01T12:30:00+00:00")
+        self.assertEqual(export_json_value("invoices", Decimal("1.50")), 1.5)
+
+    def test_route_durations_read_back_as_hh_mm_ss(self):
+        duration = timedelta(days=1, hours=2, minutes=5)
+        self.assertEqual(export_csv_cell("routes", duration), "26:05:00")
+        self.assertEqual(export_json_value("routes", duration), "26:05:00")
+
+
+class PageCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        token = encode_page_cursor(created_at, 42)
+        self.assertEqual(decode_page_cursor(token), (created_at, 42))
+
+    def test_missing_or_garbled_token_means_first_page(self):
+        for token in (None, "", "not-base64!", "bm9waXBl", encode_page_cursor(datetime(2026, 1, 1), 1)[:-4]):
+            self.assertIsNone(decode_page_cursor(token), token)
+
+
+class ParsePositiveIntTests(SimpleTestCase):
+    def test_accepted(self):
+        self.assertEqual(parse_positive_int(12), 12)
+        self.assertEqual(parse_positive_int("12"), 12)
+        self.assertEqual(parse_positive_int(INT4_MAX), INT4_MAX)
+
+    def test_rejected(self):
+        for value in (0, -1, INT4_MAX + 1, str(INT4_MAX + 1), True, 1.5, "1.5",
+                      "²", " 1", "1\n", "", None, [1], {"id": 1}):
+            self.assertIsNone(parse_positive_int(value), repr(value))
+
+
+class CleanStatusScanTests(SimpleTestCase):
+    def test_by_delivery_id(self):
+        row, error = clean_status_scan({"delivery_id": "12", "status": "ready", "notes": "dock 3"})
+        self.assertIsNone(error)
+        self.assertEqual(row, {"delivery_id": 12, "status": "ready", "notes": "dock 3"})
+
+    def test_by_tracking_number(self):
+        row, error = clean_status_scan({"tracking_number": "PO-20260101-00042-6", "status": "pending"})
+        self.assertIsNone(error)
+        self.assertEqual(row, {"tracking_number": "PO-20260101-00042-6", "status": "pending"})
+
+    def test_bad_scans_are_rejected_not_raised(self):
+        bad = [
+            "not an object",
+            {"status": "ready"},
+            {"delivery_id": "²", "status": "ready"},
+            {"delivery_id": INT4_MAX + 1, "status": "ready"},
+            {"delivery_id": True, "status": "ready"},
+            {"delivery_id": 1, "status": ["ready"]},
+            {"delivery_id": 1, "status": {"a": 1}},
+            {"delivery_id": 1, "status": "lost"},
+            {"tracking_number": "PO-20260101-00042-7", "status": "ready"},
+        ]
+        for item in bad:
+            row, error = clean_status_scan(item)
+            self.assertIsNone(row, item)
+            self.assertTrue(error, item)
+
+
+class CleanDeliveryImportRowTests(SimpleTestCase):
+    def test_valid_row(self):
+        row, errors = clean_delivery_import_row({
+            "war_id": "3", "weight": 2.0, "status": "registered",
+            "recipient_email": "a@example.com", "tracking_number": "TRK-2026-000001",
+        })
+        self.assertEqual(errors, {})
+        self.assertEqual(row["war_id"], 3)
+        self.assertEqual(row["weight"], 2)
+        self.assertEqual(row["status"], "registered")
+
+    def test_per_field_errors(self):
+        row, errors = clean_delivery_import_row({
+            "weight": 1.5,
+            "war_id": INT4_MAX + 1,
+            "status": ["registered"],
+            "priority": {"a": 1},
+            "description": ["x"],
+        })
+        self.assertEqual(set(errors), {"weight", "war_id", "status", "priority", "description"})
+        self.assertEqual(row, {})
+
+
+class DiffInvoiceItemsTests(SimpleTestCase):
+    existing = [
+        {"id": 1, "shipment_type": "box", "weight": Decimal("1.00"), "delivery_speed": "",
+         "quantity": 1, "unit_price": Decimal("5.00"), "notes": None},
+        {"id": 2, "shipment_type": "letter", "weight": None, "delivery_speed": None,
+         "quantity": 2, "unit_price": Decimal("1.50"), "notes": None},
+        {"id": 3, "shipment_type": "box", "weight": None, "delivery_speed": None,
+         "quantity": 1, "unit_price": Decimal("9.00"), "notes": None},
+    ]
+
+    def formset(self, rows):
+        data = {
+            "form-TOTAL_FORMS": str(len(rows)),
+            "form-INITIAL_FORMS": "0",
+            "form-MIN_NUM_FORMS": "0",
+            "form-MAX_NUM_FORMS": "1000",
+        }
+        for i, row in enumerate(rows):
+            for field, value in row.items():
+                data[f"form-{i}-{field}"] = value
+        formset = InvoiceItemFormSet(data)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        return formset
+
+    def test_diff(self):
+        formset = self.formset([
+            # unchanged ("" and None are the same)
+            {"id": "1", "shipment_type": "box", "weight": "1.00", "quantity": "1", "unit_price": "5.00"},
+            # changed quantity
+            {"id": "2", "shipment_type": "letter", "quantity": "3", "unit_price": "1.50"},
+            # deleted
+            {"id": "3", "shipment_type": "box", "quantity": "1", "unit_price": "9.00", "DELETE": "on"},
+            # new
+            {"shipment_type": "parcel", "quantity": "4", "unit_price": "2.00"},
+            # new and deleted at once: nothing to do
+            {"shipment_type": "parcel", "quantity": "1", "unit_price": "2.00", "DELETE": "on"},
+            # not an item of this invoice (e.g. deleted concurrently): ignored
+            {"id": "99", "shipment_type": "box", "quantity": "1", "unit_price": "1.00"},
+            # blank extra row
+            {},
+        ])
+
+        deleted_ids, updated, inserted = diff_invoice_items(self.existing, formset)
+
+        self.assertEqual(deleted_ids, [3])
+        self.assertEqual([u["id"] for u in updated], [2])
+        self.assertEqual(updated[0]["quantity"], 3)
+        self.assertEqual(len(inserted), 1)
+        self.assertEqual(inserted[0]["shipment_type"], "parcel")
+        self.assertEqual(inserted[0]["quantity"], 4)
+        self.assertNotIn("id", inserted[0])
+
+
+class BulkUpdateDeliveryStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cur:
+            load_sql_schema(cur)
+            cur.execute(
+                "INSERT INTO delivery (tracking_number, status) VALUES ('TRK-TEST-000001', 'registered') RETURNING id"
+            )
+            cls.registered_id = cur.fetchone()[0]
+            cur.execute(
+                "INSERT INTO delivery (tracking_number, status) VALUES ('TRK-TEST-000002', NULL) RETURNING id"
+            )
+            cls.no_status_id = cur.fetchone()[0]
+
+    def bulk_update(self, items, warehouse_id=None):
+        with connection.cursor() as cur:
+            cur.execute(
+                "CALL sp_bulk_update_delivery_status(%s::jsonb, %s, %s, NULL)",
+                [json.dumps(items), None, warehouse_id],
+            )
+            results = cur.fetchone()[0]
+        return {r["delivery_id"]: r for r in results}
+
+    def test_null_status_delivery_is_rejected_on_its_own(self):
+        results = self.bulk_update([
+            {"delivery_id": self.registered_id, "status": "ready"},
+            {"delivery_id": self.no_status_id, "status": "ready"},
+        ])
+
+        self.assertEqual(results[self.registered_id]["result"], "updated")
+        self.assertEqual(results[self.no_status_id]["result"], "rejected")
+        self.assertEqual(results[self.no_status_id]["error"], "Invalid status transition: (none) -> ready")
+
+        with connection.cursor() as cur:
+            cur.execute("SELECT id, status FROM delivery WHERE id = ANY(%s)",
+                        [[self.registered_id, self.no_status_id]])
+            self.assertEqual(dict(cur.fetchall()), {self.registered_id: "ready", self.no_status_id: None})
+
+    def test_unknown_warehouse_does_not_abort_the_batch(self):
+        results = self.bulk_update([{"delivery_id": self.registered_id, "status": "ready"}], warehouse_id=999999)
+
+        self.assertEqual(results[self.registered_id]["result"], "updated")
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT war_id FROM delivery_tracking WHERE del_id = %s AND status = 'ready'",
+                [self.registered_id],
+            )
+            self.assertEqual(cur.fetchall(), [(None,)])
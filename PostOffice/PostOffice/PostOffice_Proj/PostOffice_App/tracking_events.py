@@ -0,0 +1,204 @@
+# PostOffice_App/tracking_events.py
+# ==========================================================
+#  LIVE TRACKING — LISTEN/NOTIFY fanned out to SSE streams
+# ==========================================================
+#
+#  fn_trg_delivery_tracking_log and sp_bulk_update_delivery_status send
+#      pg_notify('delivery_tracking', {"delivery_id", "tracking_number", "status"})
+#  for every status change; PostgreSQL delivers it when the change commits.
+#
+#  Each worker process runs ONE listener thread on its own connection
+#  (LISTEN cannot share Django's per-request connections). It hands every
+#  notification to the in-process queues of the SSE streams watching that
+#  tracking number (deliveries_tracking_events in views/deliveries.py), so
+#  live tracking costs one idle connection per worker instead of a polling
+#  query per client every few seconds.
+#
+#  The thread starts with the first subscriber and then lives as long as
+#  the process; if the connection drops it reconnects after RECONNECT_DELAY.
+#
+#  Under WSGI every open stream holds a worker thread, so streams are
+#  opt-in on the page, short (SSE_MAX_AGE) and capped per process
+#  (SSE_MAX_STREAMS); the page polls with ETag / 304 otherwise.
+
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from django.db import connections
+
+
+CHANNEL = "delivery_tracking"
+
+# Seconds between reconnection attempts of the listener
+RECONNECT_DELAY = 5
+
+# Seconds the listener waits on the socket before checking it again
+POLL_TIMEOUT = 5
+
+# Events buffered per stream; a client that stops reading misses the rest
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# SSE: comment line every SSE_KEEPALIVE seconds (keeps proxies from timing
+# out and lets the server notice a closed tab). After SSE_MAX_AGE seconds
+# the stream sends an "end" event and closes; the page then goes back to
+# polling instead of reconnecting. At most SSE_MAX_STREAMS streams per
+# process: past that, open_stream() returns None (the view answers 503).
+SSE_KEEPALIVE = 15
+SSE_MAX_AGE = 60
+SSE_MAX_STREAMS = 8
+SSE_RETRY_MS = 3000
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_subscribers = {}   # tracking_number -> set of queue.Queue
+_callbacks = []     # fn(event), called by the listener for every event
+_listener = None
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+def on_event(fn):
+    """Decorator: call fn(event) for every notification this worker receives."""
+    _callbacks.append(fn)
+    return fn
+
+
+def subscribe(tracking_number):
+    """Return a queue that receives the events of tracking_number."""
+    events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(tracking_number, set()).add(events)
+        _start_listener()
+    return events
+
+
+def unsubscribe(tracking_number, events):
+    with _lock:
+        queues = _subscribers.get(tracking_number)
+        if queues is not None:
+            queues.discard(events)
+            if not queues:
+                del _subscribers[tracking_number]
+
+
+def open_stream(tracking_number):
+    """
+    Iterable for a StreamingHttpResponse (text/event-stream), or None when
+    this process already serves SSE_MAX_STREAMS streams.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        return None
+    return _SSEStream(tracking_number)
+
+
+class _SSEStream:
+    # An object rather than a bare generator: Django calls close() when
+    # the response ends, even if the stream was never iterated, so the
+    # slot is always given back.
+
+    def __init__(self, tracking_number):
+        self.tracking_number = tracking_number
+        self.closed = False
+
+    def __iter__(self):
+        return _sse_events(self.tracking_number)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            _stream_slots.release()
+
+
+def _sse_events(tracking_number):
+    # One "status" event per status change of tracking_number, "end" when
+    # the stream reaches SSE_MAX_AGE
+    events = subscribe(tracking_number)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+
+        deadline = time.monotonic() + SSE_MAX_AGE
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield "event: end\ndata: {}\n\n"
+                return
+            try:
+                event = events.get(timeout=min(SSE_KEEPALIVE, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: status\ndata: {json.dumps(event)}\n\n"
+    finally:
+        unsubscribe(tracking_number, events)
+
+
+# ----------------------------------------------------------
+#  Listener thread
+# ----------------------------------------------------------
+
+def _start_listener():
+    # called with _lock held
+    global _listener
+    if _listener is None or not _listener.is_alive():
+        _listener = threading.Thread(
+            target=_listen_forever, name="tracking-events-listener", daemon=True,
+        )
+        _listener.start()
+
+
+def _listen_forever():
+    while True:
+        try:
+            _listen()
+        except Exception:
+            logger.exception("Tracking listener lost its connection, reconnecting")
+        time.sleep(RECONNECT_DELAY)
+
+
+def _listen():
+    wrapper = connections["default"]
+    # A raw driver connection, outside Django's request/transaction handling
+    conn = wrapper.get_new_connection(wrapper.get_connection_params())
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL};")
+
+        while True:
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                _dispatch(conn.notifies.pop(0).payload)
+    finally:
+        conn.close()
+
+
+def _dispatch(payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+
+    tracking_number = event.get("tracking_number")
+    if not tracking_number:
+        return
+
+    for fn in _callbacks:
+        try:
+            fn(event)
+        except Exception:
+            logger.exception("Tracking event callback failed")
+
+    with _lock:
+        queues = list(_subscribers.get(tracking_number, ()))
+
+    for events in queues:
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass
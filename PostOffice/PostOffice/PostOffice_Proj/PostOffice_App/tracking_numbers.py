@@ -0,0 +1,58 @@
+# PostOffice_App/tracking_numbers.py
+# ==========================================================
+#  TRACKING NUMBER FORMAT + CHECK DIGIT
+# ==========================================================
+#
+#  Generated numbers (fn_generate_tracking_number in the DB) look like
+#  PO-YYYYMMDD-XXXXX-C, where C is the Luhn check digit of YYYYMMDD+XXXXX.
+#  Legacy generated numbers (PO-YYYYMMDD-XXXXX) and custom ones typed in
+#  the delivery forms (e.g. TRK-2026-000001) stay valid, but every number
+#  must match TRACKING_NUMBER_RE.
+#
+#  The public tracking page checks numbers here first, so a typo or a
+#  garbage URL never costs a database round trip.
+
+import re
+
+from django.core.exceptions import ValidationError
+
+
+# Letters, digits and dashes; 3-50 chars (DELIVERY.TRACKING_NUMBER is VARCHAR(50))
+TRACKING_NUMBER_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]{2,49}")
+
+# Generated format with check digit (same regex as fn_is_valid_tracking_number)
+GENERATED_TRACKING_RE = re.compile(r"PO-([0-9]{8})-([0-9]{5,})-([0-9])")
+
+
+def luhn_check_digit(digits):
+    """Luhn (mod 10) check digit; same algorithm as fn_tracking_check_digit."""
+    total = 0
+    # From the right: double every second digit, starting with the rightmost
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 0:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return (10 - total % 10) % 10
+
+
+def is_valid_tracking_number(value):
+    if not value or not TRACKING_NUMBER_RE.fullmatch(value):
+        return False
+
+    m = GENERATED_TRACKING_RE.fullmatch(value)
+    if m:
+        return luhn_check_digit(m.group(1) + m.group(2)) == int(m.group(3))
+
+    return True
+
+
+def validate_tracking_number(value):
+    """Form validator (empty values are left to required=...)."""
+    if value and not is_valid_tracking_number(value):
+        raise ValidationError(
+            "Enter a valid tracking number (letters, digits and dashes; "
+            "PO-YYYYMMDD-XXXXX-C numbers must have the right check digit)."
+        )
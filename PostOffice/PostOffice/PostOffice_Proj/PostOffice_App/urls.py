@@ -14,6 +14,8 @@ from .views import (
     routes,
     deliveries,
     notifications,
+    bulk_load,
+    jobs,
 )
 
 
@@ -42,6 +44,8 @@ urlpatterns = [
     path("invoices/create/",                       invoices.invoice_create, name="invoice_create"),
     path("invoices/<int:invoice_id>/edit/",        invoices.invoice_edit,   name="invoice_edit"),
     path("invoices/<int:invoice_id>/delete/",      invoices.invoice_delete, name="invoice_delete"),
+    path("invoices/<int:invoice_id>/items/",       invoices.invoice_items_json, name="invoice_items_json"),
+    path("invoices/<int:invoice_id>/pdf/",         invoices.invoice_pdf,    name="invoice_pdf"),
     path("invoices/import/json/",                  invoices.invoices_import_json, name="invoices_import_json"),
     path("invoices/export/json/",                  invoices.invoices_export_json, name="invoices_export_json"),
     path("invoices/export/csv/",                   invoices.invoices_export_csv,  name="invoices_export_csv"),
@@ -102,17 +106,34 @@ urlpatterns = [
     # DELIVERIES
     # ======================================================
     path("deliveries/", deliveries.deliveries_list, name="deliveries_list"),
+    path("deliveries/search/", deliveries.deliveries_search, name="deliveries_search"),
     path("deliveries/new/", deliveries.deliveries_create, name="deliveries_create"),
     path("deliveries/<int:delivery_id>/", deliveries.deliveries_detail, name="deliveries_detail"),
     path("deliveries/<int:delivery_id>/edit/", deliveries.deliveries_edit, name="deliveries_edit"),
     path("deliveries/<int:delivery_id>/status/", deliveries.deliveries_update_status, name="deliveries_update_status"),
+    path("deliveries/status/bulk/", deliveries.deliveries_bulk_update_status, name="deliveries_bulk_update_status"),
     path("deliveries/<int:delivery_id>/delete/", deliveries.deliveries_delete, name="deliveries_delete"),
+    path("tracking/batch/", deliveries.deliveries_tracking_batch, name="deliveries_tracking_batch"),
     path("tracking/<str:tracking_number>/", deliveries.deliveries_tracking, name="deliveries_tracking"),
+    path("tracking/<str:tracking_number>/events/", deliveries.deliveries_tracking_events, name="deliveries_tracking_events"),
     path("deliveries/<int:delivery_id>/tracking/", deliveries.delivery_tracking_view, name="delivery_tracking_view"),
     path("deliveries/import/json/", deliveries.deliveries_import_json, name="deliveries_import_json"),
     path("deliveries/export/json/", deliveries.deliveries_export_json, name="deliveries_export_json"),
     path("deliveries/export/csv/", deliveries.deliveries_export_csv, name="deliveries_export_csv"),
 
+    # ======================================================
+    # CSV BULK LOAD (COPY into stg_* + sp_bulk_load_*)
+    # ======================================================
+    path("bulk-load/rejects/<str:load_id>/", bulk_load.bulk_load_rejects, name="bulk_load_rejects"),
+    path("bulk-load/<str:entity>/", bulk_load.bulk_load_csv, name="bulk_load_csv"),
+
+    # ======================================================
+    # BACKGROUND JOBS (queued exports/imports, manage.py run_jobs)
+    # ======================================================
+    path("jobs/<int:job_id>/", jobs.job_detail, name="job_detail"),
+    path("jobs/<int:job_id>/status/", jobs.job_status, name="job_status"),
+    path("jobs/<int:job_id>/download/", jobs.job_download, name="job_download"),
+
     # ======================================================
     # Notifications (MongoDB)
     # ======================================================
@@ -0,0 +1,90 @@
+# ==========================================================
+#  CSV BULK LOAD — upload page + error file download
+# ==========================================================
+#
+#  The heavy lifting is in PostOffice_App/bulk_load.py:
+#  COPY FROM STDIN into stg_*, then CALL sp_bulk_load_<entity>.
+#  Very large files are better loaded with "manage.py bulk_load".
+
+import re
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import DatabaseError
+from django.http import FileResponse, Http404, HttpResponseBadRequest
+from django.shortcuts import render
+
+from ..bulk_load import BULK_LOAD_ENTITIES, BulkLoadError, load_csv, rejects_path_for
+from ..forms import BulkLoadCSVForm
+from ..reference_data import REFERENCE_QUERIES, invalidate_reference_data
+from .decorators import role_required
+
+
+LOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+# ----------------------------------------------------------
+#  UPLOAD   (URL: /bulk-load/<entity>/   name: "bulk_load_csv")
+# ----------------------------------------------------------
+#  entity: deliveries | routes | vehicles | warehouses | invoices
+#  The page shows loaded/rejected counts and, when rows were rejected,
+#  a link to the error file (same columns + row_no + reject_reason).
+
+@login_required
+@role_required(["admin", "manager"])
+def bulk_load_csv(request, entity):
+    spec = BULK_LOAD_ENTITIES.get(entity)
+    if spec is None:
+        raise Http404("Unknown entity.")
+
+    result = None
+
+    if request.method == "POST":
+        form = BulkLoadCSVForm(request.POST, request.FILES)
+
+        if not form.is_valid():
+            return HttpResponseBadRequest("No file uploaded or invalid form.")
+
+        try:
+            result = load_csv(entity, form.cleaned_data["file"])
+        except BulkLoadError as e:
+            messages.error(request, str(e))
+        except DatabaseError as e:
+            # e.g. a row with more fields than the header; nothing was loaded
+            messages.error(request, f"Load failed, nothing was imported: {e}")
+        else:
+            if entity in REFERENCE_QUERIES:
+                invalidate_reference_data(entity)
+            messages.success(request, f"Loaded {result.loaded} of {result.total} {entity}.")
+            if result.rejected:
+                messages.warning(request, f"Rejected {result.rejected} rows; download the error file below.")
+
+    return render(request, "bulk_load/upload.html", {
+        "form": BulkLoadCSVForm(),
+        "entity": entity,
+        "columns": spec["columns"],
+        "result": result,
+    })
+
+
+# ----------------------------------------------------------
+#  ERROR FILE   (URL: /bulk-load/rejects/<load_id>/   name: "bulk_load_rejects")
+# ----------------------------------------------------------
+
+@login_required
+@role_required(["admin", "manager"])
+def bulk_load_rejects(request, load_id):
+    # load_id is a uuid4 hex; anything else could escape REJECTS_DIR
+    if not LOAD_ID_RE.match(load_id):
+        raise Http404("Unknown load.")
+
+    path = rejects_path_for(load_id)
+    if not path.exists():
+        raise Http404("Unknown load.")
+
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=f"rejects_{load_id}.csv",
+        content_type="text/csv",
+    )
@@ -4,6 +4,8 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 
+from ..reference_data import invalidate_reference_data
+
 
 # ==========================================================
 # DASHBOARD — No ORM, uses DB objects only
@@ -26,7 +28,7 @@ def dashboard(request):
 
 def employees_list(request):
     with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM v_employees_full;")
+        cursor.execute("SELECT * FROM v_employees_full ORDER BY full_name;")
         columns = [col[0] for col in cursor.description]
         employees = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
@@ -63,6 +65,7 @@ def employees_create(request):
                         ]
                     )
 
+            invalidate_reference_data("staff", "drivers")
             messages.success(request, "Employee created successfully.")
             return redirect("employees_list")
         except Exception as e:
@@ -99,6 +102,7 @@ def employees_update(request, employee_id):
                         ]
                     )
 
+            invalidate_reference_data("staff", "drivers")
             messages.success(request, "Employee updated successfully.")
         except Exception as e:
             messages.error(request, str(e))
@@ -112,6 +116,7 @@ def employees_delete(request, employee_id):
             with transaction.atomic():
                 with connection.cursor() as cursor:
                     cursor.execute("CALL sp_delete_employee(%s);", [employee_id])
+            invalidate_reference_data("staff", "drivers")
             messages.success(request, "Employee deleted successfully.")
         except Exception as e:
             messages.error(request, str(e))
@@ -126,7 +131,7 @@ def employees_delete(request, employee_id):
 @login_required
 def clients_list(request):
     with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM v_clients;")
+        cursor.execute("SELECT * FROM v_clients ORDER BY full_name;")
         columns = [col[0].lower() for col in cursor.description]  # lowercase
         clients = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
@@ -153,6 +158,7 @@ def clients_create(request):
                             p_id       # INOUT id
                         ]
                     )
+            invalidate_reference_data("clients")
             messages.success(request, "Client created successfully.")
             return redirect("clients_list")
         except Exception as e:
@@ -180,6 +186,7 @@ def clients_update(request, client_id):
                             request.POST.get("is_active") == "true"
                         ]
                     )
+            invalidate_reference_data("clients")
             messages.success(request, "Client updated successfully.")
         except Exception as e:
             messages.error(request, str(e))
@@ -194,6 +201,7 @@ def clients_delete(request, client_id):
             with transaction.atomic():
                 with connection.cursor() as cursor:
                     cursor.execute("CALL sp_delete_user(%s);", [client_id])
+            invalidate_reference_data("clients")
             messages.success(request, "Client deleted successfully.")
         except Exception as e:
             messages.error(request, str(e))
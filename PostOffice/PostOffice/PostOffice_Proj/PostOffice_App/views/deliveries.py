@@ -3,15 +3,29 @@
 #  DELIVERIES (SQL-FIRST, NO ORM) + FORMS VALIDATION
 # ==========================================================
 
+import base64
+import binascii
 import csv
+import hashlib
 import json
+import re
+from collections import Counter
+from datetime import datetime, time, timedelta
 from io import StringIO
 
-from django.db import connection
+from django.db import DatabaseError, connection, transaction
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_POST
 
 # IMPORTANT: deliveries.py is inside PostOffice_App/views/
 # forms.py is in PostOffice_App/
@@ -20,7 +34,20 @@ from ..forms import (
     DeliveryEditForm,
     DeliveryStatusUpdateForm,
     DeliveryImportJSONForm,   # if you created it; if not, remove and see note below
+    DeliveryListFilterForm,
+    DeliverySearchForm,
 )
+from .. import tracking_events
+from ..exports import export_csv_cell, export_json_value
+from ..tracking_numbers import is_valid_tracking_number
+from .decorators import role_required
+from .jobs import enqueue_job
+
+# Rows per page on the admin/staff deliveries list (keyset pagination)
+DELIVERIES_PAGE_SIZE = 25
+
+# Rows fetched per round trip by the server-side cursor used in exports
+EXPORT_BATCH_SIZE = 2000
 
 
 # ----------------------------------------------------------
@@ -32,26 +59,262 @@ def dictfetchall(cursor):
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
+def stream_query(sql, params=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Run sql on a named (server-side) cursor and yield the column names,
+    then one list of rows per batch of batch_size.
+
+    The transaction keeps the cursor non-holdable: PostgreSQL produces rows
+    as we FETCH them instead of materialising the whole result at DECLARE,
+    so memory stays flat and the first batch arrives immediately.
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        # a named cursor only has a description after the first FETCH
+        rows = cursor.fetchmany(batch_size)
+        yield [col[0] for col in cursor.description]
+        while rows:
+            yield rows
+            rows = cursor.fetchmany(batch_size)
+
+
+# Largest INT4: ids and FK columns; a bigger value fails the whole ::INT cast
+INT4_MAX = 2147483647
+
+# ASCII digits only ("²".isdigit() is True, but int("²") fails)
+WHOLE_NUMBER_RE = re.compile(r"[0-9]+")
+
+
+def parse_positive_int(value):
+    """A JSON int or a string of digits in 1..INT4_MAX, as int; else None."""
+    if isinstance(value, str) and WHOLE_NUMBER_RE.fullmatch(value):
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    if not 1 <= value <= INT4_MAX:
+        return None
+    return value
+
+
+def encode_page_cursor(created_at, delivery_id):
+    # Opaque "next page" token: the (created_at, id) of the last row shown
+    raw = f"{created_at.isoformat()}|{delivery_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_page_cursor(token):
+    # Returns (created_at, id), or None for a missing/garbled token (-> first page)
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        created_at, delivery_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(delivery_id)
+    except (ValueError, binascii.Error):
+        return None
+
+
+def delivery_filter_sql(cd):
+    """
+    Build the WHERE clauses for DeliveryListFilterForm.cleaned_data.
+    Each filter has a matching (col, created_at, id) index on delivery
+    (see DDL.sql), so filtering + paging stays an index range scan.
+    Returns (clauses, params).
+    """
+    clauses, params = [], []
+
+    for field in ("status", "priority", "war_id", "driver_id"):
+        value = cd.get(field)
+        if value not in (None, ""):
+            clauses.append(f"{field} = %s")
+            params.append(value)
+
+    # Whole days in the app time zone: [date_from 00:00, date_to + 1 day 00:00)
+    if cd.get("date_from"):
+        clauses.append("created_at >= %s")
+        params.append(timezone.make_aware(datetime.combine(cd["date_from"], time.min)))
+    if cd.get("date_to"):
+        clauses.append("created_at < %s")
+        params.append(timezone.make_aware(datetime.combine(cd["date_to"] + timedelta(days=1), time.min)))
+
+    return clauses, params
+
+
 # ----------------------------------------------------------
 # LIST DELIVERIES
 # ----------------------------------------------------------
+#  Admin/staff: keyset pagination on (created_at, id) DESC plus the
+#  DeliveryListFilterForm filters, all pushed into SQL. Only one page
+#  (+1 row to know whether a next page exists) leaves PostgreSQL, so
+#  a deep page costs the same as the first one.
 
 @login_required
 def deliveries_list(request):
     role = request.user.role
     user_id = request.user.id
 
-    with connection.cursor() as cursor:
-        if role == "client":
-            cursor.execute("SELECT * FROM fn_get_client_deliveries(%s);", [user_id])
-        elif role == "employee":
-            cursor.execute("SELECT * FROM fn_get_driver_deliveries(%s);", [user_id])
-        else:
-            cursor.execute("SELECT * FROM v_deliveries_full;")
+    if role in ("client", "employee"):
+        with connection.cursor() as cursor:
+            if role == "client":
+                cursor.execute("SELECT * FROM fn_get_client_deliveries(%s);", [user_id])
+            else:
+                cursor.execute("SELECT * FROM fn_get_driver_deliveries(%s);", [user_id])
+
+            deliveries = dictfetchall(cursor)
+
+        return render(request, "deliveries/list.html", {"deliveries": deliveries})
+
+    filter_form = DeliveryListFilterForm(request.GET)
+    cd = filter_form.cleaned_data if filter_form.is_valid() else {}
+
+    clauses, params = delivery_filter_sql(cd)
 
+    after = decode_page_cursor(request.GET.get("cursor"))
+    if after:
+        clauses.append("(created_at, id) < (%s, %s)")
+        params.extend(after)
+
+    sql = "SELECT * FROM v_deliveries_full"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT %s;"
+    params.append(DELIVERIES_PAGE_SIZE + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
         deliveries = dictfetchall(cursor)
 
-    return render(request, "deliveries/list.html", {"deliveries": deliveries})
+    # Links keep the current filters; "next" only swaps the cursor
+    next_url = None
+    if len(deliveries) > DELIVERIES_PAGE_SIZE:
+        deliveries = deliveries[:DELIVERIES_PAGE_SIZE]
+        last = deliveries[-1]
+        query = request.GET.copy()
+        query["cursor"] = encode_page_cursor(last["created_at"], last["id"])
+        next_url = "?" + query.urlencode()
+
+    first_query = request.GET.copy()
+    first_query.pop("cursor", None)
+
+    return render(request, "deliveries/list.html", {
+        "deliveries": deliveries,
+        "filter_form": filter_form,
+        "next_url": next_url,
+        "first_url": "?" + first_query.urlencode(),
+        "is_first_page": after is None,
+    })
+
+
+# ----------------------------------------------------------
+# SEARCH DELIVERIES
+# ----------------------------------------------------------
+#  /deliveries/search/?q=...&page=N  (add &format=json for the JSON API)
+#  Matches tracking number, sender/recipient name and recipient address:
+#    - every word of q as a prefix against delivery.search_vector
+#      (GIN DELIVERY_SEARCH_IDX), ranked with ts_rank (weights A/B/C);
+#    - q as a substring of tracking_number (GIN DELIVERY_TRACKING_TRGM_IDX),
+#      so partial numbers like "00042" are found too.
+#  Both branches are index scans (BitmapOr); only one page is fetched.
+#  Clients only see their own deliveries, drivers the ones assigned to them.
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
+
+# Trigrams need at least 3 characters to narrow anything down
+SEARCH_MIN_SUBSTRING = 3
+
+
+def search_tsquery(q):
+    # "ana sil" -> "ana:* & sil:*"; only word characters reach to_tsquery
+    words = re.findall(r"[^\W_]+", q)
+    return " & ".join(f"{w}:*" for w in words) or None
+
+
+def like_pattern(q):
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+@login_required
+def deliveries_search(request):
+    form = DeliverySearchForm(request.GET)
+    q = form.cleaned_data["q"].strip() if form.is_valid() else ""
+
+    try:
+        page = min(max(int(request.GET.get("page", 1)), 1), SEARCH_MAX_PAGE)
+    except ValueError:
+        page = 1
+
+    results, has_next = [], False
+    tsquery = search_tsquery(q)
+
+    if tsquery or len(q) >= SEARCH_MIN_SUBSTRING:
+        # to_tsquery(NULL) is NULL: rank 0, no full-text match
+        matches = []
+        params = [tsquery]
+        if tsquery:
+            matches.append("d.search_vector @@ to_tsquery('simple', %s)")
+            params.append(tsquery)
+        if len(q) >= SEARCH_MIN_SUBSTRING:
+            matches.append("d.tracking_number ILIKE %s")
+            params.append(like_pattern(q))
+
+        scope = ""
+        if request.user.role == "client":
+            scope = " AND d.client_id = %s"
+            params.append(request.user.id)
+        elif request.user.role in ("driver", "employee"):
+            scope = " AND d.driver_id = %s"
+            params.append(request.user.id)
+
+        params.extend([q, SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT
+                    d.id,
+                    d.tracking_number,
+                    d.sender_name,
+                    d.recipient_name,
+                    d.recipient_address,
+                    d.status,
+                    d.priority,
+                    d.created_at,
+                    COALESCE(ts_rank(d.search_vector, to_tsquery('simple', %s)), 0) AS rank
+                FROM delivery d
+                WHERE ({" OR ".join(matches)}){scope}
+                ORDER BY
+                    (d.tracking_number = %s) DESC,  -- exact tracking number first
+                    rank DESC,
+                    d.id DESC
+                LIMIT %s OFFSET %s;
+                """,
+                params,
+            )
+            results = dictfetchall(cursor)
+
+        has_next = len(results) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGE
+        results = results[:SEARCH_PAGE_SIZE]
+
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "q": q,
+            "page": page,
+            "has_next": has_next,
+            "results": [
+                dict(r, created_at=r["created_at"].isoformat() if r["created_at"] else None, rank=float(r["rank"]))
+                for r in results
+            ],
+        })
+
+    return render(request, "deliveries/search.html", {
+        "form": form,
+        "q": q,
+        "results": results,
+        "page": page,
+        "has_next": has_next,
+    })
 
 
 # ----------------------------------------------------------
@@ -200,6 +463,9 @@ def deliveries_edit(request, delivery_id):
                         ],
                     )
 
+                # old and new number: the tracking number itself may have changed
+                invalidate_tracking_cache(delivery.get("tracking_number"), cd.get("tracking_number"))
+
                 messages.success(request, "Delivery updated successfully.")
                 return redirect("deliveries_detail", delivery_id=delivery_id)
 
@@ -262,11 +528,13 @@ def deliveries_update_status(request, delivery_id):
         cd = form.cleaned_data
         try:
             with connection.cursor() as cursor:
+                # delivery_tracking_read (public tracking page) is kept in
+                # sync by triggers, so no REFRESH is needed here
                 cursor.execute(
                     "CALL sp_update_delivery_status(%s, %s);",
                     [delivery_id, cd["status"]],
                 )
-                cursor.execute("REFRESH MATERIALIZED VIEW mv_delivery_tracking;")
+                invalidate_delivery_tracking_cache(cursor, delivery_id)
             messages.success(request, "Delivery status updated.")
         except Exception as e:
             # IMPORTANTE: esto te dice la verdad
@@ -278,6 +546,131 @@ def deliveries_update_status(request, delivery_id):
 
 
 
+# ----------------------------------------------------------
+# BULK STATUS UPDATE (SCANNERS)
+# ----------------------------------------------------------
+#  POST application/json:
+#    {"warehouse_id": 3,                      (optional, scanning location)
+#     "items": [{"delivery_id": 12, "status": "ready", "notes": "..."},
+#               {"tracking_number": "PO-20260101-00042-7", "status": "pending"},
+#               ...]}
+#  Malformed items are rejected here; the rest go to
+#  sp_bulk_update_delivery_status in ONE call: one transaction, one
+#  UPDATE on delivery and one INSERT into delivery_tracking for the batch.
+#  Response: {"updated": n, "unchanged": n, "rejected": n, "results": [...]}
+#  with one result per item, in input order.
+
+BULK_STATUS_MAX_ITEMS = 5000
+
+
+def clean_status_scan(item):
+    """Shape-check one scan. Returns (row, error) — row is None when rejected."""
+    if not isinstance(item, dict):
+        return None, "Expected a JSON object."
+
+    row = {}
+
+    delivery_id = item.get("delivery_id")
+    tracking_number = item.get("tracking_number")
+    if delivery_id not in (None, ""):
+        delivery_id = parse_positive_int(delivery_id)
+        if delivery_id is None:
+            return None, "delivery_id must be a positive whole number."
+        row["delivery_id"] = delivery_id
+    elif tracking_number not in (None, ""):
+        if not isinstance(tracking_number, str) or not is_valid_tracking_number(tracking_number):
+            return None, "Invalid tracking number."
+        row["tracking_number"] = tracking_number
+    else:
+        return None, "delivery_id or tracking_number is required."
+
+    status = item.get("status")
+    if not isinstance(status, str) or status not in DELIVERY_IMPORT_CHOICES["status"]:
+        return None, f"Invalid status: {status}."
+    row["status"] = status
+
+    notes = item.get("notes")
+    if notes not in (None, ""):
+        row["notes"] = str(notes)
+
+    return row, None
+
+
+@login_required
+@role_required(["admin", "manager", "staff"])
+@require_POST
+def deliveries_bulk_update_status(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "Body must contain a non-empty \"items\" list."}, status=400)
+    if len(items) > BULK_STATUS_MAX_ITEMS:
+        return JsonResponse({"error": f"At most {BULK_STATUS_MAX_ITEMS} items per request."}, status=400)
+
+    warehouse_id = payload.get("warehouse_id")
+    if warehouse_id not in (None, ""):
+        # Same rule as delivery_id in clean_status_scan
+        warehouse_id = parse_positive_int(warehouse_id)
+        if warehouse_id is None:
+            return JsonResponse({"error": "warehouse_id must be a positive whole number."}, status=400)
+    else:
+        warehouse_id = None
+
+    results = [None] * len(items)
+    batch, positions = [], []
+
+    for index, item in enumerate(items):
+        row, error = clean_status_scan(item)
+        if error:
+            results[index] = {
+                "item": index + 1,
+                "delivery_id": item.get("delivery_id") if isinstance(item, dict) else None,
+                "tracking_number": item.get("tracking_number") if isinstance(item, dict) else None,
+                "old_status": None,
+                "new_status": item.get("status") if isinstance(item, dict) else None,
+                "result": "rejected",
+                "error": error,
+            }
+        else:
+            batch.append(row)
+            positions.append(index)
+
+    if batch:
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "CALL sp_bulk_update_delivery_status(%s::jsonb, %s, %s, NULL);",
+                    [json.dumps(batch), request.user.id, warehouse_id],
+                )
+                db_results = cursor.fetchone()[0]
+        except Exception as e:
+            return JsonResponse({"error": f"Bulk status update failed: {e}"}, status=400)
+
+        if isinstance(db_results, str):
+            db_results = json.loads(db_results)
+
+        # SQL numbers items 1..len(batch); map back to the request positions
+        for result in db_results:
+            index = positions[result["item"] - 1]
+            result["item"] = index + 1
+            results[index] = result
+
+    changed = [r["tracking_number"] for r in results if r["result"] == "updated"]
+    invalidate_tracking_cache(*changed)
+
+    counts = Counter(r["result"] for r in results)
+    return JsonResponse({
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "rejected": counts["rejected"],
+        "results": results,
+    })
+
+
 # ----------------------------------------------------------
 # DELETE DELIVERY (SOFT DELETE)
 # ----------------------------------------------------------
@@ -288,6 +681,7 @@ def deliveries_delete(request, delivery_id):
         try:
             with connection.cursor() as cursor:
                 cursor.execute("CALL sp_delete_delivery(%s);", [delivery_id])
+                invalidate_delivery_tracking_cache(cursor, delivery_id)
 
             messages.success(request, "Delivery cancelled successfully.")
         except Exception as e:
@@ -299,15 +693,47 @@ def deliveries_delete(request, delivery_id):
 # ----------------------------------------------------------
 # DELIVERIES EXPORT JSON
 # ----------------------------------------------------------
+#  Both modes stream from a server-side cursor (stream_query), so the
+#  worker only ever holds one batch:
+#    ?format=json    (default) one JSON array, one compact object per line
+#                    — still a valid file for deliveries_import_json
+#    ?format=ndjson  newline-delimited JSON, one object per line, so
+#                    consumers can process records while downloading
+#  With ?background=1 either format is written by the export job instead.
+
+def iter_delivery_json_lines():
+    # One compact JSON object per exported delivery, in id order
+    batches = stream_query("SELECT * FROM v_deliveries_full ORDER BY id;")
+    columns = next(batches)
+    for rows in batches:
+        for row in rows:
+            yield json.dumps({c: export_json_value("deliveries", v) for c, v in zip(columns, row)}, default=str)
+
 
 @login_required
 def deliveries_export_json(request):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM v_deliveries_full ORDER BY id;")
-        deliveries = dictfetchall(cursor)
-
-    json_data = json.dumps(deliveries, default=str, indent=4)
-    response = HttpResponse(json_data, content_type="application/json")
+    fmt = "ndjson" if request.GET.get("format") == "ndjson" else "json"
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "deliveries", "format": fmt})
+
+    if fmt == "ndjson":
+        def generate():
+            for line in iter_delivery_json_lines():
+                yield line + "\n"
+
+        response = StreamingHttpResponse(generate(), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="deliveries_export.ndjson"'
+        return response
+
+    def generate():
+        separator = "[\n"
+        for line in iter_delivery_json_lines():
+            yield separator + line
+            separator = ",\n"
+        # separator is still "[\n" when there were no rows
+        yield "[]\n" if separator == "[\n" else "\n]\n"
+
+    response = StreamingHttpResponse(generate(), content_type="application/json")
     response["Content-Disposition"] = 'attachment; filename="deliveries_export.json"'
     return response
 
@@ -315,12 +741,213 @@ def deliveries_export_json(request):
 # ----------------------------------------------------------
 # DELIVERIES IMPORT JSON (WITH VALIDATION)
 # ----------------------------------------------------------
+#  Fast path for large partner manifests:
+#    1) validate_delivery_batch() checks every row in one pass in Python
+#       (same rules as DeliveryCreateForm + the DDL CHECKs) and resolves
+#       every FK with one "= ANY(array)" query per referenced table;
+#    2) the valid rows go to sp_import_deliveries(jsonb) in chunks of
+#       IMPORT_CHUNK_SIZE, i.e. one round trip per chunk, not per row,
+#       and one set-based INSERT per chunk in the database (the tracking
+#       events come from statement-level triggers);
+#    3) the user gets a per-row error report instead of a skip count.
+
+IMPORT_CHUNK_SIZE = 5000
+
+# Rows shown in the error report on the import page
+IMPORT_REPORT_LIMIT = 200
+
+DELIVERY_IMPORT_INT_FIELDS = ("driver_id", "route_id", "inv_id", "client_id", "war_id", "weight")
+
+# field -> max length (None = TEXT column)
+DELIVERY_IMPORT_STR_FIELDS = {
+    "tracking_number": 50,
+    "description": None,
+    "sender_name": 100,
+    "sender_address": None,
+    "sender_phone": 20,
+    "sender_email": 100,
+    "recipient_name": 100,
+    "recipient_address": None,
+    "recipient_phone": 20,
+    "recipient_email": 100,
+    "item_type": 20,
+    "dimensions": 50,
+}
+
+# Allowed values come from the DDL CHECK constraints, not the form choices,
+# so a row that passes here cannot fail the batch in the database.
+DELIVERY_IMPORT_CHOICES = {
+    "status": {"registered", "ready", "pending", "in_transit", "completed", "cancelled"},
+    "priority": {"normal", "urgent"},
+}
+
+# FK column -> table holding the referenced ids
+DELIVERY_IMPORT_FK_TABLES = {
+    "driver_id": "employee_driver",
+    "route_id": "route",
+    "inv_id": "invoice",
+    "client_id": "client",
+    "war_id": "warehouse",
+}
+
+
+def clean_delivery_import_row(item):
+    """
+    Validate one JSON object. Returns (row, errors) where row holds only
+    known fields, converted to JSON-safe values for sp_import_deliveries.
+    """
+    row, errors = {}, {}
+
+    for field in DELIVERY_IMPORT_INT_FIELDS:
+        value = item.get(field)
+        if value in (None, ""):
+            continue
+        # 3.0 is a whole number, 1.5 is not (no silent truncation)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        parsed = parse_positive_int(value)
+        if parsed is None:
+            errors[field] = f"Enter a whole number between 1 and {INT4_MAX}."
+            continue
+        row[field] = parsed
+
+    for field, max_length in DELIVERY_IMPORT_STR_FIELDS.items():
+        value = item.get(field)
+        if value in (None, ""):
+            continue
+        if isinstance(value, (list, dict)):
+            errors[field] = "Enter a text value."
+            continue
+        value = str(value).strip()
+        if max_length and len(value) > max_length:
+            errors[field] = f"Ensure this value has at most {max_length} characters."
+            continue
+        if field == "tracking_number" and not is_valid_tracking_number(value):
+            errors[field] = "Enter a valid tracking number."
+            continue
+        if field.endswith("_email"):
+            try:
+                validate_email(value)
+            except ValidationError:
+                errors[field] = "Enter a valid email address."
+                continue
+        row[field] = value
+
+    for field, allowed in DELIVERY_IMPORT_CHOICES.items():
+        value = item.get(field)
+        if value in (None, ""):
+            continue
+        if not isinstance(value, str) or value not in allowed:
+            errors[field] = f"Select a valid choice. {value} is not one of the available choices."
+            continue
+        row[field] = value
+
+    value = item.get("delivery_date")
+    if value not in (None, ""):
+        try:
+            parsed = parse_datetime(str(value)) or parse_date(str(value))
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            errors["delivery_date"] = "Enter a valid date/time."
+        else:
+            if not isinstance(parsed, datetime):
+                parsed = datetime.combine(parsed, time.min)
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            row["delivery_date"] = parsed.isoformat()
+
+    return row, errors
+
+
+def validate_delivery_batch(data):
+    """
+    Validate a whole import batch.
+    Returns (valid, report): valid is a list of (index, row) ready for
+    sp_import_deliveries, report a list of {"row", "errors"} dicts
+    (row numbers are 1-based positions in the uploaded list).
+    """
+    cleaned, report = [], []
+
+    for index, item in enumerate(data):
+        if not isinstance(item, dict):
+            report.append({"row": index + 1, "errors": {"__all__": "Expected a JSON object."}})
+            continue
+        row, errors = clean_delivery_import_row(item)
+        if errors:
+            report.append({"row": index + 1, "errors": errors})
+        else:
+            cleaned.append((index, row))
+
+    # Resolve each FK column with a single ANY(array) lookup for the whole batch
+    missing = {}
+    with connection.cursor() as cursor:
+        for field, table in DELIVERY_IMPORT_FK_TABLES.items():
+            ids = sorted({row[field] for _, row in cleaned if field in row})
+            if not ids:
+                continue
+            cursor.execute(f"SELECT id FROM {table} WHERE id = ANY(%s);", [ids])
+            found = {r[0] for r in cursor.fetchall()}
+            missing[field] = set(ids) - found
+
+        # tracking_number is unique (DELIVERY_TRACKING_NUMBER_UK): one lookup for the batch
+        numbers = [row["tracking_number"] for _, row in cleaned if "tracking_number" in row]
+        taken = set()
+        if numbers:
+            cursor.execute(
+                "SELECT tracking_number FROM delivery WHERE tracking_number = ANY(%s);",
+                [sorted(set(numbers))],
+            )
+            taken = {r[0] for r in cursor.fetchall()}
+        repeated = {n for n, count in Counter(numbers).items() if count > 1}
+
+    valid = []
+    for index, row in cleaned:
+        errors = {
+            field: f"{DELIVERY_IMPORT_FK_TABLES[field]} with id {row[field]} not found."
+            for field, ids in missing.items()
+            if row.get(field) in ids
+        }
+        number = row.get("tracking_number")
+        if number in taken:
+            errors["tracking_number"] = f"Tracking number {number} already exists."
+        elif number in repeated:
+            errors["tracking_number"] = f"Tracking number {number} is repeated in the file."
+        if errors:
+            report.append({"row": index + 1, "errors": errors})
+        else:
+            valid.append((index, row))
+
+    report.sort(key=lambda r: r["row"])
+    return valid, report
+
+
+def import_delivery_chunk(chunk, report):
+    """
+    CALL sp_import_deliveries for chunk (a list of (index, row)) on its own
+    savepoint. If the database rejects it, each half is retried, down to
+    single rows, so only the failing rows are left out and each error is
+    reported against its own row. Returns the number of rows imported.
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CALL sp_import_deliveries(%s::jsonb);",
+                [json.dumps([row for _, row in chunk])],
+            )
+        return len(chunk)
+    except DatabaseError as e:
+        if len(chunk) == 1:
+            report.append({"row": chunk[0][0] + 1, "errors": {"__all__": str(e)}})
+            return 0
+
+    middle = len(chunk) // 2
+    return import_delivery_chunk(chunk[:middle], report) + import_delivery_chunk(chunk[middle:], report)
+
 
 @login_required
 def deliveries_import_json(request):
     if request.method == "POST":
-        # If you didn't create DeliveryImportJSONForm, replace this block with:
-        # file = request.FILES.get("file") ...
         form = DeliveryImportJSONForm(request.POST, request.FILES)
 
         if not form.is_valid():
@@ -336,70 +963,27 @@ def deliveries_import_json(request):
         if not isinstance(data, list):
             return HttpResponseBadRequest("JSON must contain a list of deliveries.")
 
+        valid, report = validate_delivery_batch(data)
+
+        # One CALL per chunk; a chunk the DB still rejects (e.g. a row
+        # deleted concurrently) is bisected, see import_delivery_chunk.
         created_count = 0
-        skipped_count = 0
+        with transaction.atomic():
+            for start in range(0, len(valid), IMPORT_CHUNK_SIZE):
+                created_count += import_delivery_chunk(valid[start:start + IMPORT_CHUNK_SIZE], report)
 
-        with connection.cursor() as cursor:
-            for item in data:
-                if not isinstance(item, dict):
-                    skipped_count += 1
-                    continue
-
-                # Validate each item with the SAME form rules
-                item_form = DeliveryCreateForm(item)
-                if not item_form.is_valid():
-                    skipped_count += 1
-                    continue
-
-                cd = item_form.cleaned_data
-                try:
-                    cursor.execute(
-                        """
-                        CALL sp_create_delivery(
-                            %s, %s, %s, %s, %s,
-                            %s, %s,
-                            %s, %s, %s, %s,
-                            %s, %s, %s, %s,
-                            %s, %s, %s,
-                            %s, %s,
-                            %s,
-                            %s
-                        );
-                        """,
-                        [
-                            cd.get("driver_id"),
-                            cd.get("route_id"),
-                            cd.get("inv_id"),
-                            cd.get("client_id"),
-                            cd.get("war_id"),
-                            cd.get("tracking_number"),
-                            cd.get("description"),
-                            cd.get("sender_name"),
-                            cd.get("sender_address"),
-                            cd.get("sender_phone"),
-                            cd.get("sender_email"),
-                            cd.get("recipient_name"),
-                            cd.get("recipient_address"),
-                            cd.get("recipient_phone"),
-                            cd.get("recipient_email"),
-                            cd.get("item_type"),
-                            cd.get("weight"),
-                            cd.get("dimensions"),
-                            cd.get("status"),
-                            cd.get("priority"),
-                            cd.get("delivery_date"),
-                            None,  # OUT p_id
-                        ],
-                    )
-                    created_count += 1
-                except Exception:
-                    skipped_count += 1
-                    continue
+        report.sort(key=lambda r: r["row"])
 
         if created_count:
             messages.success(request, f"Imported {created_count} deliveries successfully.")
-        if skipped_count:
-            messages.warning(request, f"Skipped {skipped_count} invalid deliveries.")
+        if report:
+            messages.warning(request, f"Rejected {len(report)} of {len(data)} deliveries; see the report below.")
+            return render(request, "deliveries/import.html", {
+                "form": DeliveryImportJSONForm(),
+                "report": report[:IMPORT_REPORT_LIMIT],
+                "report_total": len(report),
+                "report_truncated": len(report) > IMPORT_REPORT_LIMIT,
+            })
 
         return redirect("deliveries_list")
 
@@ -414,19 +998,29 @@ def deliveries_import_json(request):
 
 @login_required
 def deliveries_export_csv(request):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM v_deliveries_full ORDER BY id;")
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(columns)
-
-    for row in rows:
-        writer.writerow([("" if v is None else str(v)) for v in row])
-
-    response = HttpResponse(output.getvalue(), content_type="text/csv")
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "deliveries", "format": "csv"})
+
+    # Streamed straight from a server-side cursor: one CSV chunk per batch,
+    # never the whole table in memory.
+    def generate():
+        batches = stream_query("SELECT * FROM v_deliveries_full ORDER BY id;")
+        output = StringIO()
+        writer = csv.writer(output)
+
+        writer.writerow(next(batches))
+        for rows in batches:
+            for row in rows:
+                writer.writerow([export_csv_cell("deliveries", v) for v in row])
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+
+        # empty export: only the header is still buffered
+        if output.tell():
+            yield output.getvalue()
+
+    response = StreamingHttpResponse(generate(), content_type="text/csv")
     response["Content-Disposition"] = 'attachment; filename="deliveries_export.csv"'
     return response
 
@@ -469,9 +1063,72 @@ def delivery_tracking_view(request, delivery_id):
 
     return render(request, "deliveries/tracking.html", {"tracking": tracking})
 
-@login_required
-def deliveries_tracking(request, tracking_number):
-    # 1) Timeline de tracking desde la MATERIALIZED VIEW
+
+# ----------------------------------------------------------
+# PUBLIC TRACKING PAGE (CACHED + ETag / Last-Modified)
+# ----------------------------------------------------------
+#  Customers poll /tracking/<tracking_number>/ constantly. The timeline
+#  and the delivery info are cached per tracking number; the cache entry
+#  is dropped whenever this app writes a tracking row for that delivery
+#  (status update, cancel, edit). TRACKING_CACHE_TTL bounds staleness for
+#  writes made outside these views (SQL, other workers with a per-process
+#  cache backend).
+#  ETag / Last-Modified come from the newest event (or delivery update),
+#  so a browser re-polling an unchanged delivery gets a 304 straight from
+#  the cache, without touching PostgreSQL.
+
+TRACKING_CACHE_TTL = 60
+
+# Seconds between two conditional reloads of the tracking page
+TRACKING_POLL_SECONDS = 30
+
+
+def tracking_cache_key(tracking_number):
+    # hashed: tracking numbers are user input, cache keys must be safe
+    return "tracking:" + hashlib.sha1(tracking_number.encode()).hexdigest()
+
+
+def invalidate_tracking_cache(*tracking_numbers):
+    cache.delete_many([tracking_cache_key(t) for t in tracking_numbers if t])
+
+
+# Status changes made by any worker (or straight in SQL) reach this worker's
+# cache through the live tracking listener, once it runs (first SSE client)
+@tracking_events.on_event
+def invalidate_tracking_cache_on_event(event):
+    invalidate_tracking_cache(event["tracking_number"])
+
+
+def invalidate_delivery_tracking_cache(cursor, delivery_id):
+    cursor.execute("SELECT tracking_number FROM delivery WHERE id = %s;", [delivery_id])
+    row = cursor.fetchone()
+    if row:
+        invalidate_tracking_cache(row[0])
+
+
+def load_tracking_snapshot(tracking_number):
+    """
+    Delivery info + timeline for one (well-formed) tracking number, or
+    None when no delivery has it. Cached for TRACKING_CACHE_TTL seconds.
+    """
+    key = tracking_cache_key(tracking_number)
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot
+
+    # 1) Delivery by tracking number: an index lookup on
+    #    DELIVERY_TRACKING_NUMBER_UK (the filter is pushed into the view)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM v_deliveries_full WHERE tracking_number = %s;", [tracking_number])
+        rows = dictfetchall(cursor)
+
+    # Unknown tracking numbers are not cached (a new delivery must show up at once)
+    if not rows:
+        return None
+
+    delivery = rows[0]
+
+    # 2) Timeline de tracking desde delivery_tracking_read (mantenida por triggers)
     with connection.cursor() as cursor:
         cursor.execute(
             """
@@ -486,7 +1143,7 @@ def deliveries_tracking(request, tracking_number):
                 staff_username,
                 warehouse_id,
                 warehouse_name
-            FROM mv_delivery_tracking
+            FROM delivery_tracking_read
             WHERE tracking_number = %s
             ORDER BY event_timestamp ASC, tracking_id ASC;
             """,
@@ -494,39 +1151,185 @@ def deliveries_tracking(request, tracking_number):
         )
         tracking = dictfetchall(cursor)
 
-    # 2) delivery_id from tracking events, or look up delivery directly
-    if tracking:
-        delivery_id = tracking[0].get("delivery_id")
-    else:
-        delivery_id = None
+    stamps = [e["event_timestamp"] for e in tracking if e["event_timestamp"]]
+    if delivery.get("updated_at"):
+        stamps.append(delivery["updated_at"])
+    last_modified = max(stamps) if stamps else None
 
-    # 3) Info "bonita" del delivery (v_deliveries_full)
-    delivery = None
-    if delivery_id is not None:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT * FROM v_deliveries_full WHERE id = %s;", [delivery_id])
-            rows = dictfetchall(cursor)
-        delivery = rows[0] if rows else None
+    last_event_id = tracking[-1]["tracking_id"] if tracking else 0
+    delivery_id = delivery["id"]
+    etag_source = f"{delivery_id}:{last_event_id}:{last_modified.isoformat() if last_modified else ''}"
+
+    snapshot = {
+        "delivery_id": delivery_id,
+        "delivery": delivery,
+        "tracking": tracking,
+        "last_modified": last_modified,
+        "etag": quote_etag(hashlib.md5(etag_source.encode()).hexdigest()),
+    }
+    cache.set(key, snapshot, TRACKING_CACHE_TTL)
+    return snapshot
+
+
+@login_required
+def deliveries_tracking(request, tracking_number):
+    # Malformed numbers / wrong check digit: answered without touching the DB
+    if is_valid_tracking_number(tracking_number):
+        snapshot = load_tracking_snapshot(tracking_number)
     else:
-        # No tracking events — try to find the delivery by tracking_number directly
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT * FROM v_deliveries_full WHERE tracking_number = %s;", [tracking_number])
-            rows = dictfetchall(cursor)
-        if rows:
-            delivery = rows[0]
-            delivery_id = delivery["id"]
+        snapshot = None
 
-    if not tracking:
+    if snapshot is None:
         messages.error(request, "No tracking events found for this tracking number.")
+        return render(
+            request,
+            "deliveries/tracking.html",
+            {
+                "tracking_number": tracking_number,
+                "delivery_id": None,
+                "delivery": {},
+                "tracking": [],
+            },
+        )
 
-    # 4) Render
-    return render(
+    last_modified = snapshot["last_modified"]
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+    # If-None-Match / If-Modified-Since -> 304 without rendering
+    not_modified = get_conditional_response(
+        request, etag=snapshot["etag"], last_modified=last_modified_ts,
+    )
+    if not_modified is not None:
+        return not_modified
+
+    if not snapshot["tracking"]:
+        messages.error(request, "No tracking events found for this tracking number.")
+
+    response = render(
         request,
         "deliveries/tracking.html",
         {
             "tracking_number": tracking_number,
-            "delivery_id": delivery_id,
-            "delivery": delivery or {},
-            "tracking": tracking,
+            "delivery_id": snapshot["delivery_id"],
+            "delivery": snapshot["delivery"],
+            "tracking": snapshot["tracking"],
+            "etag": snapshot["etag"],
+            "poll_seconds": TRACKING_POLL_SECONDS,
         },
-    )
\ No newline at end of file
+    )
+    response["ETag"] = snapshot["etag"]
+    if last_modified_ts is not None:
+        response["Last-Modified"] = http_date(last_modified_ts)
+    # The page is per user (navbar): browsers may keep it but must revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# ----------------------------------------------------------
+# LIVE TRACKING (SERVER-SENT EVENTS)
+# ----------------------------------------------------------
+#  URL: /tracking/<tracking_number>/events/
+#  tracking.html polls itself with If-None-Match every
+#  TRACKING_POLL_SECONDS (a 304 from the cache while nothing changed).
+#  "Live updates" opens an EventSource here instead, for SSE_MAX_AGE
+#  seconds, and reloads when a "status" event arrives. Events come from
+#  this worker's single LISTEN connection (PostOffice_App/tracking_events.py);
+#  the stream itself runs no queries. Each stream holds a worker thread,
+#  hence the per-process cap: when it is reached the page keeps polling.
+
+@login_required
+def deliveries_tracking_events(request, tracking_number):
+    if not is_valid_tracking_number(tracking_number) or load_tracking_snapshot(tracking_number) is None:
+        raise Http404("Unknown tracking number.")
+
+    stream = tracking_events.open_stream(tracking_number)
+    if stream is None:
+        # EventSource does not retry a non-200 answer: the page polls
+        return HttpResponse("Too many live tracking streams.", status=503)
+
+    # Don't keep this request's DB connection open for the life of the stream
+    connection.close()
+
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass events through unbuffered
+    return response
+
+
+# ----------------------------------------------------------
+# BATCH TRACKING LOOKUP (JSON API)
+# ----------------------------------------------------------
+#  URL: POST /tracking/batch/   body: {"tracking_numbers": ["PO-...", ...]}
+#  For business clients polling thousands of parcels: every number is
+#  resolved with ONE "= ANY(array)" query on delivery_tracking_read
+#  (index ix_tracking_read_lookup), instead of one page hit per parcel.
+#  Response:
+#    {"event_fields": ["at", "status", "warehouse", "notes"],
+#     "deliveries": {"<number>": {"status", "updated_at", "events": [[...], ...]}},
+#     "not_found": [...], "invalid": [...]}
+#  Clients only see their own deliveries; any other number is "not_found".
+
+TRACKING_BATCH_MAX = 5000
+
+
+@login_required
+@require_POST
+def deliveries_tracking_batch(request):
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+    numbers = payload.get("tracking_numbers") if isinstance(payload, dict) else None
+    if not isinstance(numbers, list) or not numbers:
+        return JsonResponse({"error": "Body must contain a non-empty \"tracking_numbers\" list."}, status=400)
+    if len(numbers) > TRACKING_BATCH_MAX:
+        return JsonResponse({"error": f"At most {TRACKING_BATCH_MAX} tracking numbers per request."}, status=400)
+
+    # Malformed numbers (and non-strings, reported as sent) never reach
+    # the query; duplicates are looked up once
+    valid, invalid = [], [n for n in numbers if not isinstance(n, str)]
+    for number in dict.fromkeys(n for n in numbers if isinstance(n, str)):
+        (valid if is_valid_tracking_number(number) else invalid).append(number)
+
+    deliveries = {}
+
+    if valid:
+        scope, params = "", []
+        if request.user.role == "client":
+            scope = "JOIN delivery d ON d.id = r.delivery_id AND d.client_id = %s"
+            params.append(request.user.id)
+        params.append(valid)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT
+                    r.tracking_number,
+                    r.event_timestamp,
+                    r.status,
+                    r.warehouse_name,
+                    r.notes
+                FROM delivery_tracking_read r
+                {scope}
+                WHERE r.tracking_number = ANY(%s)
+                ORDER BY r.tracking_number, r.event_timestamp, r.tracking_id;
+                """,
+                params,
+            )
+            rows = cursor.fetchall()
+
+        for number, at, status, warehouse, notes in rows:
+            entry = deliveries.setdefault(number, {"events": []})
+            entry["events"].append([at.isoformat() if at else None, status, warehouse, notes])
+
+        # Rows are in timeline order: the last event is the current status
+        for entry in deliveries.values():
+            entry["updated_at"], entry["status"] = entry["events"][-1][:2]
+
+    return JsonResponse({
+        "event_fields": ["at", "status", "warehouse", "notes"],
+        "deliveries": deliveries,
+        "not_found": [n for n in valid if n not in deliveries],
+        "invalid": invalid,
+    })
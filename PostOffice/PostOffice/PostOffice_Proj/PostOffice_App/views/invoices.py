@@ -8,19 +8,20 @@
 #  logic (totals, tax, validation) is handled by triggers/functions.
 
 import json
-from datetime import date, datetime
-from decimal import Decimal
 
-from django.db import connection
-from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.template.loader import get_template
-from xhtml2pdf import pisa
 
+from ..exports import export_csv_cell, export_json_value
 from ..forms import InvoiceForm, InvoiceItemFormSet
+from ..invoice_pdf import InvoicePDFError, cached_pdf_paths, write_invoices_pdf
 from ..notifications import create_notification
 from .decorators import role_required
+from .deliveries import decode_page_cursor, encode_page_cursor
+from .jobs import enqueue_job
 
 
 # ----------------------------------------------------------
@@ -29,28 +30,53 @@ from .decorators import role_required
 #  Reads from:
 #    - v_invoices_with_items  → invoice header + warehouse_name, staff_name,
 #                                client_name, item_count (all pre-joined by the view)
-#    - invoice_item table     → individual items for the expandable sub-table
+#
+#  Only one page of headers is fetched (keyset pagination on
+#  (created_at, id), newest first), so a page costs the same whatever the
+#  number of invoices. Line items are NOT loaded here: the template fetches
+#  them from invoice_items_json when an invoice is expanded.
 #
 #  No computation in Python — invoice.cost is already correct
 #  because triggers recalculate it every time an item is added/edited/deleted.
 
+# Invoices per page on the list
+INVOICES_PAGE_SIZE = 25
+
+
 @login_required
 @role_required(["admin", "client"])
 def invoice_list(request):
 
-    # ---- Step 1: Fetch invoices from the DB view ----
-    # v_invoices_with_items returns one row per invoice with all
-    # joined info (warehouse_name, staff_name, client_name, item_count).
+    # ---- Step 1: Build the WHERE clause ----
     # Clients only see their own invoices (filtered by client_id).
     # Admins see all invoices.
+    # ?cursor=... is the (created_at, id) of the last invoice of the
+    # previous page (same opaque token as the deliveries list).
+    clauses, params = [], []
+
+    if request.user.role == "client":
+        clauses.append("client_id = %s")
+        params.append(request.user.id)
+
+    after = decode_page_cursor(request.GET.get("cursor"))
+    if after:
+        clauses.append("(created_at, id) < (%s, %s)")
+        params.extend(after)
+
+    sql = "SELECT * FROM v_invoices_with_items"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+
+    # One extra row tells us whether there is a next page.
+    # The view is unordered: newest first here, along INVOICE_CREATED_IDX
+    # (or INVOICE_CLIENT_CREATED_IDX for a client), so only this page's
+    # rows are read (item_count is a column of invoice, nothing is counted).
+    sql += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(INVOICES_PAGE_SIZE + 1)
+
+    # ---- Step 2: Fetch the page ----
     with connection.cursor() as cur:
-        if request.user.role == "client":
-            cur.execute(
-                "SELECT * FROM v_invoices_with_items WHERE client_id = %s",
-                [request.user.id],
-            )
-        else:
-            cur.execute("SELECT * FROM v_invoices_with_items")
+        cur.execute(sql, params)
 
         # Convert cursor rows into a list of dicts.
         # cur.description gives us column names; zip pairs them with each row's values.
@@ -58,48 +84,75 @@ def invoice_list(request):
         columns = [col.name for col in cur.description]
         invoices = [dict(zip(columns, row)) for row in cur.fetchall()]
 
-    # ---- Step 2: Fetch items for the expandable sub-table ----
-    # The list template shows a nested table of items under each invoice.
-    # We fetch ALL items for ALL displayed invoices in a single query
-    # (using ANY(%s) with a list of ids), then group them by inv_id in Python.
-    # This avoids N+1 queries (one query per invoice).
-    if invoices:
-        inv_ids = [inv["id"] for inv in invoices]
+    next_url = None
+    if len(invoices) > INVOICES_PAGE_SIZE:
+        invoices = invoices[:INVOICES_PAGE_SIZE]
+        last = invoices[-1]
+        next_url = "?cursor=" + encode_page_cursor(last["created_at"], last["id"])
 
-        with connection.cursor() as cur:
+    # ---- Step 3: Render ----
+    # Each dict has keys matching v_invoices_with_items columns.
+    return render(request, "invoices/list.html", {
+        "invoices": invoices,
+        "next_url": next_url,
+        "is_first_page": after is None,
+    })
+
+
+# ----------------------------------------------------------
+#  ITEMS JSON   (URL: /invoices/<id>/items/   name: "invoice_items_json")
+# ----------------------------------------------------------
+#  Line items of one invoice, loaded by the list page when the invoice
+#  is expanded. Clients can only read their own invoices.
+#  Uses CONTAINS_FK (invoice_item.inv_id).
+
+@login_required
+@role_required(["admin", "client"])
+def invoice_items_json(request, invoice_id):
+
+    with connection.cursor() as cur:
+        # ---- Step 1: Is the invoice visible to this user? ----
+        if request.user.role == "client":
             cur.execute(
-                """
-                SELECT id, inv_id, shipment_type, weight, delivery_speed,
-                       quantity, unit_price, total_item_cost, notes
-                FROM invoice_item
-                WHERE inv_id = ANY(%s)
-                ORDER BY id
-                """,
-                [inv_ids],
-                # ANY(%s) with a Python list → psycopg2 converts it to
-                # a PostgreSQL array: ANY(ARRAY[1, 2, 3])
+                "SELECT 1 FROM invoice WHERE id = %s AND client_id = %s",
+                [invoice_id, request.user.id],
             )
-            columns = [col.name for col in cur.description]
-            all_items = [dict(zip(columns, row)) for row in cur.fetchall()]
-
-        # Group items by their parent invoice id.
-        # setdefault creates a new list the first time a key is seen.
-        # Result: {1: [item_dict, item_dict], 2: [item_dict], ...}
-        items_by_inv = {}
-        for item in all_items:
-            items_by_inv.setdefault(item["inv_id"], []).append(item)
-
-        # Attach the items list to each invoice dict.
-        # In the template: {% for item in inv.items %}
-        # (Django templates access dict keys with dot notation)
-        for inv in invoices:
-            inv["items"] = items_by_inv.get(inv["id"], [])
+        else:
+            cur.execute("SELECT 1 FROM invoice WHERE id = %s", [invoice_id])
 
-    # ---- Step 3: Render ----
-    # Pass the list of invoice dicts to the template.
-    # Each dict has keys matching v_invoices_with_items columns
-    # plus an "items" key containing a list of item dicts.
-    return render(request, "invoices/list.html", {"invoices": invoices})
+        if cur.fetchone() is None:
+            return JsonResponse({"error": "Invoice not found."}, status=404)
+
+        # ---- Step 2: Its items ----
+        cur.execute(
+            """
+            SELECT id, shipment_type, weight, delivery_speed,
+                   quantity, unit_price, total_item_cost, notes
+            FROM invoice_item
+            WHERE inv_id = %s
+            ORDER BY id
+            """,
+            [invoice_id],
+        )
+        columns = [col.name for col in cur.description]
+        items = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    # Decimals are serialized as strings by JsonResponse (DjangoJSONEncoder)
+    return JsonResponse({"invoice_id": invoice_id, "items": items})
+
+
+# invoice_item columns the create/edit forms write
+INVOICE_ITEM_FIELDS = (
+    "shipment_type", "weight", "delivery_speed", "quantity", "unit_price", "notes",
+)
+
+
+def _item_values(item):
+    # "" and None are the same for the optional text fields
+    return tuple(
+        None if item.get(field) == "" else item.get(field)
+        for field in INVOICE_ITEM_FIELDS
+    )
 
 
 # ----------------------------------------------------------
@@ -107,16 +160,15 @@ def invoice_list(request):
 # ----------------------------------------------------------
 #  Writes via:
 #    1. sp_create_invoice  → creates the invoice header row, returns the new id
-#    2. sp_add_invoice_item → creates each item row (one CALL per item)
+#    2. sp_add_invoice_items → inserts all item rows with one statement
+#       (one CALL whatever the number of items)
 #
-#  After each sp_add_invoice_item CALL, the DB automatically:
-#    - trg_invoice_item_calc_total fires (BEFORE INSERT on invoice_item)
+#  During that INSERT, the DB automatically:
+#    - trg_invoice_item_calc_total fires (BEFORE INSERT, per item row)
 #        → calls fn_calculate_item_total(qty, unit_price)
 #        → sets invoice_item.total_item_cost
-#    - trg_invoice_update_cost fires (AFTER INSERT on invoice_item)
-#        → calls fn_invoice_total(invoice_id)
-#            → calls fn_invoice_subtotal (SUM of all items)
-#            → calls fn_calculate_tax (subtotal × 0.23)
+#    - trg_invoice_update_cost fires (AFTER INSERT, once per statement)
+#        → sums the invoice's items (subtotal + fn_calculate_tax, 23%)
 #        → updates invoice.cost and invoice.quantity
 #
 #  So Django only collects form data and calls procedures.
@@ -149,7 +201,7 @@ def invoice_create(request):
             # ChoiceField returns strings for war_id/staff_id/client_id,
             # so we convert to int (sp_create_invoice expects INT parameters).
             # Empty string "" means "nothing selected" → pass None.
-            with connection.cursor() as cur:
+            with transaction.atomic(), connection.cursor() as cur:
                 cur.execute(
                     "CALL sp_create_invoice(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, NULL)",
                     [
@@ -170,43 +222,23 @@ def invoice_create(request):
                 # Fetch the INOUT return value — the new invoice's id
                 invoice_id = cur.fetchone()[0]
 
-            # ---- Step 2: Add each invoice item ----
-            # Loop through the formset. Each form represents one item row.
-            # has_changed() returns False for blank extra rows the user didn't touch.
-            # DELETE flag is True if the user checked the delete checkbox (for edit forms).
-            #
-            # CALL sp_add_invoice_item(p_inv_id, p_shipment_type, p_weight,
-            #   p_delivery_speed, p_quantity, p_unit_price, p_notes, p_id INOUT)
-            #
-            # After each CALL, the trigger chain fires automatically:
-            #   trg_invoice_item_calc_total → sets this item's total_item_cost
-            #   trg_invoice_update_cost     → recalculates parent invoice.cost
-            for item_form in formset:
-                # Skip blank extra rows that the user didn't fill in
-                if not item_form.has_changed():
-                    continue
-
-                icd = item_form.cleaned_data
-
-                # Skip rows marked for deletion
-                if icd.get("DELETE"):
-                    continue
-
-                with connection.cursor() as cur:
+                # ---- Step 2: Add the invoice items ----
+                # Collect the item rows from the formset:
+                # has_changed() returns False for blank extra rows the user didn't touch.
+                # DELETE flag is True if the user checked the delete checkbox.
+                items = [
+                    dict(zip(INVOICE_ITEM_FIELDS, _item_values(item_form.cleaned_data)))
+                    for item_form in formset
+                    if item_form.has_changed() and not item_form.cleaned_data.get("DELETE")
+                ]
+
+                # CALL sp_add_invoice_items(p_inv_id, p_items JSONB)
+                # One CALL for all rows; Decimals go as JSON strings.
+                if items:
                     cur.execute(
-                        "CALL sp_add_invoice_item(%s,%s,%s,%s,%s,%s,%s, NULL)",
-                        [
-                            invoice_id,             # FK → the invoice we just created
-                            icd["shipment_type"],   # e.g. "package", "letter"
-                            icd["weight"],          # Decimal or None
-                            icd["delivery_speed"],  # e.g. "standard", "express"
-                            icd["quantity"],         # int, min 1
-                            icd["unit_price"],       # Decimal, min 0
-                            icd.get("notes"),       # optional text
-                        ],
+                        "CALL sp_add_invoice_items(%s, %s::jsonb)",
+                        [invoice_id, json.dumps(items, cls=DjangoJSONEncoder)],
                     )
-                    # We don't need the returned item id here,
-                    # but the INOUT NULL is still required by the procedure signature.
 
             # ---- Step 3: Send notification (MongoDB — unchanged) ----
             create_notification(
@@ -238,15 +270,60 @@ def invoice_create(request):
 # ----------------------------------------------------------
 #  GET:  Fetch existing invoice + items from DB, pre-populate form + formset.
 #  POST: Update invoice header via sp_update_invoice,
-#        delete all existing items (raw DELETE),
-#        re-insert items from formset via sp_add_invoice_item.
+#        diff the formset against the stored items (diff_invoice_items),
+#        apply the diff with one CALL sp_sync_invoice_items.
 #
-#  Why delete-and-recreate items instead of updating in place?
-#  - We don't have sp_update_invoice_item or sp_delete_invoice_item
-#  - The existing triggers already handle DELETE and INSERT on invoice_item
-#  - trg_invoice_update_cost recalculates invoice.cost after each operation
-#  - Item IDs get regenerated (new serial values), but items are only ever
-#    accessed through their parent invoice, so this doesn't matter.
+#  Each pre-filled row carries the item id in a hidden field, so the diff
+#  sorts rows into unchanged / updated / inserted / deleted. Unchanged items
+#  are not written at all; the rest is one DELETE, one UPDATE and one INSERT,
+#  and the invoice cost is recalculated once (instead of delete-everything
+#  and re-insert, where trg_invoice_update_cost ran for every row twice).
+
+def diff_invoice_items(existing_items, formset):
+    """
+    Compare a bound, valid InvoiceItemFormSet with the stored items.
+
+    Returns (deleted_ids, updated, inserted): updated/inserted are lists of
+    dicts with the INVOICE_ITEM_FIELDS (updated ones also have "id").
+    Rows whose id is not one of existing_items are ignored.
+    """
+    existing = {item["id"]: item for item in existing_items}
+    deleted_ids, updated, inserted = [], [], []
+
+    for item_form in formset:
+        icd = item_form.cleaned_data
+        if not icd:
+            continue  # blank extra row
+
+        item_id = icd.get("id")
+        values = dict(zip(INVOICE_ITEM_FIELDS, _item_values(icd)))
+
+        if item_id is None:
+            if not icd.get("DELETE"):
+                inserted.append(values)
+        elif item_id in existing:
+            if icd.get("DELETE"):
+                deleted_ids.append(item_id)
+            elif _item_values(existing[item_id]) != _item_values(icd):
+                updated.append({"id": item_id, **values})
+
+    return deleted_ids, updated, inserted
+
+
+def fetch_invoice_items(cur, invoice_id):
+    cur.execute(
+        """
+        SELECT id, inv_id, shipment_type, weight, delivery_speed,
+               quantity, unit_price, total_item_cost, notes
+        FROM invoice_item
+        WHERE inv_id = %s
+        ORDER BY id
+        """,
+        [invoice_id],
+    )
+    columns = [col.name for col in cur.description]
+    return [dict(zip(columns, r)) for r in cur.fetchall()]
+
 
 @login_required
 @role_required(["admin"])
@@ -267,28 +344,12 @@ def invoice_edit(request, invoice_id):
 
     # If no row returned, the invoice doesn't exist → 404
     if not row:
-        from django.http import Http404
         raise Http404("Invoice not found")
 
     # Convert the single row to a dict for easy field access
     # e.g. invoice["war_id"], invoice["status"], invoice["client_name"], etc.
     invoice = dict(zip(columns, row))
 
-    # ---- Fetch existing items for formset pre-population ----
-    with connection.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, inv_id, shipment_type, weight, delivery_speed,
-                   quantity, unit_price, total_item_cost, notes
-            FROM invoice_item
-            WHERE inv_id = %s
-            ORDER BY id
-            """,
-            [invoice_id],
-        )
-        columns = [col.name for col in cur.description]
-        existing_items = [dict(zip(columns, r)) for r in cur.fetchall()]
-
     if request.method == "POST":
         # Bind POST data to form and formset for validation
         form = InvoiceForm(request.POST)
@@ -297,7 +358,14 @@ def invoice_edit(request, invoice_id):
         if form.is_valid() and formset.is_valid():
             cd = form.cleaned_data
 
-            # ---- Step 1: Update invoice header ----
+            # ---- Step 1: Lock the invoice, read its current items ----
+            # The diff must be computed against the items as they are now,
+            # not as they were when the page was rendered: FOR UPDATE makes
+            # a concurrent edit of the same invoice wait for this one, and
+            # rows it deleted in the meantime are not re-added (their ids
+            # are no longer in current_items, so diff_invoice_items skips them).
+            #
+            # ---- Step 2: Update invoice header ----
             # CALL sp_update_invoice(p_id, p_war_id, p_staff_id, p_client_id,
             #   p_status, p_type, p_quantity, p_cost, p_paid, p_pay_method,
             #   p_name, p_address, p_contact)
@@ -305,7 +373,12 @@ def invoice_edit(request, invoice_id):
             # sp_update_invoice uses COALESCE — any NULL parameter keeps
             # the existing value. But here we pass all values from the form
             # since the user may have changed any field.
-            with connection.cursor() as cur:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute("SELECT id FROM invoice WHERE id = %s FOR UPDATE", [invoice_id])
+                if cur.fetchone() is None:
+                    raise Http404("Invoice not found")
+                current_items = fetch_invoice_items(cur, invoice_id)
+
                 cur.execute(
                     "CALL sp_update_invoice(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
                     [
@@ -325,40 +398,20 @@ def invoice_edit(request, invoice_id):
                     ],
                 )
 
-            # ---- Step 2: Delete all existing items ----
-            # Raw DELETE — no procedure needed.
-            # trg_invoice_update_cost fires for each deleted row,
-            # recalculating invoice.cost (goes to 0 after all items deleted).
-            with connection.cursor() as cur:
-                cur.execute(
-                    "DELETE FROM invoice_item WHERE inv_id = %s",
-                    [invoice_id],
-                )
-
-            # ---- Step 3: Re-insert items from formset ----
-            # Same logic as invoice_create: loop through formset,
-            # skip blank/deleted rows, CALL sp_add_invoice_item for each.
-            # After each insert, triggers recalculate:
-            #   trg_invoice_item_calc_total → sets total_item_cost
-            #   trg_invoice_update_cost     → updates invoice.cost
-            for item_form in formset:
-                if not item_form.has_changed():
-                    continue
-                icd = item_form.cleaned_data
-                if icd.get("DELETE"):
-                    continue
-
-                with connection.cursor() as cur:
+                # ---- Step 3: Apply the item diff ----
+                # CALL sp_sync_invoice_items(p_inv_id, p_deleted_ids,
+                #   p_updated JSONB, p_inserted JSONB)
+                # Decimals are sent as JSON strings; jsonb_to_recordset
+                # casts them back to DECIMAL(10,2).
+                deleted_ids, updated, inserted = diff_invoice_items(current_items, formset)
+                if deleted_ids or updated or inserted:
                     cur.execute(
-                        "CALL sp_add_invoice_item(%s,%s,%s,%s,%s,%s,%s, NULL)",
+                        "CALL sp_sync_invoice_items(%s, %s::int[], %s::jsonb, %s::jsonb)",
                         [
                             invoice_id,
-                            icd["shipment_type"],
-                            icd["weight"],
-                            icd["delivery_speed"],
-                            icd["quantity"],
-                            icd["unit_price"],
-                            icd.get("notes"),
+                            deleted_ids,
+                            json.dumps(updated, cls=DjangoJSONEncoder),
+                            json.dumps(inserted, cls=DjangoJSONEncoder),
                         ],
                     )
 
@@ -397,8 +450,12 @@ def invoice_edit(request, invoice_id):
         # has keys matching the form field names.
         # With extra=1, Django shows len(initial) pre-filled rows + 1 blank row.
         # e.g. 3 existing items → 3 pre-filled + 1 blank = 4 rows shown.
+        with connection.cursor() as cur:
+            existing_items = fetch_invoice_items(cur, invoice_id)
+
         formset = InvoiceItemFormSet(initial=[
             {
+                "id":             item["id"],     # hidden; lets POST diff the rows
                 "shipment_type":  item["shipment_type"],
                 "weight":         item["weight"],
                 "delivery_speed": item["delivery_speed"],
@@ -480,6 +537,12 @@ def invoice_delete(request, invoice_id):
 @login_required
 @role_required(["admin", "manager"])
 def invoices_import_json(request):
+    if request.method == "POST" and request.POST.get("background"):
+        file = request.FILES.get("file")
+        if not file:
+            return redirect("invoices_import_json")
+        return enqueue_job(request, "import_json", {"entity": "invoices"}, upload=file)
+
     if request.method == "POST":
         file = request.FILES.get("file")
         if not file:
@@ -527,7 +590,7 @@ def invoices_import_json(request):
 #  EXPORT JSON   (URL: /invoices/export/json/   name: "invoices_export_json")
 # ----------------------------------------------------------
 #  Reads from:
-#    - v_invoices_export  → flat view with all invoice columns, ORDER BY id
+#    - v_invoices_export  → flat view with all invoice columns (ordered by id here)
 #
 #  Python serializes Decimal/datetime values, dumps to JSON,
 #  and returns an HttpResponse with Content-Disposition attachment.
@@ -535,21 +598,21 @@ def invoices_import_json(request):
 @login_required
 @role_required(["admin", "manager"])
 def invoices_export_json(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "invoices", "format": "json"})
+
 
     # ---- Step 1: Fetch all invoices from the export view ----
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_invoices_export")
+        cur.execute("SELECT * FROM v_invoices_export ORDER BY id")
         columns = [col.name for col in cur.description]
         invoices = [dict(zip(columns, row)) for row in cur.fetchall()]
 
     # ---- Step 2: Serialize non-JSON-native types ----
-    # Decimal → float, datetime/date → ISO string
+    # Decimal → float, datetime/date → ISO string (exports.py)
     for inv in invoices:
         for key, val in inv.items():
-            if isinstance(val, Decimal):
-                inv[key] = float(val)
-            elif isinstance(val, (datetime, date)):
-                inv[key] = val.isoformat()
+            inv[key] = export_json_value("invoices", val)
 
     # ---- Step 3: Build JSON response as file download ----
     json_data = json.dumps(invoices, indent=4)
@@ -579,10 +642,13 @@ def invoices_export_json(request):
 @login_required
 @role_required(["admin", "manager"])
 def invoices_export_csv(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "invoices", "format": "csv"})
+
 
     # ---- Step 1: Fetch all invoices from the export view ----
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_invoices_export")
+        cur.execute("SELECT * FROM v_invoices_export ORDER BY id")
         columns = [col.name for col in cur.description]
         rows = cur.fetchall()
 
@@ -594,20 +660,11 @@ def invoices_export_csv(request):
     for row in rows:
         cells = []
         for val in row:
-            if val is None:
-                cells.append("")
-            elif isinstance(val, bool):
-                cells.append("true" if val else "false")
-            elif isinstance(val, (datetime, date)):
-                cells.append(val.isoformat())
-            elif isinstance(val, Decimal):
-                cells.append(str(val))
-            else:
-                s = str(val)
-                # Wrap in quotes if the value contains commas or quotes
-                if "," in s or '"' in s:
-                    s = '"' + s.replace('"', '""') + '"'
-                cells.append(s)
+            s = export_csv_cell("invoices", val)
+            # Wrap in quotes if the value contains commas or quotes
+            if "," in s or '"' in s:
+                s = '"' + s.replace('"', '""') + '"'
+            cells.append(s)
         lines.append(",".join(cells))
 
     csv_data = header + "\n" + "\n".join(lines)
@@ -634,83 +691,78 @@ def invoices_export_csv(request):
 #  Reads from:
 #    - v_invoices_with_items  → invoice header + warehouse_name, staff_name,
 #                                client_name, item_count
-#    - invoice_item table     → line items per invoice
 #
-#  invoice.cost already contains subtotal + 23% tax (computed by triggers).
-#  For the PDF breakdown we compute subtotal from items in Python (0 extra DB calls).
-#  pdf_template.html uses {{ item.total_item_cost }} (matches DB column directly).
+#  Each invoice is rendered to its own cached PDF (PostOffice_App/invoice_pdf.py,
+#  keyed by id + updated_at): only new or changed invoices go through
+#  xhtml2pdf, in a process pool, and the export concatenates the files.
 
 @login_required
 @role_required(["admin", "client"])
 def invoices_export_pdf(request):
+    if request.GET.get("background"):
+        # Clients only get their own invoices, as below
+        client_id = request.user.id if request.user.role == "client" else None
+        return enqueue_job(request, "invoices_pdf", {"client_id": client_id})
+
 
     # ---- Step 1: Fetch invoices ----
     # Clients see only their own invoices; admins see all.
     with connection.cursor() as cur:
         if request.user.role == "client":
             cur.execute(
-                "SELECT * FROM v_invoices_with_items WHERE client_id = %s",
+                "SELECT * FROM v_invoices_with_items WHERE client_id = %s "
+                "ORDER BY created_at DESC, id DESC",
                 [request.user.id],
             )
         else:
-            cur.execute("SELECT * FROM v_invoices_with_items")
+            cur.execute("SELECT * FROM v_invoices_with_items ORDER BY created_at DESC, id DESC")
 
         columns = [col.name for col in cur.description]
         invoices = [dict(zip(columns, row)) for row in cur.fetchall()]
 
-    # ---- Step 2: Fetch items for all invoices in a single query ----
-    if invoices:
-        inv_ids = [inv["id"] for inv in invoices]
+    # ---- Step 2: Render the missing PDFs, concatenate all of them ----
+    response = HttpResponse(content_type="application/pdf")
+    response["Content-Disposition"] = 'attachment; filename="invoices.pdf"'
 
-        with connection.cursor() as cur:
+    try:
+        write_invoices_pdf(invoices, response)
+    except InvoicePDFError:
+        return HttpResponse("Error generating PDF", status=500)
+
+    return response
+
+
+# ----------------------------------------------------------
+#  PDF   (URL: /invoices/<id>/pdf/   name: "invoice_pdf")
+# ----------------------------------------------------------
+#  One invoice, served from the PDF cache (rendered first if needed).
+#  Clients can only download their own invoices.
+
+@login_required
+@role_required(["admin", "client"])
+def invoice_pdf(request, invoice_id):
+
+    with connection.cursor() as cur:
+        if request.user.role == "client":
             cur.execute(
-                """
-                SELECT id, inv_id, shipment_type, weight, delivery_speed,
-                       quantity, unit_price, total_item_cost, notes
-                FROM invoice_item
-                WHERE inv_id = ANY(%s)
-                ORDER BY id
-                """,
-                [inv_ids],
+                "SELECT id, updated_at FROM invoice WHERE id = %s AND client_id = %s",
+                [invoice_id, request.user.id],
             )
-            item_columns = [col.name for col in cur.description]
-            all_items = [dict(zip(item_columns, r)) for r in cur.fetchall()]
-    else:
-        all_items = []
-
-    # Group items by invoice id
-    items_by_inv = {}
-    for item in all_items:
-        items_by_inv.setdefault(item["inv_id"], []).append(item)
-
-    # ---- Step 3: Build template context with subtotal/tax/total per invoice ----
-    # Subtotal = SUM(total_item_cost) from items (already computed by trigger 15)
-    # Tax = subtotal × 0.23
-    # Total = subtotal + tax  (should match invoice.cost from trigger 16)
-    pdf_invoices = []
-    for inv in invoices:
-        items = items_by_inv.get(inv["id"], [])
-        subtotal = sum(item["total_item_cost"] or Decimal("0.00") for item in items)
-        tax = (subtotal * Decimal("0.23")).quantize(Decimal("0.01"))
-        total = subtotal + tax
-
-        pdf_invoices.append({
-            "invoice": inv,
-            "items": items,
-            "subtotal": subtotal,
-            "tax": tax,
-            "total": total,
-        })
+        else:
+            cur.execute("SELECT id, updated_at FROM invoice WHERE id = %s", [invoice_id])
 
-    # ---- Step 4: Render HTML → PDF via xhtml2pdf ----
-    template = get_template("invoices/pdf_template.html")
-    html = template.render({"invoices": pdf_invoices})
+        row = cur.fetchone()
 
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="invoices.pdf"'
+    if row is None:
+        raise Http404("Invoice not found")
 
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
+    try:
+        path, = cached_pdf_paths([{"id": row[0], "updated_at": row[1]}])
+    except InvoicePDFError:
         return HttpResponse("Error generating PDF", status=500)
 
-    return response
+    return FileResponse(
+        open(path, "rb"),
+        filename=f"invoice_{invoice_id}.pdf",
+        content_type="application/pdf",
+    )
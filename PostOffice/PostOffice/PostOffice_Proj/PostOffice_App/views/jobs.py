@@ -0,0 +1,96 @@
+# ==========================================================
+#  BACKGROUND JOBS — job page, progress JSON, artefact download
+# ==========================================================
+#
+#  The queue and the job kinds are in PostOffice_App/jobs.py; the jobs
+#  are run by "manage.py run_jobs". Export/import views call
+#  enqueue_job() when asked to run in the background (?background=1 on
+#  an export link, a "background" checkbox on an import form) and the
+#  user lands on the job page, which polls job_status until it is done.
+#
+#  A job is visible to the user who queued it and to admins.
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import connection
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import redirect, render
+
+from .. import jobs
+
+
+def enqueue_job(request, kind, params, upload=None):
+    """Queue a job for request.user and redirect to its page."""
+    if upload is not None:
+        params = {**params, "upload": jobs.save_upload(upload)}
+
+    job_id = jobs.enqueue(kind, params, created_by=request.user.id)
+    messages.info(request, f"Job #{job_id} queued; this page updates when it is done.")
+    return redirect("job_detail", job_id=job_id)
+
+
+def _get_job(request, job_id):
+    with connection.cursor() as cur:
+        if request.user.role == "admin":
+            cur.execute("SELECT * FROM job WHERE id = %s", [job_id])
+        else:
+            cur.execute(
+                "SELECT * FROM job WHERE id = %s AND created_by = %s",
+                [job_id, request.user.id],
+            )
+        columns = [col.name for col in cur.description]
+        row = cur.fetchone()
+
+    if row is None:
+        raise Http404("Job not found")
+    return dict(zip(columns, row))
+
+
+# ----------------------------------------------------------
+#  PAGE   (URL: /jobs/<id>/   name: "job_detail")
+# ----------------------------------------------------------
+
+@login_required
+def job_detail(request, job_id):
+    return render(request, "jobs/detail.html", {"job": _get_job(request, job_id)})
+
+
+# ----------------------------------------------------------
+#  STATUS JSON   (URL: /jobs/<id>/status/   name: "job_status")
+# ----------------------------------------------------------
+#  Polled by the job page every few seconds.
+
+@login_required
+def job_status(request, job_id):
+    job = _get_job(request, job_id)
+    return JsonResponse({
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "total": job["total"],
+        "message": job["message"],
+        "has_result": job["status"] == "done" and bool(job["result_file"]),
+    })
+
+
+# ----------------------------------------------------------
+#  DOWNLOAD   (URL: /jobs/<id>/download/   name: "job_download")
+# ----------------------------------------------------------
+
+@login_required
+def job_download(request, job_id):
+    job = _get_job(request, job_id)
+    if job["status"] != "done" or not job["result_file"]:
+        raise Http404("Nothing to download")
+
+    path = jobs.files_dir() / job["result_file"]
+    if not path.exists():
+        raise Http404("The file of this job was deleted")
+
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=job["result_name"],
+        content_type=job["content_type"],
+    )
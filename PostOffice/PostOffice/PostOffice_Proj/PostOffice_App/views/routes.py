@@ -8,8 +8,7 @@
 #  is handled by trg_route_time_check (BEFORE INSERT/UPDATE).
 
 import json
-from datetime import date, datetime, time, timedelta
-from decimal import Decimal
+from datetime import datetime, timedelta
 
 from django.db import connection
 from django.http import HttpResponse, HttpResponseBadRequest
@@ -17,9 +16,11 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 
+from ..exports import export_csv_cell, export_json_value
 from ..forms import RouteForm
 from ..notifications import create_notification
 from .decorators import role_required
+from .jobs import enqueue_job
 
 
 # ----------------------------------------------------------
@@ -28,6 +29,8 @@ from .decorators import role_required
 #  Reads from:
 #    - v_routes_full  → routes joined with driver_name, plate_number,
 #                        vehicle_name, warehouse_name, etc.
+#                        (unordered view; newest delivery date first here,
+#                        along ROUTE_DELIVERY_DATE_IDX)
 #
 #  Python paginates the results (10 per page).
 
@@ -36,7 +39,7 @@ def routes_list(request):
 
     # ---- Step 1: Fetch all routes from the DB view ----
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_routes_full")
+        cur.execute("SELECT * FROM v_routes_full ORDER BY delivery_date DESC NULLS LAST, id")
         columns = [col.name for col in cur.description]
         all_routes = [dict(zip(columns, row)) for row in cur.fetchall()]
 
@@ -242,6 +245,12 @@ def routes_delete(request, route_id):
 @login_required
 @role_required(["admin", "manager"])
 def routes_import_json(request):
+    if request.method == "POST" and request.POST.get("background"):
+        file = request.FILES.get("file")
+        if not file:
+            return redirect("routes_import_json")
+        return enqueue_job(request, "import_json", {"entity": "routes"}, upload=file)
+
     if request.method == "POST":
         file = request.FILES.get("file")
         if not file:
@@ -285,34 +294,25 @@ def routes_import_json(request):
 #  EXPORT JSON   (URL: /routes/export/json/   name: "routes_export_json")
 # ----------------------------------------------------------
 #  Reads from:
-#    - v_routes_export  → flat view with all route columns, ORDER BY id
+#    - v_routes_export  → flat view with all route columns (ordered by id here)
 
 @login_required
 @role_required(["admin", "manager"])
 def routes_export_json(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "routes", "format": "json"})
+
 
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_routes_export")
+        cur.execute("SELECT * FROM v_routes_export ORDER BY id")
         columns = [col.name for col in cur.description]
         routes = [dict(zip(columns, row)) for row in cur.fetchall()]
 
     # Serialize non-JSON-native types
+    # (expected_duration timedelta → "HH:MM:SS")
     for r in routes:
         for key, val in r.items():
-            if isinstance(val, Decimal):
-                r[key] = float(val)
-            elif isinstance(val, datetime):
-                r[key] = val.isoformat()
-            elif isinstance(val, date):
-                r[key] = val.isoformat()
-            elif isinstance(val, timedelta):
-                total_seconds = int(val.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                r[key] = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            elif isinstance(val, time):
-                r[key] = val.isoformat()
+            r[key] = export_json_value("routes", val)
 
     json_data = json.dumps(routes, indent=4)
     response = HttpResponse(json_data, content_type="application/json")
@@ -338,9 +338,12 @@ def routes_export_json(request):
 @login_required
 @role_required(["admin", "manager"])
 def routes_export_csv(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "routes", "format": "csv"})
+
 
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_routes_export")
+        cur.execute("SELECT * FROM v_routes_export ORDER BY id")
         columns = [col.name for col in cur.description]
         rows = cur.fetchall()
 
@@ -350,29 +353,10 @@ def routes_export_csv(request):
     for row in rows:
         cells = []
         for val in row:
-            if val is None:
-                cells.append("")
-            elif isinstance(val, bool):
-                cells.append("true" if val else "false")
-            elif isinstance(val, datetime):
-                cells.append(val.isoformat())
-            elif isinstance(val, date):
-                cells.append(val.isoformat())
-            elif isinstance(val, timedelta):
-                total_seconds = int(val.total_seconds())
-                hours = total_seconds // 3600
-                minutes = (total_seconds % 3600) // 60
-                seconds = total_seconds % 60
-                cells.append(f"{hours:02d}:{minutes:02d}:{seconds:02d}")
-            elif isinstance(val, time):
-                cells.append(val.isoformat())
-            elif isinstance(val, Decimal):
-                cells.append(str(val))
-            else:
-                s = str(val)
-                if "," in s or '"' in s:
-                    s = '"' + s.replace('"', '""') + '"'
-                cells.append(s)
+            s = export_csv_cell("routes", val)
+            if "," in s or '"' in s:
+                s = '"' + s.replace('"', '""') + '"'
+            cells.append(s)
         lines.append(",".join(cells))
 
     csv_data = header + "\n" + "\n".join(lines)
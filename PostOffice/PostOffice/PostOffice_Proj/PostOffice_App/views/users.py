@@ -16,6 +16,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
 
 from ..forms import UserForm
+from ..reference_data import PEOPLE, invalidate_reference_data
 from .decorators import role_required
 
 
@@ -43,7 +44,7 @@ def users_list(request):
     """
 
     with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM v_users_admin")
+        cursor.execute("SELECT * FROM v_users_admin ORDER BY username")
         columns = [col[0] for col in cursor.description]
         users = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
@@ -152,6 +153,8 @@ def users_form(request, user_id=None):
                         ],
                     )
 
+            # the role may have changed: every list with user names
+            invalidate_reference_data(*PEOPLE)
             return redirect("users_list")
 
     else:
@@ -191,6 +194,7 @@ def clients_list(request):
         cursor.execute("""
             SELECT *
             FROM v_clients
+            ORDER BY full_name
         """)
         columns = [col[0] for col in cursor.description]
         clients = [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -291,6 +295,7 @@ def clients_form(request, user_id=None):
                         ],
                     )
 
+            invalidate_reference_data("clients")
             return redirect("clients_list")
 
     else:
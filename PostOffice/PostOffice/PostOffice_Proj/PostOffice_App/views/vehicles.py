@@ -8,8 +8,6 @@
 #  is handled by fn_is_valid_year inside the procedures.
 
 import json
-from datetime import date, datetime
-from decimal import Decimal
 
 from django.db import connection
 from django.http import HttpResponse, HttpResponseBadRequest
@@ -17,16 +15,19 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 
+from ..exports import export_csv_cell, export_json_value
 from ..forms import VehicleForm
+from ..reference_data import invalidate_reference_data
 from ..notifications import create_notification
 from .decorators import role_required
+from .jobs import enqueue_job
 
 
 # ----------------------------------------------------------
 #  LIST   (URL: /vehicles/   name: "vehicles_list")
 # ----------------------------------------------------------
 #  Reads from:
-#    - v_vehicles_full  → all vehicle columns, ORDER BY id
+#    - v_vehicles_full  → all vehicle columns (ordered by id here)
 #
 #  Python paginates the results (10 per page).
 
@@ -36,7 +37,7 @@ def vehicles_list(request):
 
     # ---- Step 1: Fetch all vehicles from the DB view ----
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_vehicles_full")
+        cur.execute("SELECT * FROM v_vehicles_full ORDER BY id")
         columns = [col.name for col in cur.description]
         all_vehicles = [dict(zip(columns, row)) for row in cur.fetchall()]
 
@@ -85,6 +86,8 @@ def vehicles_create(request):
                 )
                 vehicle_id = cur.fetchone()[0]
 
+            invalidate_reference_data("vehicles")
+
             create_notification(
                 notification_type="vehicle_created",
                 recipient_contact=request.user.email,
@@ -153,6 +156,8 @@ def vehicles_edit(request, vehicle_id):
                     ],
                 )
 
+            invalidate_reference_data("vehicles")
+
             create_notification(
                 notification_type="vehicle_updated",
                 recipient_contact=request.user.email,
@@ -203,6 +208,8 @@ def vehicles_delete(request, vehicle_id):
                 [vehicle_id],
             )
 
+        invalidate_reference_data("vehicles")
+
         create_notification(
             notification_type="vehicle_deleted",
             recipient_contact=request.user.email,
@@ -228,6 +235,12 @@ def vehicles_delete(request, vehicle_id):
 @login_required
 @role_required(["admin", "manager"])
 def vehicles_import_json(request):
+    if request.method == "POST" and request.POST.get("background"):
+        file = request.FILES.get("file")
+        if not file:
+            return redirect("vehicles_import_json")
+        return enqueue_job(request, "import_json", {"entity": "vehicles"}, upload=file)
+
     if request.method == "POST":
         file = request.FILES.get("file")
         if not file:
@@ -254,6 +267,8 @@ def vehicles_import_json(request):
                 [json_str],
             )
 
+        invalidate_reference_data("vehicles")
+
         create_notification(
             notification_type="vehicles_imported",
             recipient_contact=request.user.email,
@@ -271,24 +286,24 @@ def vehicles_import_json(request):
 #  EXPORT JSON   (URL: /vehicles/export/json/   name: "vehicles_export_json")
 # ----------------------------------------------------------
 #  Reads from:
-#    - v_vehicles_export  → flat view with all vehicle columns, ORDER BY id
+#    - v_vehicles_export  → flat view with all vehicle columns (ordered by id here)
 
 @login_required
 @role_required(["admin", "manager", "staff"])
 def vehicles_export_json(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "vehicles", "format": "json"})
+
 
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_vehicles_export")
+        cur.execute("SELECT * FROM v_vehicles_export ORDER BY id")
         columns = [col.name for col in cur.description]
         vehicles = [dict(zip(columns, row)) for row in cur.fetchall()]
 
     # Serialize non-JSON-native types
     for v in vehicles:
         for key, val in v.items():
-            if isinstance(val, Decimal):
-                v[key] = float(val)
-            elif isinstance(val, (datetime, date)):
-                v[key] = val.isoformat()
+            v[key] = export_json_value("vehicles", val)
 
     json_data = json.dumps(vehicles, indent=4)
     response = HttpResponse(json_data, content_type="application/json")
@@ -314,9 +329,12 @@ def vehicles_export_json(request):
 @login_required
 @role_required(["admin", "manager"])
 def vehicles_export_csv(request):
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "vehicles", "format": "csv"})
+
 
     with connection.cursor() as cur:
-        cur.execute("SELECT * FROM v_vehicles_export")
+        cur.execute("SELECT * FROM v_vehicles_export ORDER BY id")
         columns = [col.name for col in cur.description]
         rows = cur.fetchall()
 
@@ -326,19 +344,10 @@ def vehicles_export_csv(request):
     for row in rows:
         cells = []
         for val in row:
-            if val is None:
-                cells.append("")
-            elif isinstance(val, bool):
-                cells.append("true" if val else "false")
-            elif isinstance(val, (datetime, date)):
-                cells.append(val.isoformat())
-            elif isinstance(val, Decimal):
-                cells.append(str(val))
-            else:
-                s = str(val)
-                if "," in s or '"' in s:
-                    s = '"' + s.replace('"', '""') + '"'
-                cells.append(s)
+            s = export_csv_cell("vehicles", val)
+            if "," in s or '"' in s:
+                s = '"' + s.replace('"', '""') + '"'
+            cells.append(s)
         lines.append(",".join(cells))
 
     csv_data = header + "\n" + "\n".join(lines)
@@ -4,10 +4,13 @@ from django.db import connection
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from ..exports import export_json_value
 from ..forms import WarehouseForm
 from ..notifications import create_notification
+from ..reference_data import invalidate_reference_data
 
 from .decorators import role_required
+from .jobs import enqueue_job
 
 
 # # ==========================================================
@@ -115,6 +118,8 @@ def warehouses_create(request):
                     ],
                 )
 
+            invalidate_reference_data("warehouses")
+
             create_notification(
                 notification_type="warehouse_created",
                 recipient_contact=request.user.email,
@@ -213,6 +218,8 @@ def warehouses_edit(request, warehouse_id):
                     ],
                 )
 
+            invalidate_reference_data("warehouses")
+
             create_notification(
                 notification_type="warehouse_updated",
                 recipient_contact=request.user.email,
@@ -291,6 +298,8 @@ def warehouses_delete(request, warehouse_id):
             [warehouse_id],
         )
 
+    invalidate_reference_data("warehouses")
+
     create_notification(
         notification_type="warehouse_deleted",
         recipient_contact=request.user.email,
@@ -354,6 +363,9 @@ def warehouses_export_json(request):
     Export warehouses to JSON using v_warehouses_export view.
     """
 
+    if request.GET.get("background"):
+        return enqueue_job(request, "export", {"entity": "warehouses", "format": "json"})
+
     with connection.cursor() as cursor:
         cursor.execute("""
             SELECT *
@@ -361,7 +373,10 @@ def warehouses_export_json(request):
             ORDER BY id
         """)
         columns = [col[0] for col in cursor.description]
-        warehouses = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        warehouses = [
+            {c: export_json_value("warehouses", v) for c, v in zip(columns, row)}
+            for row in cursor.fetchall()
+        ]
 
     json_data = json.dumps(warehouses, default=str, indent=4)
 
@@ -527,6 +542,8 @@ def warehouses_import_json(request):
                 skipped_count += 1
                 continue
 
+    invalidate_reference_data("warehouses")
+
     create_notification(
         notification_type="warehouses_imported",
         recipient_contact=request.user.email,
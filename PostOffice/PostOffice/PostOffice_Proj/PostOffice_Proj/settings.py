@@ -150,4 +150,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # AUTH
 # ==========================================
 LOGIN_URL = "login"
-LOGIN_REDIRECT_URL = "dashboard"
\ No newline at end of file
+LOGIN_REDIRECT_URL = "dashboard"
+
+# ==========================================
+# CACHE (public tracking page, see views/deliveries.py;
+#        form dropdowns, see PostOffice_App/reference_data.py)
+# ==========================================
+# Per-process memory cache. With several workers, point this at a shared
+# backend (Memcached/Redis) so tracking invalidations reach every worker.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "postoffice",
+    }
+}
+# Seconds the warehouse/staff/client/driver/vehicle dropdown lists are
+# kept; bounds how stale they get in the workers that did not make a change
+REFERENCE_DATA_CACHE_TTL = 300
+
+# ==========================================
+# CSV BULK LOAD (PostOffice_App/bulk_load.py)
+# ==========================================
+# Error files with the rejected rows of each load
+BULK_LOAD_REJECTS_DIR = BASE_DIR / "bulk_load_rejects"
+
+# ==========================================
+# DELIVERY TRACKING PARTITIONS (manage.py maintain_tracking_partitions)
+# ==========================================
+# Monthly partitions created ahead of time
+TRACKING_PARTITIONS_AHEAD = 3
+# Months of tracking history kept online, besides the current one
+TRACKING_RETENTION_MONTHS = 24
+# Where detached months are dumped ("delivery_tracking_YYYY_MM.csv.gz")
+TRACKING_ARCHIVE_DIR = BASE_DIR / "tracking_archive"
+
+# ==========================================
+# INVOICE PDFs (PostOffice_App/invoice_pdf.py)
+# ==========================================
+# One cached "<id>_<updated_at>.pdf" per invoice
+INVOICE_PDF_CACHE_DIR = BASE_DIR / "invoice_pdf_cache"
+# Processes rendering missing PDFs in parallel (xhtml2pdf is single-threaded)
+INVOICE_PDF_WORKERS = 4
+
+# ==========================================
+# BACKGROUND JOBS (PostOffice_App/jobs.py, manage.py run_jobs)
+# ==========================================
+# Job artefacts (exports) and the uploads waiting to be imported
+JOB_FILES_DIR = BASE_DIR / "job_files"
+# Default --concurrency of run_jobs
+JOB_WORKERS = 2
+# Seconds an idle worker waits before looking at the queue again
+JOB_POLL_SECONDS = 2
+# A running job without progress for this long lost its worker: it is
+# queued again, up to JOB_MAX_ATTEMPTS attempts in total
+JOB_STALE_SECONDS = 900
+JOB_MAX_ATTEMPTS = 3
+# Finished jobs (and their files) are deleted after this many days
+JOB_RETENTION_DAYS = 7